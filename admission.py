@@ -0,0 +1,243 @@
+import contextvars
+import hmac
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+# --- Admission: Clients, Lanes & Rate Limits ---
+# Every request belongs to a client and runs in a lane: "interactive" (a
+# clinician waiting on the screen) or "bulk" (audits, batch imports). The
+# analysis executor serves the lanes by weighted fair queuing, so a flood of
+# bulk analyses queues behind itself while interactive checks keep getting
+# workers (see LaneScheduler in executor.py).
+#
+# A client is named by its API key (X-API-Key, listed in MEDIGUARD_API_KEYS as
+# "key=client:lane,...") and otherwise by its address. A keyed client runs in
+# its key's lane, though it may ask for "bulk" with X-MediGuard-Lane. Clients
+# without a key cannot choose: they run in the bulk lane on the batch endpoints
+# and in the interactive lane elsewhere. A background job runs in the lane of
+# the request that queued it (see jobs.py), and polling a job is not admitted
+# again. Only the analysis endpoints are classified; health checks, metrics
+# and the rest pass straight through.
+#
+# MEDIGUARD_RATE_LIMITS ("interactive=10/20,bulk=2/5": requests per second /
+# burst) gives each client a token bucket per lane on the analysis endpoints;
+# a client past its rate gets 429 with Retry-After. Unset, nothing is limited.
+# While the worker is still warming up in the background, the analysis
+# endpoints answer 503 with Retry-After, so no request pays the cold start.
+
+LANES = ("interactive", "bulk")
+DEFAULT_LANE = "interactive"
+
+LANE_HEADER = "x-mediguard-lane"
+API_KEY_HEADER = "x-api-key"
+
+# Endpoints that run analyses, and so are put in a lane and count against the rate limits (prefixes).
+ADMISSION_PATHS = ("/verify-prescription", "/analyze-symptoms", "/extract-from-text", "/sessions", "/jobs")
+BULK_PATHS = ("/verify-prescription/batch", "/analyze-symptoms/batch")
+# Read with GET without running an analysis: the job was admitted when it was queued.
+POLL_PATHS = ("/jobs/",)
+
+# Token buckets of clients not seen for a while are dropped beyond this many.
+MAX_BUCKETS = 10000
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if item.strip() and not sep:
+            raise ValueError(f"Expected name=value, got {item.strip()!r}")
+        if name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class RateLimit(NamedTuple):
+    rate: float  # tokens added per second
+    burst: float  # bucket size
+
+
+def parse_rate_limits(value: str) -> Dict[str, RateLimit]:
+    limits = {}
+    for lane, setting in _parse_pairs(value).items():
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane in MEDIGUARD_RATE_LIMITS: {lane!r}")
+        rate, _, burst = setting.partition("/")
+        limits[lane] = RateLimit(float(rate), float(burst or rate))
+    return limits
+
+
+def parse_api_keys(value: str) -> Dict[str, Tuple[str, str]]:
+    keys = {}
+    for key, setting in _parse_pairs(value).items():
+        client, _, lane = setting.partition(":")
+        lane = lane or DEFAULT_LANE
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane for API key of {client!r}: {lane!r}")
+        keys[key] = (client or key, lane)
+    return keys
+
+
+def parse_lane_weights(value: str) -> Dict[str, float]:
+    weights = dict.fromkeys(LANES, 1.0)
+    for lane, weight in _parse_pairs(value).items():
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane in MEDIGUARD_LANE_WEIGHTS: {lane!r}")
+        weights[lane] = max(float(weight), 0.001)
+    return weights
+
+
+RATE_LIMITS = parse_rate_limits(os.getenv("MEDIGUARD_RATE_LIMITS", ""))
+API_KEYS = parse_api_keys(os.getenv("MEDIGUARD_API_KEYS", ""))
+LANE_WEIGHTS = parse_lane_weights(os.getenv("MEDIGUARD_LANE_WEIGHTS", "interactive=8,bulk=1"))
+# Analysis workers only the interactive lane may use, so one is free the moment a clinician asks.
+INTERACTIVE_RESERVE = int(os.getenv("MEDIGUARD_INTERACTIVE_RESERVE", "1"))
+
+
+_current_lane: contextvars.ContextVar[str] = contextvars.ContextVar("mediguard_lane", default=DEFAULT_LANE)
+
+
+def current_lane() -> str:
+    """The lane of the current request; work started outside a request is interactive."""
+    return _current_lane.get()
+
+
+class TokenBucket:
+    __slots__ = ("limit", "tokens", "updated")
+
+    def __init__(self, limit: RateLimit, now: float):
+        self.limit = limit
+        self.tokens = limit.burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Takes a token; returns 0 if there was one, else the seconds until there will be."""
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.limit.rate if self.limit.rate > 0 else math.inf
+
+
+class Admission:
+    """Names the client and lane of each request and applies the per-client rate limits."""
+
+    def __init__(self, rate_limits: Dict[str, RateLimit] = RATE_LIMITS,
+                 api_keys: Dict[str, Tuple[str, str]] = API_KEYS):
+        self.rate_limits = rate_limits
+        self.api_keys = api_keys
+        # (client, lane) -> bucket, least recently used first.
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.requests: Counter = Counter()  # lane -> requests admitted
+        self.limited: Counter = Counter()  # lane -> requests refused by a rate limit
+        self.warming = 0  # requests refused while the worker was warming up
+
+    def _api_key(self, key: bytes) -> Optional[Tuple[str, str]]:
+        for candidate, entry in self.api_keys.items():
+            if hmac.compare_digest(candidate.encode(), key):
+                return entry
+        return None
+
+    def classify(self, scope) -> Tuple[Optional[str], str]:
+        """
+        The (client, lane) of a request; raises PermissionError for an unknown
+        key and ValueError for an unknown lane asked for with a key.
+        """
+        key = requested = None
+        for name, value in scope["headers"]:
+            if name == API_KEY_HEADER.encode():
+                key = value
+            elif name == LANE_HEADER.encode():
+                requested = value.decode("latin-1").strip().lower()
+        if key is None:
+            # The lane header is ignored: an anonymous client cannot pick its own priority.
+            address = scope.get("client")
+            lane = "bulk" if scope["path"].startswith(BULK_PATHS) else DEFAULT_LANE
+            return (address[0] if address else None), lane
+        entry = self._api_key(key)
+        if entry is None:
+            raise PermissionError("Unknown API key")
+        if requested is not None and requested not in LANES:
+            raise ValueError(f"Unknown lane {requested!r}; use one of: {', '.join(LANES)}")
+        client, lane = entry
+        # A keyed client may step down to the bulk lane, never up.
+        return client, "bulk" if requested == "bulk" else lane
+
+    def throttle(self, client: Optional[str], lane: str) -> float:
+        """Charges one request to the client's bucket; returns 0 if it may go ahead, else seconds to wait."""
+        limit = self.rate_limits.get(lane)
+        if limit is None:
+            return 0.0
+        now = time.monotonic()
+        key = (client or "unknown", lane)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit, now)
+            if len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+    def clients(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware putting each analysis request in its lane, and refusing clients over their rate."""
+
+    def __init__(self, app, admission: Admission, paths: Tuple[str, ...] = ADMISSION_PATHS,
+                 warming: Optional[Callable[[], bool]] = None):
+        self.app = app
+        self.admission = admission
+        self.paths = paths
+        # Whether the worker is still warming up; its analysis requests are refused until it has.
+        self.warming = warming
+
+    def admits(self, scope) -> bool:
+        """Whether the request goes through admission: an analysis endpoint, other than a job being polled."""
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            return False
+        return not (scope.get("method") == "GET" and scope["path"].startswith(POLL_PATHS))
+
+    async def __call__(self, scope, receive, send):
+        if not self.admits(scope):
+            await self.app(scope, receive, send)
+            return
+        if self.warming is not None and self.warming():
+            self.admission.warming += 1
+            response = JSONResponse(status_code=503, content={"detail": "The server is warming up, retry in 1s"},
+                                    headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        try:
+            client, lane = self.admission.classify(scope)
+        except PermissionError as e:
+            await JSONResponse(status_code=401, content={"detail": str(e)})(scope, receive, send)
+            return
+        except ValueError as e:
+            await JSONResponse(status_code=400, content={"detail": str(e)})(scope, receive, send)
+            return
+        wait = self.admission.throttle(client, lane)
+        if wait > 0:
+            self.admission.limited[lane] += 1
+            retry_after = str(math.ceil(wait)) if math.isfinite(wait) else "60"
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": f"Rate limit exceeded for the {lane} lane, retry in {retry_after}s"},
+                headers={"Retry-After": retry_after},
+            )
+            await response(scope, receive, send)
+            return
+        self.admission.requests[lane] += 1
+        token = _current_lane.set(lane)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_lane.reset(token)
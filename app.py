@@ -2,6 +2,11 @@ import streamlit as st
 import requests
 import json
 import datetime
+import hashlib
+import os
+from urllib.parse import quote
+
+from backend_client import BackendClient, ReadinessMonitor
 
 # --- Page Configuration and Styling ---
 st.set_page_config(
@@ -11,190 +16,17 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- NEW: Custom CSS for a Modern "Glassmorphism" Theme ---
-st.markdown("""
-<style>
-    /* --- General Styling & Background --- */
-    @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;700&display=swap');
-
-    body {
-        font-family: 'Roboto', sans-serif;
-    }
-
-    .stApp {
-        background: linear-gradient(135deg, #0f2027 0%, #203a43 50%, #2c5364 100%);
-        color: #FFFFFF;
-    }
-
-    /* --- Sidebar Styling --- */
-    [data-testid="stSidebar"] {
-        background-color: rgba(30, 41, 59, 0.8);
-        backdrop-filter: blur(10px);
-        -webkit-backdrop-filter: blur(10px);
-        border-right: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    /* --- Main Header (Reusing Card Style) --- */
-      .header {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        -webkit-backdrop-filter: blur(10px); /* For Safari */
-        border-radius: 15px;
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        padding: 0.8rem 1.5rem; /* Reduced padding */
-        box-shadow: 0 8px 32px 0 rgba(0, 0, 0, 0.37);
-        margin-bottom: 1.5rem; /* Reduced margin */
-        display: flex;
-        align-items: center;
-        justify-content: space-between;
-    }
-    .header-left {
-        display: flex;
-        align-items: center;
-    }
-    .header h1 {
-        margin: 0;
-        font-size: 1.8rem; /* Further Reduced font size */
-        color: #FFFFFF;
-        font-weight: 700;
-        margin-left: 15px;
-        text-shadow: 0 0 10px rgba(0, 212, 255, 0.6);
-    }
-    .header-icon {
-        font-size: 2.2rem; /* Further Reduced icon size */
-        color: #00D4FF;
-    }
-    .header-date {
-        color: #FFFFFF;
-        font-weight: bold;
-        font-size: 0.9rem; /* Further Reduced font size */
-    }
-    
-    .page-title {
-        text-align: center;
-        margin-bottom: 0.5rem; /* Further reduced margin */
-    }
-    .page-title h2 {
-        font-size: 2rem; /* Further Reduced font size */
-        font-weight: 700;
-        text-shadow: 0 0 15px rgba(0, 212, 255, 0.7);
-        margin-bottom: 0.3rem; /* Reduced margin */
-    }
-    .page-title p {
-        font-size: 0.9rem; /* Further Reduced font size */
-        color: #e0e0e0;
-        margin-top: 0;
-    }
+# --- Custom CSS for a Modern "Glassmorphism" Theme ---
+# The stylesheet is read once per process. Fragment reruns (see the analyzer
+# and history pages) re-send neither it nor the header.
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
 
+@st.cache_resource
+def page_style():
+    with open(os.path.join(ASSETS_DIR, "style.css"), encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
 
-    
-    .card {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        -webkit-backdrop-filter: blur(10px); /* For Safari */
-        border-radius: 15px;
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        padding: 25px;
-        box-shadow: 0 8px 32px 0 rgba(0, 0, 0, 0.37);
-        margin-bottom: 20px;
-    }
-
-    /* --- Typography --- */
-    h1, h2, h3, h4, h5, h6 {
-        color: #FFFFFF;
-    }
-    h2, h3 {
-        color: #FFFFFF;
-        text-shadow: 0 0 8px rgba(0, 212, 255, 0.5);
-        border-bottom: 1px solid #00D4FF;
-        padding-bottom: 10px;
-    }
-    
-    /* --- Input Widget Styling --- */
-    label {
-        color: #FFFFFF !important;
-        font-weight: bold;
-    }
-    
-    .stTextInput input, .stNumberInput input, .stSelectbox div[data-baseweb="select"] > div, .stTextArea textarea, .stMultiSelect div[data-baseweb="select"] > div {
-        background-color: rgba(0, 0, 0, 0.3);
-        color: #FFFFFF;
-        border: 1px solid #00D4FF;
-        border-radius: 8px;
-    }
-    .stTextInput input:focus, .stNumberInput input:focus, .stSelectbox div[data-baseweb="select"] > div:focus-within, .stTextArea textarea:focus, .stMultiSelect div[data-baseweb="select"] > div:focus-within {
-        border-color: #FFFFFF;
-        box-shadow: 0 0 8px rgba(0, 212, 255, 0.5);
-    }
-
-    /* --- Radio Button Styling --- */
-    .stRadio [role="radiogroup"] {
-        display: flex;
-        flex-direction: row;
-        justify-content: flex-start;
-        gap: 10px;
-    }
-    .stRadio label {
-        flex: 1;
-        text-align: center;
-        padding: 8px 15px;
-        background: rgba(0, 0, 0, 0.3);
-        border: 1px solid #00D4FF;
-        border-radius: 8px; /* Changed from 20px for a more official look */
-        cursor: pointer;
-        transition: all 0.2s ease-in-out;
-    }
-    .stRadio label:hover {
-        background: rgba(0, 212, 255, 0.3);
-    }
-
-    /* --- Button Styling --- */
-    div.stButton > button:first-child {
-        background: linear-gradient(to right, #00c6ff, #0072ff);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 12px 25px;
-        font-size: 16px;
-        font-weight: bold;
-        box-shadow: 0 4px 15px rgba(0, 114, 255, 0.4);
-        transition: all 0.3s ease;
-    }
-    div.stButton > button:first-child:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 6px 20px rgba(0, 114, 255, 0.6);
-    }
-    
-    /* --- Patient Header & Expanders --- */
-    .patient-detail-box {
-        background: rgba(0, 212, 255, 0.1);
-        border-left: 5px solid #00D4FF;
-        padding: 12px;
-        border-radius: 8px;
-        font-size: 15px;
-        height: 100%;
-    }
-
-    .streamlit-expanderHeader {
-        background-color: rgba(0, 212, 255, 0.2);
-        color: #FFFFFF;
-        border-radius: 8px !important;
-    }
-    .streamlit-expanderContent {
-        background-color: rgba(255, 255, 255, 0.05);
-        border-radius: 8px;
-    }
-
-    /* --- NEW: Footer Styling --- */
-    .footer {
-        text-align: center;
-        padding-top: 2rem;
-        padding-bottom: 1rem;
-        color: rgba(255, 255, 255, 0.7);
-        font-size: 0.9rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(page_style(), unsafe_allow_html=True)
 
 
 # --- Header & Tools ---
@@ -217,57 +49,199 @@ display_header()
 
 # --- Backend API URL ---
 BACKEND_URL = "http://127.0.0.1:8000"
+# Identifies the app to the backend's admission control (see MEDIGUARD_API_KEYS there).
+BACKEND_API_KEY = os.getenv("MEDIGUARD_API_KEY")
+
+# --- Shared HTTP Client ---
+# Cached per process, so every session and rerun shares one connection pool.
+@st.cache_resource
+def get_backend_client():
+    return BackendClient(BACKEND_URL, headers={"X-API-Key": BACKEND_API_KEY} if BACKEND_API_KEY else None)
+
+backend = get_backend_client()
+
+# --- Background Analysis Jobs ---
+# Prescription analyses run as backend jobs. The job id is kept in the URL, so
+# after a browser refresh the running (or finished) analysis is picked up again.
+# Jobs are kept in the backend's durable queue, so this also works after a
+# backend restart or when the refresh reaches another worker process. Each
+# analysis is a job on the patient's prescription session, so re-analysing
+# after an edit only checks the drugs (and drug pairs) that changed; if the
+# session has expired, the backend starts a new one.
+JOB_WAIT_SECONDS = 10
+
+def submit_analysis_job(patient, drugs):
+    payload = {"session": st.session_state.get('analysis_session'), "patient": patient, "drugs": drugs}
+    response = backend.post("/jobs", json={"kind": "session", "payload": payload})
+    if response.status_code != 202:
+        raise RuntimeError(f"API Error: Could not queue the analysis (Status code: {response.status_code}). {response.text}")
+    job = response.json()
+    st.session_state.analysis_session = job["session"]
+    return job["id"]
+
+def fetch_job(job_id, wait=0, sections=0):
+    """
+    Returns the job, or None if it is unknown or expired. With `wait`, the
+    backend holds the request until the job finishes or has more than
+    `sections` report sections.
+    """
+    response = backend.get(f"/jobs/{job_id}", params={"wait": wait, "sections": sections}, timeout=(3.05, wait + 10))
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: Could not fetch the analysis (Status code: {response.status_code}). {response.text}")
+    return response.json()
+
+def clear_analysis_job():
+    st.session_state.pop('analysis_result', None)
+    st.session_state.pop('analysis_job', None)
+    st.query_params.pop("job", None)
 
 # --- Initialize Session State ---
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
-if 'analysis_history' not in st.session_state:
-    st.session_state.analysis_history = []
+    job_id = st.query_params.get("job")
+    if job_id:
+        try:
+            job = fetch_job(job_id)
+        except Exception:
+            job = None
+        if job is not None and job['kind'] in ('prescription', 'session'):
+            st.session_state.patient_details = job['payload']['patient']
+            st.session_state.drugs = [{"name": d['name'], "dosage": d['dosage']} for d in job['payload']['drugs']]
+            st.session_state.analysis_job = job_id
+            if job['payload'].get('session'):
+                st.session_state.analysis_session = job['payload']['session']
+            st.session_state.page = 'analyzer'
+        else:
+            st.query_params.pop("job", None)
 
 # --- NEW: Backend Status Check ---
-@st.cache_data(ttl=30) # Cache the status for 30 seconds
+# The readiness monitor polls the backend in the background (see
+# backend_client.py); the sidebar panel re-reads its last answer every few
+# seconds without waiting for the backend.
+STATUS_REFRESH_SECONDS = 5
+
+@st.cache_resource
+def get_readiness_monitor():
+    return ReadinessMonitor(backend)
+
 def check_backend_status():
-    """Pings the backend to check for connectivity."""
-    try:
-        # A simple GET request to the root or a dedicated health-check endpoint
-        response = requests.get(f"{BACKEND_URL}/", timeout=3)
-        if response.status_code == 200:
-            return "🟢 Connected"
-        else:
-            return f"🟡 Status: {response.status_code}"
-    except requests.exceptions.ConnectionError:
+    """The backend status from the last readiness poll."""
+    status = get_readiness_monitor().status
+    if status.state == "ready":
+        return "🟢 Connected"
+    if status.state == "warming":
+        components = status.components or {}
+        done = sum(1 for c in components.values() if c.get("state") in ("ready", "skipped") or not c.get("required"))
+        return f"🟡 Warming up ({done}/{len(components)} ready)"
+    if status.state == "error":
+        return f"🟡 Status: {status.status_code}"
+    if status.state == "disconnected":
         return "🔴 Disconnected"
-    except requests.exceptions.Timeout:
+    if status.state == "timeout":
         return "🔴 Timeout"
+    return "⚪ Checking..."
 
-# --- Sidebar Navigation ---
-with st.sidebar:
-    st.title("Main Menu")
+@st.fragment(run_every=STATUS_REFRESH_SECONDS)
+def backend_status_panel():
     backend_status = check_backend_status()
     st.markdown(f"Backend Status: **{backend_status}**")
     if "🔴" in backend_status:
         st.warning("The backend is not reachable. Please start the FastAPI server.")
-    st.markdown("---")
 
-    if st.button("🏠 Home / New Analysis", use_container_width=True):
-        keys_to_clear = ['patient_details', 'drugs', 'analysis_result']
-        for key in keys_to_clear:
-            if key in st.session_state:
-                del st.session_state[key]
-        st.session_state.page = 'home'
-        st.rerun()
+# --- Memoised Text Extraction ---
+# Keyed on a digest of the text (the leading underscore keeps Streamlit from
+# hashing the text itself), so each distinct prescription text is sent to the
+# backend once and reused across reruns and sessions. Failed calls raise and
+# are therefore never cached.
+@st.cache_data(max_entries=256, ttl=3600, show_spinner=False)
+def extract_drugs_from_text(text_digest, _prescription_text):
+    response = backend.post("/extract-from-text", json={"prescription_text": _prescription_text})
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to extract info: {response.text}")
+    return response.json()
+
+# --- Drug Name Suggestions ---
+@st.cache_data(ttl=3600, max_entries=2048, show_spinner=False)
+def suggest_drug_names(query):
+    response = backend.get("/drugs/suggest", params={"q": query, "limit": 3})
+    if response.status_code != 200:
+        return []
+    return response.json().get("suggestions", [])
+
+def apply_drug_suggestion(index, name):
+    """Button callback: replaces the typed drug name with the chosen suggestion."""
+    st.session_state.drugs[index]['name'] = name
+    # Dropping the widget state lets the input pick up the new default value.
+    del st.session_state[f"name_{index}"]
+
+# --- Manual Drug Entry ---
+# The drug list is a fragment, and each row a fragment inside it: typing in a
+# row reruns only that row, and adding or removing a row reruns only the list.
+# The rest of the page runs again only when the prescription is analysed.
+def add_drug_row():
+    st.session_state.drugs.append({"name": "", "dosage": ""})
+
+def remove_drug_row(index):
+    st.session_state.drugs.pop(index)
+    # The rows below move up; dropping their widget state lets them show their new values.
+    for i in range(index, len(st.session_state.drugs) + 1):
+        st.session_state.pop(f"name_{i}", None)
+        st.session_state.pop(f"dosage_{i}", None)
+
+@st.fragment
+def drug_row(i):
+    if i >= len(st.session_state.drugs):
+        return  # removed since this row was last drawn
+    drug = st.session_state.drugs[i]
+    row = st.columns([2, 1])
+    drug['name'] = row[0].text_input(f"Drug Name {i+1}", drug['name'], key=f"name_{i}", label_visibility="collapsed", placeholder="Drug Name")
+    drug['dosage'] = row[1].text_input(f"Dosage {i+1}", drug['dosage'], key=f"dosage_{i}", label_visibility="collapsed", placeholder="Dosage (e.g., 10mg)")
+    typed_name = drug['name'].strip()
+    if typed_name:
+        try:
+            suggestions = suggest_drug_names(typed_name.lower())
+        except requests.exceptions.RequestException:
+            suggestions = []
+        if suggestions and all(sug['name'].lower() != typed_name.lower() for sug in suggestions):
+            hint_cols = st.columns([2] + [2] * len(suggestions) + [4 - len(suggestions)])
+            hint_cols[0].caption("Did you mean:")
+            for j, sug in enumerate(suggestions):
+                hint_cols[j + 1].button(sug['name'], key=f"sug_{i}_{j}", on_click=apply_drug_suggestion,
+                                        args=(i, sug['name']), help=f"Canonical name: {sug['canonical']}")
+
+@st.fragment
+def drug_list_editor():
+    for i in range(len(st.session_state.drugs)):
+        row = st.columns([6, 1])
+        with row[0]:
+            drug_row(i)
+        row[1].button("➖", key=f"del_{i}", help="Remove drug", on_click=remove_drug_row, args=(i,))
+    st.button("➕ Add another drug", key="add_drug", on_click=add_drug_row)
 
-    if st.button("📜 Analysis History", use_container_width=True):
-        st.session_state.page = 'history'
-        st.rerun()
-        
-    if st.button("💊 Drug Database", use_container_width=True):
-        st.session_state.page = 'database'
-        st.rerun()
-        
-    if st.button("🩺 Symptom Checker", use_container_width=True):
-        st.session_state.page = 'symptoms'
-        st.rerun()
+# --- Sidebar Navigation ---
+def go_to_page(page):
+    st.session_state.page = page
+
+def start_new_analysis():
+    keys_to_clear = ['patient_details', 'drugs', 'analysis_result', 'analysis_job', 'analysis_session', 'extracted_data']
+    for key in keys_to_clear:
+        if key in st.session_state:
+            del st.session_state[key]
+    st.query_params.pop("job", None)
+    st.session_state.page = 'home'
+
+with st.sidebar:
+    st.title("Main Menu")
+    backend_status_panel()
+    st.markdown("---")
+
+    # Callbacks run before the rerun the click triggers, so navigating takes one run instead of two.
+    st.button("🏠 Home / New Analysis", use_container_width=True, on_click=start_new_analysis)
+    st.button("📜 Analysis History", use_container_width=True, on_click=go_to_page, args=('history',))
+    st.button("💊 Drug Database", use_container_width=True, on_click=go_to_page, args=('database',))
+    st.button("🩺 Symptom Checker", use_container_width=True, on_click=go_to_page, args=('symptoms',))
 
     st.markdown("---")
     st.info("This is a demonstration tool for medical professionals. Always verify results.")
@@ -333,84 +307,150 @@ def prescription_analyzer_page():
     if 'drugs' not in st.session_state: st.session_state.drugs = [{"name": "", "dosage": ""}]
 
     if input_method == 'Enter Drugs Manually':
-        for i, drug in enumerate(st.session_state.drugs):
-            row = st.columns([4, 2, 1])
-            st.session_state.drugs[i]['name'] = row[0].text_input(f"Drug Name {i+1}", drug['name'], key=f"name_{i}", label_visibility="collapsed", placeholder="Drug Name")
-            st.session_state.drugs[i]['dosage'] = row[1].text_input(f"Dosage {i+1}", drug['dosage'], key=f"dosage_{i}", label_visibility="collapsed", placeholder="Dosage (e.g., 10mg)")
-            if row[2].button("➖", key=f"del_{i}", help="Remove drug"):
-                st.session_state.drugs.pop(i)
-                st.rerun()
-        if st.button("➕ Add another drug", key="add_drug"):
-            st.session_state.drugs.append({"name": "", "dosage": ""})
-            st.rerun()
+        drug_list_editor()
         drugs_payload = [d for d in st.session_state.drugs if d['name'] and d['dosage']]
     else:
-        prescription_text = st.text_area("Paste prescription text", height=150, placeholder="e.g., Take Lisinopril 10mg once daily...")
-        if prescription_text:
-            try:
-                nlp_response = requests.post(f"{BACKEND_URL}/extract-from-text", json={"prescription_text": prescription_text})
-                if nlp_response.status_code == 200:
-                    extracted_data = nlp_response.json()
-                    st.success("Successfully extracted drug information:")
-                    st.json(extracted_data)
-                    drugs_payload = extracted_data.get("drugs", [])
-                else: st.error(f"Failed to extract info: {nlp_response.text}")
-            except requests.exceptions.ConnectionError:
-                st.error("Connection Error: Could not connect to the FastAPI backend. Please ensure the backend server is running.")
-            except Exception as e: st.error(f"An error occurred: {e}")
+        # A form keeps typing from rerunning the script; extraction only runs on submit.
+        with st.form("extract_form", border=False):
+            prescription_text = st.text_area("Paste prescription text", height=150, placeholder="e.g., Take Lisinopril 10mg once daily...")
+            extract_clicked = st.form_submit_button("🔍 Extract Drugs")
+        if extract_clicked:
+            if prescription_text.strip():
+                text_digest = hashlib.sha256(prescription_text.encode("utf-8")).hexdigest()
+                try:
+                    with st.spinner("Extracting drug information..."):
+                        st.session_state.extracted_data = extract_drugs_from_text(text_digest, prescription_text)
+                except requests.exceptions.ConnectionError:
+                    st.error("Connection Error: Could not connect to the FastAPI backend. Please ensure the backend server is running.")
+                except requests.exceptions.Timeout:
+                    st.error("Timeout: The backend took too long to extract the drug information. Please try again.")
+                except Exception as e: st.error(f"An error occurred: {e}")
+            else:
+                st.warning("Please paste the prescription text first.")
+        extracted_data = st.session_state.get('extracted_data')
+        if extracted_data is not None:
+            st.success("Successfully extracted drug information:")
+            st.json(extracted_data)
+            drugs_payload = extracted_data.get("drugs", [])
 
     btn_col1, btn_col2, btn_col3 = st.columns([2, 3, 2])
     if btn_col2.button("Analyze Prescription", type="primary", use_container_width=True):
         if not drugs_payload:
             st.warning("Please enter at least one drug to analyze.")
         else:
-            with st.spinner("🤖 AI is analyzing the prescription..."):
-                payload = {"patient": patient, "drugs": drugs_payload}
-                try:
-                    response = requests.post(f"{BACKEND_URL}/verify-prescription", json=payload)
-                    if response.status_code == 200:
-                        st.session_state.analysis_result = response.json()
-                        history_entry = {
-                            "patient": patient,
-                            "drugs": drugs_payload,
-                            "result": st.session_state.analysis_result,
-                            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        st.session_state.analysis_history.insert(0, history_entry)
-                        # We will not rerun here; the script will continue and show the dialog
-                    else: st.error(f"Error from API: {response.status_code} - {response.text}")
-                except requests.exceptions.ConnectionError:
-                    st.error("Connection Error: Could not connect to the FastAPI backend. Please ensure the backend server is running and accessible.")
-                except Exception as e: st.error(f"An unexpected error occurred: {e}")
+            # The analysis runs as a backend job; the report dialog waits for it.
+            try:
+                job_id = submit_analysis_job(patient, drugs_payload)
+            except requests.exceptions.ConnectionError:
+                st.error("Connection Error: Could not connect to the FastAPI backend. Please ensure the backend server is running and accessible.")
+            except Exception as e:
+                st.error(f"An unexpected error occurred: {e}")
+            else:
+                st.session_state.analysis_job = job_id
+                st.query_params["job"] = job_id
+                st.session_state.pop('analysis_result', None)
 
     # --- NEW: Display the analysis result in a pop-up dialog ---
-    if 'analysis_result' in st.session_state:
+    if 'analysis_result' in st.session_state or 'analysis_job' in st.session_state:
         @st.dialog("🔬 Analysis Report")
         def display_report_dialog():
-            result = st.session_state.analysis_result
-            st.subheader("AI Verification Complete")
+            result = st.session_state.get('analysis_result')
+            st.subheader("AI Verification in Progress..." if result is None else "AI Verification Complete")
             st.markdown("---")
-            
+
+            slots = {}
             with st.expander("⚠️ **Drug-Drug Interactions**", expanded=True):
-                st.markdown(result.get("interaction_analysis", "No interaction analysis available."))
-            
+                slots["interaction_analysis"] = st.empty()
             with st.expander("🩺 **Dosage Recommendations**", expanded=True):
-                st.markdown(result.get("dosage_recommendations", "No dosage recommendations available."))
-            
+                slots["dosage_recommendations"] = st.empty()
             with st.expander("💡 **Alternative Suggestions**", expanded=True):
-                st.markdown(result.get("alternative_suggestions", "No alternative suggestions available."))
+                slots["alternative_suggestions"] = st.empty()
+            fallbacks = {
+                "interaction_analysis": "No interaction analysis available.",
+                "dosage_recommendations": "No dosage recommendations available.",
+                "alternative_suggestions": "No alternative suggestions available.",
+            }
 
             st.markdown("---")
+            # Rendered before polling starts, so the report can be closed while the job runs.
             if st.button("Close Report", use_container_width=True, type="primary"):
                 # Clean up the state and rerun to close the dialog
-                del st.session_state['analysis_result']
+                clear_analysis_job()
                 st.rerun()
 
+            if result is None:
+                for slot in slots.values():
+                    slot.markdown("_🤖 AI is analyzing..._")
+                status = st.empty()
+                partial, seen = {}, 0
+                try:
+                    # Long polling: each request returns as soon as the job finishes a section,
+                    # and the sections are shown as they arrive.
+                    while True:
+                        job = fetch_job(st.session_state.analysis_job, wait=JOB_WAIT_SECONDS, sections=seen)
+                        if job is None:
+                            st.error("This analysis has expired or no longer exists. Please run it again.")
+                            clear_analysis_job()
+                            return
+                        if job['status'] == 'failed':
+                            st.error(f"The analysis failed: {job.get('error', 'unknown error')}")
+                            clear_analysis_job()
+                            return
+                        if job['status'] == 'done':
+                            break
+                        sections = job.get('sections', [])
+                        for section in sections[seen:]:
+                            for key, value in section.items():
+                                partial[key] = partial[key] + value if isinstance(value, str) and key in partial else value
+                                if key in slots:
+                                    slots[key].markdown(partial[key])
+                        seen = len(sections)
+                        status.caption(f"Analysis job {job['status']}...")
+                except requests.exceptions.ConnectionError:
+                    st.error("Connection Error: Could not connect to the FastAPI backend. Please ensure the backend server is running and accessible.")
+                    return
+                except Exception as e:
+                    st.error(f"An unexpected error occurred: {e}")
+                    return
+                status.empty()
+                # The backend records the finished analysis in the history store.
+                result = st.session_state.analysis_result = job['result']
+
+            for key, slot in slots.items():
+                slot.markdown(result.get(key, fallbacks[key]))
+
         # Call the function to render the dialog
         display_report_dialog()
 
 
 # --- Page 3: Analysis History ---
+# History is stored by the backend. The page fetches one page of entry
+# summaries at a time, and an entry's report only when its expander is opened.
+HISTORY_PAGE_SIZE = 10
+
+def fetch_history_page(cursor, patient, since, until):
+    params = {"limit": HISTORY_PAGE_SIZE}
+    if cursor is not None:
+        params["cursor"] = cursor
+    if patient:
+        params["patient"] = patient
+    if since:
+        params["since"] = since.isoformat()
+    if until:
+        params["until"] = until.isoformat()
+    response = backend.get("/history", params=params)
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: Failed to fetch history (Status code: {response.status_code}). {response.text}")
+    return response.json()
+
+# Entries never change once recorded, so their reports can be cached.
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_history_entry(entry_id):
+    response = backend.get(f"/history/{entry_id}")
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: Failed to fetch the report (Status code: {response.status_code}). {response.text}")
+    return response.json()
+
 def analysis_history_page():
     # --- NEW: Confirmation Dialog Logic ---
     if 'show_clear_confirm' not in st.session_state:
@@ -421,7 +461,12 @@ def analysis_history_page():
         st.error("Are you sure you want to permanently delete the entire analysis history? This action cannot be undone.")
         btn_cols = st.columns([1, 1])
         if btn_cols[0].button("Yes, Delete Everything", use_container_width=True, type="primary"):
-            st.session_state.analysis_history = []
+            try:
+                backend.delete("/history")
+            except requests.exceptions.RequestException as e:
+                st.error(f"Network Error: Could not clear the history. Details: {e}")
+                return
+            st.session_state.history_cursors = [None]
             st.session_state.show_clear_confirm = False
             st.rerun()
         if btn_cols[1].button("Cancel", use_container_width=True):
@@ -431,122 +476,240 @@ def analysis_history_page():
     if st.session_state.show_clear_confirm:
         confirm_clear_dialog()
 
+    history_browser()
+
+def show_newer_history():
+    st.session_state.history_cursors.pop()
+
+def show_older_history(cursor):
+    st.session_state.history_cursors.append(cursor)
+
+# The list is a fragment, so filtering and paging rerun only the list, and each
+# entry a fragment inside it, so opening one entry reruns only that entry.
+@st.fragment
+def history_browser():
     # --- MODIFIED: Header with Clear Button ---
     header_cols = st.columns([5, 1])
     with header_cols[0]:
         st.header("📜 Analysis History")
+
+    filter_cols = st.columns([2, 1, 1])
+    patient = filter_cols[0].text_input("Patient name", placeholder="Filter by patient name")
+    since = filter_cols[1].date_input("From", value=None)
+    until = filter_cols[2].date_input("To", value=None)
+
+    # Cursors of the pages visited so far; the last one is the page shown.
+    filters = (patient.strip(), since, until)
+    if st.session_state.get('history_filters') != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
+    try:
+        data = fetch_history_page(cursors[-1], *filters)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Network Error: Could not load the analysis history. Please ensure the backend is running. Details: {e}")
+        return
+    except Exception as e:
+        st.error(str(e))
+        return
+
     with header_cols[1]:
         # Only show the clear button if there's history to clear
-        if st.session_state.analysis_history:
+        if data['entries'] or len(cursors) > 1:
             if st.button("🗑️ Clear", help="Delete all history entries", use_container_width=True):
                 st.session_state.show_clear_confirm = True
                 st.rerun()
 
-    if not st.session_state.analysis_history:
-        st.info("No analyses have been performed yet.")
+    if not data['entries']:
+        st.info("No matching analyses found." if any(filters) else "No analyses have been performed yet.")
         return
 
     # --- MODIFIED: Loop with more compact display ---
-    for i, entry in enumerate(st.session_state.analysis_history):
-        # Use a more compact title for the expander
-        expander_title = f"{entry['patient']['name']} - {entry['timestamp']}"
-        with st.expander(expander_title):
-            # Using st.caption for smaller, less emphasized text for patient details
-            st.caption(f"**Patient:** {entry['patient']['name']} | **Age:** {entry['patient']['age']} | **Gender:** {entry['patient']['gender']}")
-            
-            st.caption("**Prescribed Drugs:**")
-            for drug in entry['drugs']:
-                st.caption(f"- {drug['name']} ({drug['dosage']})")
-            
-            st.markdown("---")
-            st.markdown("##### Full AI Report")
-            st.info(f"**Interaction Analysis:**\n{entry['result'].get('interaction_analysis', 'N/A')}")
-            st.success(f"**Dosage Recommendations:**\n{entry['result'].get('dosage_recommendations', 'N/A')}")
-            st.warning(f"**Alternative Suggestions:**\n{entry['result'].get('alternative_suggestions', 'N/A')}")
-
+    for entry in data['entries']:
+        history_entry(entry)
+
+    nav_cols = st.columns([1, 3, 1])
+    if len(cursors) > 1:
+        nav_cols[0].button("⬅️ Newer", use_container_width=True, on_click=show_newer_history)
+    if data['next_cursor'] is not None:
+        nav_cols[2].button("Older ➡️", use_container_width=True, on_click=show_older_history, args=(data['next_cursor'],))
+
+@st.fragment
+def history_entry(entry):
+    # Use a more compact title for the expander
+    expander_title = f"{entry['patient']['name']} - {entry['timestamp'].replace('T', ' ')}"
+    expander = st.expander(expander_title, key=f"history_{entry['id']}", on_change="rerun")
+    with expander:
+        # Using st.caption for smaller, less emphasized text for patient details
+        st.caption(f"**Patient:** {entry['patient']['name']} | **Age:** {entry['patient']['age']} | **Gender:** {entry['patient']['gender']}")
+
+        st.caption("**Prescribed Drugs:**")
+        for drug in entry['drugs']:
+            st.caption(f"- {drug['name']} ({drug['dosage']})")
+
+        if not expander.open:
+            return
+        try:
+            result = fetch_history_entry(entry['id'])['result']
+        except Exception as e:
+            st.error(f"Could not load the report: {e}")
+            return
+        st.markdown("---")
+        st.markdown("##### Full AI Report")
+        st.info(f"**Interaction Analysis:**\n{result.get('interaction_analysis', 'N/A')}")
+        st.success(f"**Dosage Recommendations:**\n{result.get('dosage_recommendations', 'N/A')}")
+        st.warning(f"**Alternative Suggestions:**\n{result.get('alternative_suggestions', 'N/A')}")
+
+
+# --- Page 4: Drug Database (Offline openFDA Mirror) ---
+DRUG_SEARCH_PAGE_SIZE = 5
+
+@st.cache_data(ttl=300, max_entries=512, show_spinner=False)
+def search_drug_labels(query, page):
+    response = backend.get("/drugs/search", params={"q": query, "page": page, "page_size": DRUG_SEARCH_PAGE_SIZE})
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: Failed to fetch data (Status code: {response.status_code}). {response.text}")
+    return response.json()
+
+# Used when the offline mirror is missing or has no match. The backend caches
+# these lookups for everyone, so this only keeps a session from asking twice.
+@st.cache_data(ttl=300, max_entries=512, show_spinner=False)
+def fetch_live_label(name):
+    response = backend.get(f"/drugs/label/{quote(name, safe='')}", timeout=(3.05, 20))
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise RuntimeError(f"API Error: Failed to fetch the openFDA label (Status code: {response.status_code}). {response.text}")
+    return response.json()['label'], response.headers.get('X-Cache') == 'stale'
+
+def show_label_sections(drug_info):
+    st.markdown("##### 📋 Indications & Usage")
+    st.markdown(drug_info.get('indications_and_usage') or 'Not available.')
+
+    st.markdown("##### Dosage & Administration")
+    st.markdown(drug_info.get('dosage_and_administration') or 'Not available.')
+
+    st.markdown("##### ⚠️ Warnings and Precautions")
+    st.warning(drug_info.get('warnings_and_cautions') or 'Not available.')
+
+    st.markdown("##### ❗ Adverse Reactions (Side Effects)")
+    st.info(drug_info.get('adverse_reactions') or 'Not available.')
+
+    st.markdown("##### ❌ Contraindications")
+    st.error(drug_info.get('contraindications') or 'Not available.')
+
+def show_live_label(query):
+    with st.spinner(f"Looking {query} up on openFDA..."):
+        try:
+            live = fetch_live_label(query)
+        except requests.exceptions.RequestException as e:
+            st.error(f"Network Error: Could not connect to the backend. Please ensure it's running. Details: {e}")
+            return
+        except Exception as e:
+            st.error(str(e))
+            return
+    if live is None:
+        st.warning(f"No drug found matching '{query}'. Please check the spelling.")
+        return
+    drug_info, stale = live
+    st.caption(f"Current openFDA label for '{query}'" + (" (openFDA is unreachable, showing an older copy)" if stale else ""))
+    with st.expander(f"{drug_info.get('brand_name') or 'N/A'} ({drug_info.get('generic_name') or 'N/A'})", expanded=True):
+        show_label_sections(drug_info)
 
-# --- Page 4: Drug Database (Live API) ---
 def drug_database_page():
     st.header("💊 Drug Database Search")
-    drug_name = st.text_input("Enter Drug Name to Search", placeholder="e.g., Lipitor")
+    drug_name = st.text_input("Enter Drug Name to Search", placeholder="e.g., Lipitor, warfarin, lactic acidosis")
     
     if st.button("Search Drug", use_container_width=True):
         if drug_name:
-            with st.spinner(f"Searching for {drug_name}..."):
-                try:
-                    # Using the OpenFDA API to search for the drug by brand name
-                    api_url = f'https://api.fda.gov/drug/label.json?search=openfda.brand_name:"{drug_name}"&limit=1'
-                    response = requests.get(api_url)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        if 'results' in data and len(data['results']) > 0:
-                            drug_info = data['results'][0]
-                            
-                            # Safely get brand and generic names
-                            brand_name = drug_info.get('openfda', {}).get('brand_name', ['N/A'])[0]
-                            generic_name = drug_info.get('openfda', {}).get('generic_name', ['N/A'])[0]
-                            st.subheader(f"Displaying Information for: {brand_name} ({generic_name})")
-
-                            # Display key information from the API response
-                            with st.expander("📋 Indications & Usage", expanded=True):
-                                indications = drug_info.get('indications_and_usage', ['Not available.'])[0]
-                                st.markdown(indications)
-
-                            with st.expander("Dosage & Administration", expanded=False):
-                                dosage = drug_info.get('dosage_and_administration', ['Not available.'])[0]
-                                st.markdown(dosage)
-                            
-                            with st.expander("⚠️ Warnings and Precautions", expanded=False):
-                                warnings = drug_info.get('warnings_and_cautions', ['Not available.'])[0]
-                                st.warning(warnings)
-
-                            with st.expander("❗ Adverse Reactions (Side Effects)", expanded=False):
-                                reactions = drug_info.get('adverse_reactions', ['Not available.'])[0]
-                                st.info(reactions)
-
-                            with st.expander("❌ Contraindications", expanded=False):
-                                contra = drug_info.get('contraindications', ['Not available.'])[0]
-                                st.error(contra)
-
-                        else:
-                            st.warning(f"No drug found with the name '{drug_name}'. Please check the spelling.")
-                    else:
-                        st.error(f"API Error: Failed to fetch data (Status code: {response.status_code}).")
-
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Network Error: Could not connect to the drug database. Please check your connection. Details: {e}")
+            st.session_state.drug_query = drug_name
+            st.session_state.drug_page = 1
         else:
             st.warning("Please enter a drug name to search.")
+
+    query = st.session_state.get('drug_query')
+    if not query:
+        return
+    page = st.session_state.get('drug_page', 1)
+
+    with st.spinner(f"Searching for {query}..."):
+        try:
+            data = search_drug_labels(query, page)
+        except requests.exceptions.RequestException as e:
+            st.error(f"Network Error: Could not connect to the backend drug database. Please ensure it's running. Details: {e}")
+            return
+        except Exception:
+            # The offline mirror is unavailable (e.g. not built on this backend); look the name up live instead.
+            data = {'results': []}
+
+    if not data['results']:
+        show_live_label(query)
+        return
+
+    page_count = (data['total'] + DRUG_SEARCH_PAGE_SIZE - 1) // DRUG_SEARCH_PAGE_SIZE
+    st.caption(f"{data['total']} label(s) found for '{query}' — page {page} of {page_count}")
+
+    for i, drug_info in enumerate(data['results']):
+        brand_name = drug_info.get('brand_name') or 'N/A'
+        generic_name = drug_info.get('generic_name') or 'N/A'
+        with st.expander(f"{brand_name} ({generic_name})", expanded=(i == 0)):
+            if drug_info.get('snippet'):
+                st.caption(drug_info['snippet'])
+            show_label_sections(drug_info)
+
+    nav_cols = st.columns([1, 3, 1])
+    if page > 1 and nav_cols[0].button("⬅️ Previous", use_container_width=True):
+        st.session_state.drug_page = page - 1
+        st.rerun()
+    if page < page_count and nav_cols[2].button("Next ➡️", use_container_width=True):
+        st.session_state.drug_page = page + 1
+        st.rerun()
             
 
 # --- Page 5: Symptom Checker (Live AI Analysis) ---
+DEFAULT_SYMPTOMS = ["Fever", "Cough", "Headache", "Sore Throat", "Fatigue", "Nausea", "Dizziness", "Shortness of breath", "Body aches", "Chills"]
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def symptom_options():
+    """The backend's symptom vocabulary, or a short default list if it is unreachable."""
+    try:
+        response = backend.get("/symptoms")
+    except requests.exceptions.RequestException:
+        return DEFAULT_SYMPTOMS
+    if response.status_code != 200:
+        return DEFAULT_SYMPTOMS
+    return sorted(symptom.capitalize() for symptom in response.json().get("symptoms", [])) or DEFAULT_SYMPTOMS
+
+def stream_symptom_report(symptoms):
+    """Yields the symptom report section by section from the streaming endpoint."""
+    for event, data in backend.stream_events("/analyze-symptoms/stream", json={"symptoms": symptoms}):
+        if event == "error":
+            raise RuntimeError(data.get("detail", "Analysis failed."))
+        if event == "section":
+            yield data.get("report", "")
+
 def symptom_checker_page():
     st.header("🩺 AI-Powered Symptom Checker")
     st.info("This tool provides an AI-generated analysis of symptoms for informational purposes. It is not a substitute for a professional medical diagnosis.")
     
     symptoms = st.multiselect(
         "Select your symptoms from the list below",
-        ["Fever", "Cough", "Headache", "Sore Throat", "Fatigue", "Nausea", "Dizziness", "Shortness of breath", "Body aches", "Chills"]
+        symptom_options()
     )
     
     if st.button("Analyze Symptoms", use_container_width=True):
         if symptoms:
-            with st.spinner("🧑‍⚕️ AI is analyzing your symptoms..."):
-                try:
-                    # New endpoint in the backend for symptom analysis
-                    response = requests.post(f"{BACKEND_URL}/analyze-symptoms", json={"symptoms": symptoms})
-
-                    if response.status_code == 200:
-                        analysis = response.json()
-                        st.subheader("AI-Powered Symptom Analysis")
-                        st.markdown(analysis.get("report", "No analysis available from the AI."))
-                        
-                    else:
-                        st.error(f"Error from API: {response.status_code} - {response.text}")
-
-                except requests.exceptions.RequestException as e:
-                    st.error(f"Network Error: Could not connect to the backend. Please ensure it's running. Details: {e}")
+            st.subheader("AI-Powered Symptom Analysis")
+            try:
+                # Sections are rendered as soon as the backend produces them.
+                st.write_stream(stream_symptom_report(symptoms))
+            except requests.exceptions.HTTPError as e:
+                st.error(f"Error from API: {e}")
+            except requests.exceptions.RequestException as e:
+                st.error(f"Network Error: Could not connect to the backend. Please ensure it's running. Details: {e}")
+            except Exception as e:
+                st.error(f"An unexpected error occurred: {e}")
         else:
             st.warning("Please select at least one symptom to analyze.")
 
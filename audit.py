@@ -0,0 +1,292 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from pydantic import ValidationError
+
+# --- Bulk Prescription Audit ---
+# Re-checks a whole prescription archive offline with the backend's own
+# analysis code, without going through HTTP. The input is streamed and handed
+# to worker processes in chunks; at most a few chunks per worker are in flight,
+# so memory use does not depend on the archive size. Results are written as
+# JSONL in input order, one line per record in the /verify-prescription/batch
+# format. A checkpoint next to the output records how far the output is
+# complete, so an interrupted audit continues where it stopped with --resume.
+#
+#   python audit.py prescriptions.jsonl --output audit.jsonl [--workers 8] [--resume]
+#
+# JSONL records are PrescriptionPayload objects ({"patient": ..., "drugs": [...]}),
+# or carry "prescription_text" instead of "drugs" to have the drugs extracted
+# from free text as /extract-from-text does. CSV files have the columns name,
+# age, gender, blood_group and either drugs ("Warfarin: 5 mg daily; Aspirin:
+# 81 mg") or prescription_text. An "id" field or column is copied to the output.
+
+DEFAULT_CHUNK_SIZE = 256
+CHUNKS_PER_WORKER = 2
+CHECKPOINT_INTERVAL = 2.0
+PROGRESS_INTERVAL = 5.0
+
+Record = Tuple[int, Any]  # (input index, raw JSONL line or CSV row dict)
+
+
+class Checkpoint(NamedTuple):
+    """How much of the output is complete, and where the input continues after it."""
+    input_path: str
+    input_size: int
+    records: int
+    input_offset: int
+    output_offset: int
+    errors: int
+
+    @staticmethod
+    def path_for(output: str) -> str:
+        return output + ".checkpoint"
+
+    def save(self, output: str) -> None:
+        path = self.path_for(output)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._asdict(), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, output: str) -> Optional["Checkpoint"]:
+        try:
+            with open(cls.path_for(output), encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+
+# --- Input ---
+
+def _lines(f: io.BufferedReader, position: List[int]) -> Iterator[str]:
+    """Decoded lines of a binary file, keeping `position[0]` at the end of the last line read."""
+    for raw in f:
+        position[0] += len(raw)
+        yield raw.decode("utf-8")
+
+
+def read_records(path: str, fmt: str, offset: int = 0, index: int = 0) -> Iterator[Tuple[Record, int]]:
+    """
+    Yields (record, input offset just past it) from byte `offset` on. The csv
+    module pulls lines only as it needs them, so the offset always falls on a
+    record boundary, even for quoted fields spanning several lines.
+    """
+    with open(path, "rb") as f:
+        if fmt == "csv":
+            header = next(csv.reader([f.readline().decode("utf-8-sig")]))
+            position = [max(offset, f.tell())]
+            f.seek(position[0])
+            for row in csv.DictReader(_lines(f, position), fieldnames=header):
+                yield (index, row), position[0]
+                index += 1
+        else:
+            position = [offset]
+            f.seek(offset)
+            for line in _lines(f, position):
+                if line.strip():
+                    yield (index, line), position[0]
+                    index += 1
+
+
+def _csv_record(row: Dict[str, str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        "patient": {
+            "name": row.get("name") or "",
+            "age": row.get("age") or 0,
+            "gender": row.get("gender") or "",
+            "blood_group": row.get("blood_group") or "",
+        },
+    }
+    if row.get("id"):
+        record["id"] = row["id"]
+    if row.get("drugs"):
+        drugs = []
+        for item in row["drugs"].split(";"):
+            name, _, dosage = item.partition(":")
+            if name.strip():
+                drugs.append({"name": name.strip(), "dosage": dosage.strip() or "As prescribed"})
+        record["drugs"] = drugs
+    else:
+        record["prescription_text"] = row.get("prescription_text") or ""
+    return record
+
+
+# --- Worker Side ---
+# The workers import the backend module, so they run exactly the code the API
+# runs, against the same memory-mapped knowledge base.
+
+_backend = None
+_worker_cache = None
+
+
+def _init_worker(provider: str) -> None:
+    global _backend, _worker_cache
+    # Read when the backend module is imported, so it must be set first.
+    os.environ["MEDIGUARD_ANALYSIS_PROVIDER"] = provider
+    import main as _backend
+    from cache import ResultCache
+    # Archives repeat the same prescriptions a lot; each worker reuses its reports.
+    _worker_cache = ResultCache(max_bytes=32 * 1024 * 1024, ttl=float("inf"))
+
+
+def audit_record(index: int, raw: Any) -> Tuple[bool, str]:
+    """Checks one record and returns whether it could be checked, and its output line."""
+    main = _backend
+    try:
+        record = _csv_record(raw) if isinstance(raw, dict) else json.loads(raw)
+        if not isinstance(record, dict):
+            raise ValueError("record is not a JSON object")
+        extracted = None
+        if "drugs" not in record and "prescription_text" in record:
+            extracted = [mention.as_dict() for mention in main.extract_mentions(str(record["prescription_text"]))]
+            record = {**record, "drugs": [{"name": d["name"], "dosage": d["dosage"]} for d in extracted]}
+        payload = main.PrescriptionPayload.model_validate(record)
+    except ValidationError as e:
+        return False, json.dumps({"index": index, "ok": False,
+                                  "error": json.loads(e.json(include_url=False, include_input=False))})
+    except ValueError as e:
+        return False, json.dumps({"index": index, "ok": False, "error": f"Invalid record: {e}"})
+
+    prescription = main.canonical_prescription(payload)
+    key = prescription.cache_key()
+    cached = _worker_cache.get(key)
+    if cached is None:
+        report: Dict[str, Any] = {}
+        # The alternatives section is a canned placeholder behind a simulated
+        # model delay, so the audit runs only the interaction and dosage checks.
+        for section in (main.interaction_section, main.dosage_section):
+            main.merge_report(report, section(prescription))
+        cached = _worker_cache.put(key, main.serialize_result(report))
+    head = {"index": index, "ok": True}
+    if "id" in record:
+        head["id"] = record["id"]
+    if extracted is not None:
+        head["extracted"] = extracted
+    # The report is already serialised, so it is spliced in as is.
+    return True, json.dumps(head, ensure_ascii=False)[:-1] + ', "result": %s}' % cached.body.decode("utf-8")
+
+
+def audit_chunk(records: List[Record]) -> Tuple[str, int]:
+    """Checks a chunk of records and returns their output lines and how many failed."""
+    lines = []
+    errors = 0
+    for index, raw in records:
+        ok, line = audit_record(index, raw)
+        lines.append(line + "\n")
+        errors += not ok
+    return "".join(lines), errors
+
+
+# --- Driver ---
+
+def _chunks(records: Iterator[Tuple[Record, int]], size: int) -> Iterator[Tuple[List[Record], int]]:
+    chunk: List[Record] = []
+    offset = 0
+    for record, offset in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk, offset
+            chunk = []
+    if chunk:
+        yield chunk, offset
+
+
+def run_audit(input_path: str, output_path: str, fmt: str, workers: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              resume: bool = False, progress_interval: float = PROGRESS_INTERVAL, provider: str = "local") -> Checkpoint:
+    """Audits `input_path` into `output_path` and returns the final checkpoint."""
+    input_size = os.path.getsize(input_path)
+    state = Checkpoint(os.path.abspath(input_path), input_size, 0, 0, 0, 0)
+    if resume:
+        saved = Checkpoint.load(output_path)
+        if saved is not None:
+            if (saved.input_path, saved.input_size) != (state.input_path, state.input_size):
+                raise SystemExit(f"{Checkpoint.path_for(output_path)} belongs to another input; remove it or drop --resume.")
+            state = saved
+            print(f"Resuming after {state.records} records", file=sys.stderr)
+
+    output = open(output_path, "r+b" if state.output_offset else "wb")
+    # Anything past the checkpoint was written after it and is redone.
+    output.seek(state.output_offset)
+    output.truncate()
+
+    chunks = _chunks(read_records(input_path, fmt, state.input_offset, state.records), chunk_size)
+    in_flight: Deque[Tuple[Future, int, int]] = deque()
+    started = time.perf_counter()
+    done_at_start = state.records
+    last_checkpoint = last_progress = time.monotonic()
+    # Spawned, like the job workers, so each worker starts from a clean import of the backend.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                             initargs=(provider,)) as pool:
+        try:
+            while True:
+                while len(in_flight) < workers * CHUNKS_PER_WORKER:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    records, offset = chunk
+                    in_flight.append((pool.submit(audit_chunk, records), len(records), offset))
+                if not in_flight:
+                    break
+                future, count, offset = in_flight.popleft()
+                lines, errors = future.result()
+                output.write(lines.encode("utf-8"))
+                state = state._replace(records=state.records + count, input_offset=offset,
+                                       output_offset=output.tell(), errors=state.errors + errors)
+                now = time.monotonic()
+                if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    output.flush()
+                    os.fsync(output.fileno())
+                    state.save(output_path)
+                    last_checkpoint = now
+                if progress_interval and now - last_progress >= progress_interval:
+                    rate = (state.records - done_at_start) / (time.perf_counter() - started)
+                    print(f"{state.records} records audited ({rate:.0f}/s, {state.errors} errors,"
+                          f" {offset / input_size:.0%} of input)", file=sys.stderr)
+                    last_progress = now
+        finally:
+            output.flush()
+            os.fsync(output.fileno())
+            output.close()
+            state.save(output_path)
+            for future, _, _ in in_flight:
+                future.cancel()
+    os.remove(Checkpoint.path_for(output_path))
+    return state
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Audit a prescription archive offline with the backend's checks.")
+    parser.add_argument("input", help="Prescriptions as JSONL or CSV.")
+    parser.add_argument("--output", "-o", required=True, help="JSONL file to write the results to.")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="Input format (default: from the file extension).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per core).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Records per task sent to a worker.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted audit from its checkpoint.")
+    parser.add_argument("--provider", choices=("local", "fake", "gemini"), default="local",
+                        help="Analysis model for drugs the reference data lacks (default: local, no model calls).")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    started = time.perf_counter()
+    try:
+        state = run_audit(args.input, args.output, fmt, max(1, args.workers), max(1, args.chunk_size), args.resume,
+                          provider=args.provider)
+    except KeyboardInterrupt:
+        print(f"Interrupted; run again with --resume to continue from {Checkpoint.path_for(args.output)}",
+              file=sys.stderr)
+        sys.exit(130)
+    elapsed = time.perf_counter() - started
+    print(f"Audited {state.records} records ({state.errors} errors) into {args.output} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
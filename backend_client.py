@@ -0,0 +1,205 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+# --- Backend HTTP Client ---
+# One pooled session per Streamlit process (see `get_backend_client` in app.py),
+# so reruns and concurrent sessions reuse keep-alive connections instead of
+# opening a new TCP connection per call. Every call has a timeout, so a stuck
+# backend can no longer hang a script thread forever.
+
+logger = logging.getLogger("mediguard.backend")
+
+Timeout = Tuple[float, float]  # (connect, read) seconds
+
+DEFAULT_TIMEOUT: Timeout = (3.05, 15)
+ENDPOINT_TIMEOUTS: Dict[str, Timeout] = {
+    "/": (1, 3),
+    "/live": (1, 2),
+    "/ready": (1, 3),
+    "/extract-from-text": (3.05, 10),
+    "/verify-prescription": (3.05, 30),
+    "/analyze-symptoms": (3.05, 20),
+    "/analyze-symptoms/batch": (3.05, 30),
+    "/symptoms": (1, 3),
+    # Streams only need the read timeout to cover the gap between two events.
+    "/verify-prescription/stream": (3.05, 20),
+    "/analyze-symptoms/stream": (3.05, 20),
+    "/drugs/search": (3.05, 10),
+    "/drugs/suggest": (1, 2),
+    "/history": (3.05, 10),
+}
+RETRY_STATUSES = {429, 502, 503, 504}
+# Methods safe to send twice. Others (POST, PATCH) are only retried when the
+# connection could not be opened, so the backend never saw the first attempt.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE"}
+
+
+def _not_sent(error: requests.exceptions.RequestException) -> bool:
+    """Whether the request failed before a connection to the backend was opened."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+class BackendClient:
+    """Pooled, timeout-aware HTTP client with bounded, jittered retries."""
+
+    def __init__(self, base_url: str, pool_size: int = 32, retries: int = 2, backoff: float = 0.25,
+                 max_backoff: float = 4.0, timeouts: Optional[Dict[str, Timeout]] = None,
+                 default_timeout: Timeout = DEFAULT_TIMEOUT, headers: Optional[Dict[str, str]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeouts = ENDPOINT_TIMEOUTS if timeouts is None else timeouts
+        self.default_timeout = default_timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Full-jitter exponential backoff, honouring a short Retry-After if given."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method: str, path: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """
+        Sends a request to the backend. For GET, HEAD and DELETE, connection
+        errors, timeouts and 429/502/503/504 responses are retried up to
+        `retries` times (default: the client's); other methods are only retried
+        when the connection could not be opened, unless `retries` is given. The
+        last error is raised (or the last response returned) when they run out.
+        """
+        retry_all = retries is not None or method.upper() in IDEMPOTENT_METHODS
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault("timeout", self.timeouts.get(path, self.default_timeout))
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                elapsed = (time.perf_counter() - started) * 1000
+                logger.warning("%s %s failed after %.1f ms (attempt %d): %s", method, path, elapsed, attempt + 1, e)
+                if attempt == retries or not (retry_all or _not_sent(e)):
+                    raise
+            else:
+                elapsed = (time.perf_counter() - started) * 1000
+                logger.info("%s %s -> %d in %.1f ms (attempt %d)", method, path, response.status_code, elapsed,
+                            attempt + 1)
+                if response.status_code not in RETRY_STATUSES or attempt == retries or not retry_all:
+                    return response
+            time.sleep(self._delay(attempt, response))
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def stream_events(self, path: str, **kwargs) -> Iterator[Tuple[str, Any]]:
+        """
+        POSTs to a Server-Sent Events endpoint and yields (event, data) pairs as
+        they arrive. Streams are not retried. Closing the generator closes the
+        connection, which cancels the rest of the analysis on the backend.
+        """
+        kwargs.setdefault("timeout", self.timeouts.get(path, self.default_timeout))
+        started = time.perf_counter()
+        with self.session.post(f"{self.base_url}{path}", stream=True, **kwargs) as response:
+            if response.status_code != 200:
+                raise requests.exceptions.HTTPError(
+                    f"{response.status_code} - {response.text}", response=response)
+            event, data = "message", []
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    logger.info("POST %s event %r after %.1f ms", path, event, (time.perf_counter() - started) * 1000)
+                    yield event, json.loads("\n".join(data))
+                    event, data = "message", []
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# --- Backend Readiness ---
+# The sidebar shows whether the backend is up and warmed up. A daemon thread
+# polls GET /ready and keeps the last answer, so rendering a page only reads
+# it and never waits for the network.
+
+READY_POLL_INTERVAL = 10.0
+WARMING_POLL_INTERVAL = 1.0
+
+
+class BackendStatus(NamedTuple):
+    state: str  # "unknown", "ready", "warming", "error", "disconnected" or "timeout"
+    status_code: Optional[int] = None
+    components: Optional[Dict[str, Any]] = None
+    checked_at: Optional[float] = None
+
+
+class ReadinessMonitor:
+    """Polls the backend's readiness on a daemon thread; `status` is the last answer."""
+
+    def __init__(self, client: BackendClient, interval: float = READY_POLL_INTERVAL,
+                 warming_interval: float = WARMING_POLL_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self.warming_interval = warming_interval
+        self.status = BackendStatus("unknown")
+        threading.Thread(target=self._run, name="backend-readiness", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            self.status = self.poll()
+            # A backend that is not ready yet is checked again soon, so it shows as ready soon after it is.
+            time.sleep(self.interval if self.status.state == "ready" else self.warming_interval)
+
+    def poll(self) -> BackendStatus:
+        # Not retried: the next poll is the retry.
+        try:
+            response = self.client.get("/ready", retries=0)
+        except requests.exceptions.ConnectionError:
+            return BackendStatus("disconnected", checked_at=time.time())
+        except requests.exceptions.Timeout:
+            return BackendStatus("timeout", checked_at=time.time())
+        components = None
+        if response.status_code in (200, 503):
+            try:
+                components = response.json().get("components")
+            except ValueError:
+                pass
+        if response.status_code == 200:
+            state = "ready"
+        elif response.status_code == 503 and components is not None:
+            state = "warming"
+        else:
+            state = "error"
+        return BackendStatus(state, response.status_code, components, time.time())
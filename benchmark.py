@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from lexicon import load_drug_lexicon
+from symptoms import load_symptom_scorer
+
+# --- Backend Benchmark ---
+# Drives the API endpoints with generated payloads at a fixed concurrency and
+# reports throughput and latency percentiles per scenario. Runs fully offline:
+# either in-process through an ASGI transport, against a uvicorn server it
+# starts on localhost, or against an already running backend.
+#
+#   python benchmark.py                               # in-process, all scenarios
+#   python benchmark.py --serve --concurrency 32      # spawn uvicorn on a free port
+#   python benchmark.py --url http://localhost:8000 --scenarios verify extract
+#   python benchmark.py --baseline benchmarks/baseline.json --tolerance 0.2
+#   python benchmark.py --url http://localhost:8000 --lane bulk --scenarios verify
+#
+# With --baseline, the run exits with status 1 if any scenario's p95 latency
+# rose, or its throughput fell, by more than the tolerance.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+_DOSE_UNITS = ("mg", "mg", "mg", "mcg", "g", "mL", "units")
+_FREQUENCIES = ("once daily", "twice daily", "BID", "TID", "q8h", "every 6 hours", "at bedtime", "as needed")
+_FILLER = ("Patient advised to take with food.", "Review in two weeks.", "Continue current diet and exercise.",
+           "Avoid alcohol.", "Report any unusual bleeding or bruising.", "Refills: 2.", "Dispense as written.")
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]]
+    params: Optional[Dict[str, Any]]
+
+
+class PayloadFactory:
+    """Deterministic, realistic request payloads built from the backend's reference data."""
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+        lexicon = load_drug_lexicon()
+        self.drug_names = sorted({lexicon.display(name) for name in lexicon.names()})
+        self.symptoms = load_symptom_scorer().vocabulary()
+
+    def _dosage(self) -> str:
+        rng = self.random
+        return f"{rng.choice((1, 2, 5, 10, 20, 25, 40, 50, 81, 100, 250, 500, 1000))} {rng.choice(_DOSE_UNITS)}"
+
+    def _patient(self) -> Dict[str, Any]:
+        rng = self.random
+        return {"name": f"Patient {rng.randrange(100000)}", "age": rng.randrange(0, 95),
+                "gender": rng.choice(("Male", "Female", "Other")), "blood_group": rng.choice(("A+", "O+", "B-", "AB+"))}
+
+    def prescription(self, max_drugs: int) -> Dict[str, Any]:
+        drugs = self.random.sample(self.drug_names, self.random.randint(1, max_drugs))
+        return {"patient": self._patient(), "drugs": [{"name": name, "dosage": self._dosage()} for name in drugs]}
+
+    def prescription_with_unknown(self, max_drugs: int) -> Dict[str, Any]:
+        """A prescription with one drug the reference data lacks, so its interactions go to the analysis model."""
+        payload = self.prescription(max_drugs)
+        payload["drugs"].append({"name": f"Investigational {self.random.randrange(50)}", "dosage": self._dosage()})
+        return payload
+
+    def prescription_text(self, max_drugs: int, max_chars: int) -> str:
+        rng = self.random
+        parts = []
+        for name in rng.sample(self.drug_names, rng.randint(1, max_drugs)):
+            parts.append(f"{name} {self._dosage()} {rng.choice(_FREQUENCIES)}.")
+            parts.append(rng.choice(_FILLER))
+        text = " ".join(parts)
+        target = rng.randint(len(text), max(len(text), max_chars))
+        while len(text) < target:
+            text += " " + rng.choice(_FILLER)
+        return text
+
+    def symptom_set(self, max_symptoms: int) -> List[str]:
+        return self.random.sample(self.symptoms, self.random.randint(1, max_symptoms))
+
+    def misspelling(self) -> str:
+        name = self.random.choice(self.drug_names).lower()
+        cut = self.random.randint(3, max(3, len(name)))
+        query = list(name[:cut])
+        if len(query) > 4:
+            i = self.random.randrange(1, len(query) - 1)
+            query[i], query[i + 1] = query[i + 1], query[i]
+        return "".join(query)
+
+
+def scenarios(factory: PayloadFactory, args) -> Dict[str, Callable[[], Request]]:
+    """Scenario name -> function producing the next request of that scenario."""
+    cached_payload = factory.prescription(args.max_drugs)
+    return {
+        "verify": lambda: Request("POST", "/verify-prescription", factory.prescription(args.max_drugs), None),
+        "verify-cached": lambda: Request("POST", "/verify-prescription", cached_payload, None),
+        "verify-unknown": lambda: Request("POST", "/verify-prescription", factory.prescription_with_unknown(args.max_drugs),
+                                          None),
+        "extract": lambda: Request("POST", "/extract-from-text",
+                                   {"prescription_text": factory.prescription_text(args.max_drugs, args.max_text)},
+                                   None),
+        "symptoms": lambda: Request("POST", "/analyze-symptoms",
+                                    {"symptoms": factory.symptom_set(args.max_symptoms)}, None),
+        "symptoms-batch": lambda: Request("POST", "/analyze-symptoms/batch", {
+            "symptom_sets": [factory.symptom_set(args.max_symptoms) for _ in range(args.batch_size)]}, None),
+        "suggest": lambda: Request("GET", "/drugs/suggest", None, {"q": factory.misspelling(), "limit": 10}),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request: Callable[[], Request], total: int,
+                       concurrency: int, warmup: int) -> Dict[str, Any]:
+    """Sends `total` requests with `concurrency` in flight and summarises their latencies."""
+    requests = [make_request() for _ in range(warmup + total)]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    failures = 0
+    next_index = 0
+
+    async def send(request: Request) -> Tuple[float, Optional[int]]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(request.method, request.path, json=request.body, params=request.params)
+            await response.aread()
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+        return time.perf_counter() - started, status
+
+    for request in requests[:warmup]:
+        await send(request)
+
+    async def worker():
+        nonlocal next_index, failures
+        while next_index < len(requests):
+            request = requests[next_index]
+            next_index += 1
+            elapsed, status = await send(request)
+            key = str(status) if status is not None else "transport-error"
+            statuses[key] = statuses.get(key, 0) + 1
+            if status is None or status >= 400:
+                failures += 1
+            else:
+                latencies.append(elapsed)
+
+    next_index = warmup
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    result: Dict[str, Any] = {
+        "requests": total,
+        "errors": failures,
+        "statuses": statuses,
+        "seconds": round(wall, 3),
+        "throughput_rps": round((total - failures) / wall, 2) if wall else 0.0,
+    }
+    if latencies:
+        ms = np.array(latencies) * 1000
+        p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+        result.update(p50_ms=round(float(p50), 2), p95_ms=round(float(p95), 2), p99_ms=round(float(p99), 2),
+                      mean_ms=round(float(ms.mean()), 2), max_ms=round(float(ms.max()), 2))
+    return result
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Returns a description of every regression beyond `tolerance` (a fraction) against the baseline."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if "p95_ms" in previous and current.get("p95_ms", float("inf")) > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current.get('p95_ms')} ms vs baseline {previous['p95_ms']} ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_rps']} req/s "
+                               f"vs baseline {previous['throughput_rps']} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {previous['errors']}")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """Starts uvicorn on localhost and waits until the backend has warmed up."""
+    process = subprocess.Popen(  # inherits MEDIGUARD_* settings from this process
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+
+async def run(args) -> Dict[str, Any]:
+    factory = PayloadFactory(args.seed)
+    available = scenarios(factory, args)
+    unknown = set(args.scenarios) - set(available)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(available)}")
+
+    server = None
+    # Read when the backend module is imported (here or in the uvicorn process), so it is set first.
+    os.environ["MEDIGUARD_ANALYSIS_PROVIDER"] = args.provider
+    # The app records every verification; keep benchmark traffic out of the real history.
+    scratch = tempfile.TemporaryDirectory(prefix="mediguard-bench-")
+    os.environ["MEDIGUARD_HISTORY_DB"] = os.path.join(scratch.name, "history.db")
+    headers = {}
+    if args.lane:
+        headers["X-MediGuard-Lane"] = args.lane
+    if args.api_key:
+        headers["X-API-Key"] = args.api_key
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, headers=headers,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+        target = args.url
+    elif args.serve:
+        port = _free_port()
+        server = start_server(port)
+        target = f"http://127.0.0.1:{port}"
+        client = httpx.AsyncClient(base_url=target, timeout=args.timeout, headers=headers,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        import main  # in-process: the app and its reference data load here
+        # The ASGI transport skips the lifespan handler, so the warm-up is run here.
+        await main.readiness.run()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark",
+                                   timeout=args.timeout, headers=headers)
+        target = "asgi"
+
+    results: Dict[str, Any] = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "target": target,
+        "config": {key: getattr(args, key) for key in ("requests", "concurrency", "warmup", "seed", "max_drugs",
+                                                       "max_text", "max_symptoms", "batch_size", "provider")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "scenarios": {},
+    }
+    try:
+        async with client:
+            for name in args.scenarios:
+                print(f"{name}: {args.requests} requests at concurrency {args.concurrency}...", file=sys.stderr)
+                summary = await run_scenario(client, available[name], args.requests, args.concurrency, args.warmup)
+                results["scenarios"][name] = summary
+                print(f"  {summary['throughput_rps']} req/s  p50 {summary.get('p50_ms')} ms  "
+                      f"p95 {summary.get('p95_ms')} ms  p99 {summary.get('p99_ms')} ms  "
+                      f"errors {summary['errors']}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        scratch.cleanup()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MediGuard backend endpoints.")
+    parser.add_argument("--scenarios", nargs="+",
+                        default=["verify", "verify-cached", "extract", "symptoms", "symptoms-batch", "suggest"])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Benchmark an already running backend instead of the in-process app.")
+    target.add_argument("--serve", action="store_true", help="Start uvicorn on a free localhost port and use it.")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once.")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests sent first, one at a time.")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--lane", choices=("interactive", "bulk"),
+                        help="Admission lane to send the requests in (default: the endpoint's).")
+    parser.add_argument("--api-key", help="API key to send in X-API-Key.")
+    parser.add_argument("--provider", choices=("fake", "local", "gemini"), default="local",
+                        help="Analysis model of the in-process or --serve backend (default: local).")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for the generated payloads.")
+    parser.add_argument("--max-drugs", type=int, default=6, help="Drugs per prescription (1..N).")
+    parser.add_argument("--max-text", type=int, default=2000, help="Characters of prescription text (up to N).")
+    parser.add_argument("--max-symptoms", type=int, default=5, help="Symptoms per symptom set (1..N).")
+    parser.add_argument("--batch-size", type=int, default=100, help="Symptom sets per batch request.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against this results file and fail on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative regression of p95 latency and throughput (default 0.25).")
+    parser.add_argument("--save-baseline", metavar="PATH", nargs="?", const=BASELINE_PATH,
+                        help=f"Store the results as the new baseline (default {BASELINE_PATH}).")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"] or baseline.get("target") != results["target"]:
+            print("Warning: the baseline was recorded with different settings; numbers may not be comparable.",
+                  file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against the baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
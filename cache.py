@@ -0,0 +1,97 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+# --- Result Cache ---
+# Analysis results are cached as serialised response bodies keyed on a
+# canonical form of the request, so repeat checks skip both the analysis and
+# the JSON encoding. Entries are evicted least-recently-used first once the
+# cache holds more than `max_bytes`, and expire `ttl` seconds after insertion.
+# The cache is only used from the event loop thread, so it needs no lock.
+
+CACHE_MAX_BYTES = int(os.getenv("MEDIGUARD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("MEDIGUARD_CACHE_TTL", "600"))
+
+
+class CachedResult(NamedTuple):
+    """A serialised response body with its entity tag."""
+    body: bytes
+    etag: str
+
+
+class _Entry(NamedTuple):
+    result: CachedResult
+    expires_at: float
+    size: int
+
+
+def make_etag(body: bytes) -> str:
+    """Strong entity tag for a response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ResultCache:
+    """Byte-bounded LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.result
+
+    def put(self, key: str, body: bytes) -> CachedResult:
+        """Stores `body` under `key` and returns it with its ETag."""
+        result = CachedResult(body, make_etag(body))
+        size = len(key) + len(body) + len(result.etag)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return result
+        self._entries[key] = _Entry(result, time.monotonic() + self.ttl, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+        return result
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
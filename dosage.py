@@ -0,0 +1,366 @@
+import csv
+import math
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexicon import DATA_DIR, DrugLexicon, normalize_drug_name
+
+# --- Dosage Engine ---
+# Free-text dosages ("500 mg BID", "0.5g", "10 mL q8h", "2 tabs of 250mcg") are
+# parsed into a quantity per administration in a base unit (mg, mL, unit, mEq,
+# or a dosage form when no strength is given) and a number of doses per day.
+# They are then checked against per-drug dose ranges by age band. Doses per
+# kilogram or per square metre ("15 mg/kg q6h") are parsed as such and left
+# unchecked, since the ranges are absolute and the patient's weight is unknown. The range
+# table is a set of parallel arrays sorted on (drug id, age band), so checking a
+# whole prescription, or a whole batch of them, is one np.searchsorted plus a
+# handful of vectorised comparisons.
+
+DOSE_RANGES_PATH = os.getenv("MEDIGUARD_DOSE_RANGES_PATH", os.path.join(DATA_DIR, "dose_ranges.csv"))
+
+AGE_BANDS = (
+    (0, 1, "infant"),
+    (2, 11, "child"),
+    (12, 17, "adolescent"),
+    (18, 64, "adult"),
+    (65, 200, "older adult"),
+)
+AGE_BAND_NAMES = tuple(band for _, _, band in AGE_BANDS)
+_BAND_IDS = {band: i for i, band in enumerate(AGE_BAND_NAMES)}
+
+
+def age_band(age: int) -> str:
+    """Maps an age in years to the band used by the dosage analysis."""
+    for low, high, band in AGE_BANDS:
+        if low <= age <= high:
+            return band
+    return "adult"
+
+
+# Base units; a range and a dose are only compared when their units match.
+UNITS = ("mg", "mL", "unit", "mEq", "tablet", "capsule", "puff", "drop", "spray", "patch")
+_UNIT_IDS = {unit: i for i, unit in enumerate(UNITS)}
+# Spelling -> (base unit, factor to the base unit).
+_UNIT_ALIASES = {
+    "mg": ("mg", 1.0), "milligram": ("mg", 1.0), "milligrams": ("mg", 1.0),
+    "mcg": ("mg", 1e-3), "µg": ("mg", 1e-3), "ug": ("mg", 1e-3), "microgram": ("mg", 1e-3),
+    "micrograms": ("mg", 1e-3),
+    "g": ("mg", 1e3), "gm": ("mg", 1e3), "gram": ("mg", 1e3), "grams": ("mg", 1e3),
+    "ml": ("mL", 1.0), "cc": ("mL", 1.0), "l": ("mL", 1e3),
+    "unit": ("unit", 1.0), "units": ("unit", 1.0), "iu": ("unit", 1.0),
+    "meq": ("mEq", 1.0),
+}
+_FORM_ALIASES = {
+    "tab": "tablet", "tabs": "tablet", "tablet": "tablet", "tablets": "tablet",
+    "cap": "capsule", "caps": "capsule", "capsule": "capsule", "capsules": "capsule",
+    "puff": "puff", "puffs": "puff", "drop": "drop", "drops": "drop",
+    "spray": "spray", "sprays": "spray", "patch": "patch", "patches": "patch",
+}
+_WORD_NUMBERS = {"half": 0.5, "½": 0.5, "one": 1.0, "two": 2.0, "three": 3.0, "four": 4.0}
+
+_NUMBER = r"\d+(?:[.,]\d+)?|[.,]\d+"
+_THOUSANDS = re.compile(r"\d{1,3}(?:,\d{3})+")
+_UNIT = "|".join(sorted(map(re.escape, _UNIT_ALIASES), key=len, reverse=True))
+_PER = r"kg|m2|m²"
+_STRENGTH = re.compile(rf"(?P<amount>{_NUMBER})\s*(?P<unit>{_UNIT})(?![a-zµ])(?!\s*/\s*(?:{_PER}))")
+# "15 mg/kg", "375 mg/m2", "30 mg/kg/day": a dose by body weight or surface area.
+_PER_WEIGHT = re.compile(
+    rf"(?P<amount>{_NUMBER})\s*(?P<unit>{_UNIT})\s*/\s*(?P<per>{_PER})(?![a-z0-9])(?P<daily>\s*/\s*d(?:ay)?\b)?"
+)
+# "250 mg/5 mL": a liquid's concentration, applied to a volume dose.
+_CONCENTRATION = re.compile(rf"(?P<amount>{_NUMBER})\s*(?P<unit>{_UNIT})\s*/\s*(?P<per>{_NUMBER})?\s*(?P<per_unit>ml|cc|l)\b")
+_COUNT = re.compile(
+    rf"(?P<count>{_NUMBER}|half|½|one|two|three|four)\s*(?:x\s*)?"
+    rf"(?P<form>{'|'.join(sorted(_FORM_ALIASES, key=len, reverse=True))})\b"
+)
+# "2 x 250 mg", matched against the text before the strength.
+_MULTIPLIER = re.compile(rf"(?P<count>{_NUMBER})\s*[x×]\s*$")
+
+_HOURS = r"(?P<hours>\d+)\s*(?:-\s*\d+\s*)?(?:h|hrs?|hours?)\b"
+# Checked in order; the first pattern found anywhere in the dosage wins.
+_FREQUENCIES = (
+    (re.compile(rf"\bq\.?\s*{_HOURS}"), None),
+    (re.compile(rf"\bevery\s+{_HOURS}"), None),
+    (re.compile(r"\b(?P<times>\d+)\s*(?:x|times)\s*(?:a|per|/)?\s*(?:day|daily|d)\b"), None),
+    (re.compile(r"\b(?:once\s+(?:a\s+|per\s+)?week|weekly|every\s+week|q\.?\s?wk)\b|/\s*week\b"), 1 / 7),
+    (re.compile(r"\b(?:q\.?i\.?d|qds|four\s+times)\b"), 4.0),
+    (re.compile(r"\b(?:t\.?i\.?d|tds|three\s+times|thrice)\b"), 3.0),
+    (re.compile(r"\b(?:b\.?i\.?d|bd|twice)\b"), 2.0),
+    (re.compile(r"\b(?:q\.?d|o\.?d|daily|once|nightly|q\.?\s?(?:am|pm|hs)|h\.?s|stat|at\s+bedtime"
+                r"|every\s+(?:day|morning|evening|night)|in\s+the\s+(?:morning|evening)|a\s+day|per\s+day)\b"
+                r"|/\s*d(?:ay)?\b"), 1.0),
+)
+_AS_NEEDED = re.compile(r"\b(?:p\.?r\.?n|as\s+needed|when\s+required)\b")
+
+
+def _number(text: str) -> float:
+    if text in _WORD_NUMBERS:
+        return _WORD_NUMBERS[text]
+    # "1,000" is a thousands separator; "0,5" a decimal comma.
+    return float(text.replace(",", "") if _THOUSANDS.fullmatch(text) else text.replace(",", "."))
+
+
+class Dose(NamedTuple):
+    """
+    A parsed dosage: `quantity` of `unit` per administration, `doses_per_day`
+    times a day; with `per` ("kg" or "m2"), the quantity is per kilogram of
+    body weight or square metre of body surface.
+    """
+    quantity: float
+    unit: str
+    doses_per_day: Optional[float]
+    as_needed: bool
+    per: Optional[str] = None
+
+    @property
+    def daily_total(self) -> Optional[float]:
+        return None if self.doses_per_day is None else self.quantity * self.doses_per_day
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "quantity": self.quantity,
+            "unit": self.unit,
+            "doses_per_day": self.doses_per_day,
+            "daily_total": self.daily_total,
+            "as_needed": self.as_needed,
+            "per": self.per,
+        }
+
+
+def parse_frequency(text: str) -> Optional[float]:
+    """Doses per day named in a (lower-cased) dosage, or None. Interval ranges ("q4-6h") use the shorter interval."""
+    for pattern, per_day in _FREQUENCIES:
+        match = pattern.search(text)
+        if match is None:
+            continue
+        if per_day is not None:
+            return per_day
+        if "times" in match.re.groupindex:
+            return float(match["times"])
+        hours = int(match["hours"])
+        return 24 / hours if hours else None
+    return None
+
+
+def parse_dosage(text: str) -> Optional[Dose]:
+    """Parses a free-text dosage; returns None if it names no amount."""
+    text = " ".join(text.lower().split())
+    concentration = None
+    match = _CONCENTRATION.search(text)
+    if match:
+        unit, factor = _UNIT_ALIASES[match["unit"]]
+        per = _number(match["per"]) if match["per"] else 1.0
+        per *= _UNIT_ALIASES[match["per_unit"]][1]
+        if per:
+            concentration = (_number(match["amount"]) * factor / per, unit)
+        text = text[:match.start()] + " " + text[match.end():]
+
+    per_weight = _PER_WEIGHT.search(text)
+    if per_weight:
+        unit, factor = _UNIT_ALIASES[per_weight["unit"]]
+        quantity = _number(per_weight["amount"]) * factor
+        per_day = parse_frequency(text[:per_weight.start()] + " " + text[per_weight.end():])
+        if per_weight["daily"]:
+            # "30 mg/kg/day divided q8h" is 10 mg/kg a dose.
+            quantity, per_day = (quantity / per_day, per_day) if per_day else (quantity, 1.0)
+        return Dose(quantity, unit, per_day, _AS_NEEDED.search(text) is not None, per_weight["per"].replace("²", "2"))
+
+    count = _COUNT.search(text)
+    strength = _STRENGTH.search(text)
+    if strength:
+        unit, factor = _UNIT_ALIASES[strength["unit"]]
+        quantity = _number(strength["amount"]) * factor
+        if count:
+            quantity *= _number(count["count"])
+        else:
+            multiplier = _MULTIPLIER.search(text[:strength.start()])
+            if multiplier:
+                quantity *= _number(multiplier["count"])
+        if unit == "mL" and concentration is not None:
+            quantity, unit = quantity * concentration[0], concentration[1]
+    elif count:
+        quantity, unit = _number(count["count"]), _FORM_ALIASES[count["form"]]
+    else:
+        return None
+    return Dose(quantity, unit, parse_frequency(text), _AS_NEEDED.search(text) is not None)
+
+
+def format_amount(value: float, unit: str, per: Optional[str] = None) -> str:
+    """Renders an amount in its base unit, switching small milligram amounts to micrograms."""
+    if unit == "mg" and 0 < value < 1:
+        value, unit = value * 1000, "mcg"
+    elif unit not in ("mg", "mL", "mEq") and value != 1:
+        unit += "es" if unit == "patch" else "s"
+    return f"{value:.4g} {unit}" + (f"/{per}" if per else "")
+
+
+class DoseRange(NamedTuple):
+    unit: str
+    min_single: float
+    max_single: float
+    max_daily: float
+
+    def as_dict(self) -> Dict[str, object]:
+        return self._asdict()
+
+
+# Check outcomes, in the order they take precedence.
+DOSE_STATUSES = ("unparsed", "per_weight", "no_range", "unit_mismatch", "above_single", "above_daily", "below_range",
+                 "ok")
+_STATUS_IDS = {status: i for i, status in enumerate(DOSE_STATUSES)}
+
+
+class DoseCheck(NamedTuple):
+    drug: str
+    age_band: str
+    dose: Optional[Dose]
+    range: Optional[DoseRange]
+    status: str
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "drug": self.drug,
+            "age_band": self.age_band,
+            "dose": self.dose.as_dict() if self.dose else None,
+            "range": self.range.as_dict() if self.range else None,
+            "status": self.status,
+        }
+
+
+class DoseRangeTable:
+    """
+    Dose ranges as parallel arrays sorted on drug id * len(AGE_BANDS) + band.
+    `drug_ids` maps a canonical drug name to its id through a `get` method.
+    """
+
+    def __init__(self, drug_ids, keys: np.ndarray, units: np.ndarray, min_single: np.ndarray,
+                 max_single: np.ndarray, max_daily: np.ndarray):
+        self._drug_ids = drug_ids
+        self._keys = keys
+        self._units = units
+        self._min_single = min_single
+        self._max_single = max_single
+        self._max_daily = max_daily
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def tables(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """The drug names (by id) and the key, unit and limit arrays."""
+        names = sorted(self._drug_ids, key=self._drug_ids.get)
+        return names, self._keys, self._units, self._min_single, self._max_single, self._max_daily
+
+    def check(self, drugs: Sequence[str], bands: Sequence[str], doses: Sequence[Optional[Dose]]) -> List[DoseCheck]:
+        """
+        Checks parallel sequences of canonical drug names, age bands and parsed
+        doses (None if unparsed). The entries may come from any number of
+        prescriptions; the range comparisons run once over all of them.
+        """
+        count = len(drugs)
+        drug_ids = np.fromiter((self._drug_ids.get(drug, -1) for drug in drugs), dtype=np.int64, count=count)
+        band_ids = np.fromiter((_BAND_IDS[band] for band in bands), dtype=np.int64, count=count)
+        quantity = np.fromiter((dose.quantity if dose else np.nan for dose in doses), dtype=np.float64, count=count)
+        per_day = np.fromiter((dose.doses_per_day if dose and dose.doses_per_day is not None else np.nan
+                               for dose in doses), dtype=np.float64, count=count)
+        units = np.fromiter((_UNIT_IDS[dose.unit] if dose else -1 for dose in doses), dtype=np.int64, count=count)
+        per_weight = np.fromiter((dose is not None and dose.per is not None for dose in doses), dtype=bool, count=count)
+
+        keys = drug_ids * len(AGE_BANDS) + band_ids
+        if len(self._keys):
+            rows = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+            found = (drug_ids >= 0) & (self._keys[rows] == keys)
+            range_units, min_single = self._units[rows], self._min_single[rows]
+            max_single, max_daily = self._max_single[rows], self._max_daily[rows]
+        else:
+            rows = np.zeros(count, dtype=np.int64)
+            found = np.zeros(count, dtype=bool)
+            range_units = np.full(count, -1)
+            min_single = max_single = max_daily = np.full(count, np.nan)
+        parsed = ~np.isnan(quantity)
+        # NaN daily totals (no frequency given) compare False, so they are never flagged.
+        status = np.select(
+            [~parsed, per_weight, ~found, range_units != units, quantity > max_single, quantity * per_day > max_daily,
+             quantity < min_single],
+            [_STATUS_IDS[s] for s in DOSE_STATUSES[:-1]],
+            default=_STATUS_IDS["ok"],
+        )
+
+        checks = []
+        for i in range(count):
+            row = int(rows[i])
+            dose_range = DoseRange(UNITS[self._units[row]], float(self._min_single[row]), float(self._max_single[row]),
+                                   float(self._max_daily[row])) if found[i] else None
+            checks.append(DoseCheck(drugs[i], bands[i], doses[i], dose_range, DOSE_STATUSES[status[i]]))
+        return checks
+
+
+def load_dose_ranges(lexicon: DrugLexicon, path: str = DOSE_RANGES_PATH) -> DoseRangeTable:
+    """
+    Loads dose ranges from a CSV file with columns drug, age_bands ("|"-separated),
+    unit, min_single, max_single and max_daily. max_daily is the average amount
+    per day, so a weekly drug's weekly maximum is divided by 7.
+    """
+    drug_ids: Dict[str, int] = {}
+    rows: Dict[int, Tuple[int, float, float, float]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            drug = lexicon.canonical(row["drug"]) or normalize_drug_name(row["drug"])
+            unit, factor = _UNIT_ALIASES.get(row["unit"].strip().lower(), (row["unit"].strip(), 1.0))
+            if unit not in _UNIT_IDS:
+                raise ValueError(f"Unknown dose unit for {row['drug']!r}: {row['unit']!r}")
+            limits = [float(row[column]) * factor for column in ("min_single", "max_single", "max_daily")]
+            if not limits[0] <= limits[1] or any(math.isnan(limit) for limit in limits):
+                raise ValueError(f"Invalid dose range for {row['drug']!r}")
+            drug_id = drug_ids.setdefault(drug, len(drug_ids))
+            for band in row["age_bands"].split("|"):
+                band = band.strip().lower()
+                if band not in _BAND_IDS:
+                    raise ValueError(f"Unknown age band for {row['drug']!r}: {band!r}")
+                rows[drug_id * len(AGE_BANDS) + _BAND_IDS[band]] = (_UNIT_IDS[unit], *limits)
+    keys = np.array(sorted(rows), dtype=np.uint32)
+    values = [rows[key] for key in keys.tolist()]
+    columns = list(zip(*values)) if values else [(), (), (), ()]
+    return DoseRangeTable(drug_ids, keys, np.array(columns[0], dtype=np.uint8),
+                          *(np.array(column, dtype=np.float64) for column in columns[1:]))
+
+
+def format_dose_report(checks: Sequence[DoseCheck], dosages: Sequence[str]) -> str:
+    """Renders dose checks as the markdown shown in the analysis report."""
+    lines = []
+    for check, dosage in zip(checks, dosages):
+        name = check.drug[:1].upper() + check.drug[1:]
+        dose, dose_range = check.dose, check.range
+        if dose is None:
+            lines.append(f"- **{name}** ({dosage}): _could not read the dose; verify it manually._")
+            continue
+        described = format_amount(dose.quantity, dose.unit, dose.per)
+        if dose.daily_total is not None:
+            described += f", {format_amount(dose.daily_total, dose.unit, dose.per)}/day"
+        if dose.as_needed:
+            described += ", as needed"
+        if check.status == "per_weight":
+            per = "body weight" if dose.per == "kg" else "body surface area"
+            verdict = f"_dosed by {per}, so it was not checked against the range; verify it manually._"
+        elif check.status == "no_range":
+            verdict = f"no reference range for the {check.age_band} age band."
+        elif check.status == "unit_mismatch":
+            verdict = f"the reference range is in {dose_range.unit}; check the strength."
+        elif check.status == "above_single":
+            verdict = (f"**⚠️ above the maximum single dose** of {format_amount(dose_range.max_single, dose_range.unit)} "
+                       f"for the {check.age_band} age band.")
+        elif check.status == "above_daily":
+            verdict = (f"**⚠️ above the maximum daily dose** of {format_amount(dose_range.max_daily, dose_range.unit)} "
+                       f"for the {check.age_band} age band.")
+        elif check.status == "below_range":
+            verdict = (f"below the usual minimum of {format_amount(dose_range.min_single, dose_range.unit)} "
+                       f"for the {check.age_band} age band.")
+        else:
+            verdict = (f"within the {check.age_band} range ({format_amount(dose_range.min_single, dose_range.unit)}"
+                       f"–{format_amount(dose_range.max_single, dose_range.unit)} per dose).")
+        if check.status in ("ok", "below_range") and dose.doses_per_day is None and not dose.as_needed:
+            verdict += " _No frequency given, so the daily total was not checked._"
+        lines.append(f"- **{name}** {described}: {verdict}")
+    return "\n".join(lines)
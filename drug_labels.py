@@ -0,0 +1,225 @@
+import argparse
+import io
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from lexicon import DATA_DIR
+from streaming import iter_json_array_field
+
+# --- Offline openFDA Drug Label Mirror ---
+# The openFDA drug label bulk dumps (https://open.fda.gov/apis/downloads/) are
+# streamed into a local SQLite database with an FTS5 index, so the drug
+# database page works without access to api.fda.gov. Ingestion reads one label
+# at a time and commits in batches, so memory use does not depend on dump size.
+#
+#   python drug_labels.py ingest drug-label-0001-of-0013.json.zip ... [--db PATH]
+
+LABELS_DB_PATH = os.getenv("MEDIGUARD_LABELS_DB", os.path.join(DATA_DIR, "drug_labels.db"))
+
+# Label sections kept in the mirror, under the names openFDA uses for them.
+LABEL_SECTIONS = (
+    "indications_and_usage",
+    "dosage_and_administration",
+    "warnings_and_cautions",
+    "adverse_reactions",
+    "contraindications",
+)
+# Ranking weights for the indexed columns: brand, generic, indications, warnings, contraindications.
+_BM25_WEIGHTS = (10.0, 8.0, 2.0, 1.0, 1.0)
+_BATCH_SIZE = 500
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    id INTEGER PRIMARY KEY,
+    set_id TEXT NOT NULL UNIQUE,
+    effective_time TEXT,
+    brand_name TEXT,
+    generic_name TEXT,
+    indications_and_usage TEXT,
+    dosage_and_administration TEXT,
+    warnings_and_cautions TEXT,
+    adverse_reactions TEXT,
+    contraindications TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS labels_fts USING fts5(
+    brand_name, generic_name, indications_and_usage, warnings_and_cautions, contraindications,
+    content='labels', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+
+class LabelStoreUnavailable(Exception):
+    """Raised when the label database has not been built yet."""
+
+
+def _first(label: Dict[str, Any], *keys: str) -> Optional[str]:
+    """Joins the first non-empty openFDA field among `keys` (they are lists of strings)."""
+    for key in keys:
+        value = label.get(key)
+        if value:
+            return "\n\n".join(value) if isinstance(value, list) else str(value)
+    return None
+
+
+def label_row(label: Dict[str, Any]) -> Optional[tuple]:
+    """Flattens one openFDA label into a `labels` row, or None if it has no set id."""
+    set_id = label.get("set_id") or label.get("id")
+    if not set_id:
+        return None
+    openfda = label.get("openfda") or {}
+    return (
+        set_id,
+        label.get("effective_time"),
+        ", ".join(openfda.get("brand_name") or []) or None,
+        ", ".join(openfda.get("generic_name") or []) or None,
+        _first(label, "indications_and_usage"),
+        _first(label, "dosage_and_administration"),
+        # Older labels use "warnings" rather than "warnings_and_cautions".
+        _first(label, "warnings_and_cautions", "warnings", "boxed_warning"),
+        _first(label, "adverse_reactions"),
+        _first(label, "contraindications"),
+    )
+
+
+def connect(path: str = LABELS_DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _open_dump(path: str) -> Iterator[io.TextIOBase]:
+    """Yields text streams for a .json dump or for every .json member of a .zip dump."""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.endswith(".json"):
+                    with archive.open(member) as raw:
+                        yield io.TextIOWrapper(raw, encoding="utf-8")
+    else:
+        with open(path, encoding="utf-8") as f:
+            yield f
+
+
+def iter_labels(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        for stream in _open_dump(path):
+            yield from iter_json_array_field(stream, "results")
+
+
+def ingest(paths: Iterable[str], db_path: str = LABELS_DB_PATH, progress_every: int = 10000) -> int:
+    """
+    Loads openFDA label dumps into the database and rebuilds the full-text
+    index. Labels already present (same set_id) are replaced. Returns the
+    number of labels read.
+    """
+    conn = connect(db_path)
+    started = time.perf_counter()
+    count = 0
+    batch: List[tuple] = []
+    sql = (
+        "INSERT INTO labels (set_id, effective_time, brand_name, generic_name, indications_and_usage,"
+        " dosage_and_administration, warnings_and_cautions, adverse_reactions, contraindications)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT(set_id) DO UPDATE SET effective_time = excluded.effective_time,"
+        " brand_name = excluded.brand_name, generic_name = excluded.generic_name,"
+        " indications_and_usage = excluded.indications_and_usage,"
+        " dosage_and_administration = excluded.dosage_and_administration,"
+        " warnings_and_cautions = excluded.warnings_and_cautions,"
+        " adverse_reactions = excluded.adverse_reactions, contraindications = excluded.contraindications"
+    )
+    try:
+        for label in iter_labels(paths):
+            row = label_row(label)
+            if row is None:
+                continue
+            batch.append(row)
+            count += 1
+            if len(batch) >= _BATCH_SIZE:
+                with conn:
+                    conn.executemany(sql, batch)
+                batch.clear()
+            if progress_every and count % progress_every == 0:
+                rate = count / (time.perf_counter() - started)
+                print(f"{count} labels ingested ({rate:.0f}/s)", file=sys.stderr)
+        with conn:
+            conn.executemany(sql, batch)
+            # Rebuilding once at the end is much faster than indexing row by row.
+            conn.execute("INSERT INTO labels_fts(labels_fts) VALUES ('rebuild')")
+        with conn:
+            conn.execute("INSERT INTO labels_fts(labels_fts) VALUES ('optimize')")
+    finally:
+        conn.close()
+    return count
+
+
+def _match_expression(query: str) -> str:
+    """Turns free text into an FTS5 expression: every word must match, as a prefix."""
+    return " ".join('"%s"*' % token for token in _TOKEN.findall(query))
+
+
+class LabelStore:
+    """Read-only search over the label database, with one connection per thread."""
+
+    def __init__(self, path: str = LABELS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not os.path.exists(self.path):
+                raise LabelStoreUnavailable(
+                    f"Drug label database not found at {self.path}. Run 'python drug_labels.py ingest <dump files>'."
+                )
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def search(self, query: str, page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        """Ranked full-text search over brand/generic names and label text."""
+        expression = _match_expression(query)
+        if not expression:
+            return {"query": query, "page": page, "page_size": page_size, "total": 0, "results": []}
+        conn = self._connection()
+        total = conn.execute("SELECT count(*) FROM labels_fts WHERE labels_fts MATCH ?", (expression,)).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT l.set_id, l.effective_time, l.brand_name, l.generic_name, {', '.join('l.' + s for s in LABEL_SECTIONS)},"
+            " snippet(labels_fts, -1, '**', '**', '…', 24) AS snippet"
+            " FROM labels_fts JOIN labels l ON l.id = labels_fts.rowid"
+            f" WHERE labels_fts MATCH ? ORDER BY bm25(labels_fts, {', '.join(map(str, _BM25_WEIGHTS))})"
+            " LIMIT ? OFFSET ?",
+            (expression, page_size, (page - 1) * page_size),
+        ).fetchall()
+        return {
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "results": [dict(row) for row in rows],
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the offline openFDA drug label mirror.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Load openFDA drug label dumps (.json or .json.zip).")
+    ingest_parser.add_argument("paths", nargs="+")
+    ingest_parser.add_argument("--db", default=LABELS_DB_PATH, help="SQLite database to write to.")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        started = time.perf_counter()
+        count = ingest(args.paths, args.db)
+        print(f"Ingested {count} labels into {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
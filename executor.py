@@ -0,0 +1,218 @@
+import asyncio
+import functools
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Tuple
+
+from admission import DEFAULT_LANE, INTERACTIVE_RESERVE, LANE_WEIGHTS, LANES, current_lane
+from metrics import LATENCY_BUCKETS, Histogram, record_phase
+from profiling import current_profile, profiled_call
+
+# --- Analysis Execution Layer ---
+# Every analysis backend (mock, rule engine or AI model) is blocking work. Running
+# it directly inside an `async def` endpoint freezes the uvicorn event loop, so it
+# is handed to a bounded worker pool instead. Admission is capped: at most
+# `workers` jobs run at once and at most `queue_depth` more wait for a slot in
+# each lane. Anything beyond that is rejected straight away so the caller can
+# retry later. Waiting jobs get a worker by weighted fair queuing between the
+# lanes of their requests (see admission.py), rather than in arrival order.
+
+ANALYSIS_POOL_KIND = os.getenv("MEDIGUARD_ANALYSIS_POOL", "thread")  # "thread" or "process"
+ANALYSIS_WORKERS = int(os.getenv("MEDIGUARD_ANALYSIS_WORKERS", str(min(32, (os.cpu_count() or 1) * 4))))
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("MEDIGUARD_ANALYSIS_QUEUE_DEPTH", "64"))
+
+
+def _timed_call(fn: Callable[..., Any], args: tuple, kwargs: dict) -> tuple:
+    """Runs inside the worker so the measured time excludes queueing."""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+class QueueFullError(Exception):
+    """Raised when the analysis queue has no room for another job."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Analysis queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Lane:
+    """The jobs of one lane: those running, and those waiting for a worker in arrival order."""
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.running = 0
+        self.waiting: Deque[Tuple[float, asyncio.Future]] = deque()  # (finish tag, woken with the slot)
+        self.last_tag = 0.0
+        self.started = 0
+        self.rejected = 0
+        self.queue_time = Histogram(LATENCY_BUCKETS)
+
+
+class LaneScheduler:
+    """
+    Hands out the `slots` analysis workers by weighted fair queuing: each job
+    gets a virtual finish tag 1/weight past the later of the lane's last tag and
+    the scheduler's virtual time, and a freed worker goes to the waiting job
+    with the smallest tag. With weights 8:1, while both lanes are backlogged
+    the interactive lane starts eight jobs for every one of the bulk lane's, and
+    an idle lane's share goes to the other. `reserve` workers are only ever given to the interactive
+    lane. Only used from the event loop thread.
+    """
+
+    def __init__(self, slots: int, weights: Dict[str, float] = LANE_WEIGHTS, reserve: int = INTERACTIVE_RESERVE):
+        self.slots = slots
+        self.reserve = min(max(0, reserve), slots - 1)
+        self.lanes = {name: Lane(name, weights[name]) for name in LANES}
+        self.busy = 0
+        self._virtual_time = 0.0
+
+    def lane(self, name: str) -> Lane:
+        return self.lanes.get(name) or self.lanes[DEFAULT_LANE]
+
+    def can_start(self, lane: Lane) -> bool:
+        limit = self.slots if lane.name == DEFAULT_LANE else self.slots - self.reserve
+        return self.busy < limit
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(lane.waiting) for lane in self.lanes.values())
+
+    def _tag(self, lane: Lane) -> float:
+        lane.last_tag = max(self._virtual_time, lane.last_tag) + 1 / lane.weight
+        return lane.last_tag
+
+    def _start(self, lane: Lane) -> None:
+        self.busy += 1
+        lane.running += 1
+        lane.started += 1
+
+    async def acquire(self, lane: Lane) -> None:
+        """Waits until the lane may use a worker, which the caller must then `release`."""
+        if not lane.waiting and self.can_start(lane):
+            # Uncontended jobs are not tagged, so a lane is not charged for idle periods.
+            self._start(lane)
+            lane.queue_time.observe(0.0)
+            return
+        entry = (self._tag(lane), asyncio.get_running_loop().create_future())
+        lane.waiting.append(entry)
+        queued_at = time.perf_counter()
+        try:
+            await entry[1]
+        except asyncio.CancelledError:
+            if entry[1].done() and not entry[1].cancelled():
+                self.release(lane)  # given a worker just as it was cancelled
+            else:
+                lane.waiting.remove(entry)
+            raise
+        lane.queue_time.observe(time.perf_counter() - queued_at)
+
+    def release(self, lane: Lane) -> None:
+        self.busy -= 1
+        lane.running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while True:
+            candidates = [lane for lane in self.lanes.values() if lane.waiting and self.can_start(lane)]
+            if not candidates:
+                return
+            lane = min(candidates, key=lambda lane: lane.waiting[0][0])
+            tag, future = lane.waiting.popleft()
+            self._virtual_time = tag
+            self._start(lane)
+            future.set_result(None)
+
+
+class AnalysisExecutor:
+    """Runs blocking analysis callables on a thread or process pool with bounded admission."""
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS, queue_depth: int = ANALYSIS_QUEUE_DEPTH,
+                 kind: str = ANALYSIS_POOL_KIND):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown analysis pool kind: {kind!r}")
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.kind = kind
+        self._pool: Executor = None
+        self.scheduler = LaneScheduler(self.workers)
+        self.rejected = 0
+        # Exponentially weighted average of job duration, used for Retry-After.
+        self._avg_seconds = 1.0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+        return self._pool
+
+    @property
+    def pending(self) -> int:
+        """Jobs admitted and not yet finished (running + waiting)."""
+        return self.scheduler.busy + self.scheduler.waiting
+
+    @property
+    def queued(self) -> int:
+        """Jobs admitted but still waiting for a free worker."""
+        return self.scheduler.waiting
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a queue slot frees up."""
+        waves = (self.queued + 1) / self.workers
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    def check_admission(self, lane: str = DEFAULT_LANE) -> None:
+        """Raises QueueFullError if a new job in `lane` would be rejected right now."""
+        queue = self.scheduler.lane(lane)
+        if not self.scheduler.can_start(queue) and len(queue.waiting) >= self.queue_depth:
+            self.rejected += 1
+            queue.rejected += 1
+            raise QueueFullError(self.retry_after())
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs `fn(*args, **kwargs)` on the pool, or raises QueueFullError if saturated."""
+        # The scheduler is only touched from the event loop thread, so no lock is needed.
+        lane = self.scheduler.lane(current_lane())
+        self.check_admission(lane.name)
+        queued_at = time.perf_counter()
+        profile = current_profile()
+        try:
+            await self.scheduler.acquire(lane)
+            try:
+                loop = asyncio.get_running_loop()
+                if profile is None:
+                    call = functools.partial(_timed_call, fn, args, kwargs)
+                else:
+                    # Profiled where it runs, since cProfile only sees its own thread.
+                    call = functools.partial(_timed_call, profiled_call, (fn, args, kwargs), {})
+                result, elapsed = await loop.run_in_executor(self._get_pool(), call)
+            finally:
+                self.scheduler.release(lane)
+        finally:
+            record_phase("analysis", time.perf_counter() - queued_at)
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+        if profile is not None:
+            result, stats = result
+            profile.add(stats)
+        return result
+
+    async def start(self) -> None:
+        """Starts every worker now, so the first analyses do not pay for starting them."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, time.sleep, 0.01) for _ in range(self.workers)))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+analysis_executor = AnalysisExecutor()
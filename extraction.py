@@ -0,0 +1,280 @@
+import re
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexicon import DrugLexicon
+
+# --- Lexicon-Driven Drug Extraction ---
+# The drug lexicon is compiled once into an Aho-Corasick automaton, so finding
+# every brand or generic name in a text is one linear pass over the text whose
+# cost does not depend on how many names the lexicon holds. Dose and frequency
+# tokens are found with two more linear regex scans and attached to the nearest
+# drug mention.
+
+_DOSE = re.compile(
+    r"(?<![\w.])(\d+(?:[.,]\d+)?(?:\s*/\s*\d+(?:[.,]\d+)?)?)\s*"
+    r"(mg|mcg|µg|ug|g|kg|ml|mL|l|units?|iu|IU|meq|mEq|%|tabs?|tablets?|caps?|capsules?|puffs?|drops?|sprays?)\b",
+    re.IGNORECASE,
+)
+_FREQUENCY = re.compile(
+    r"\b(once|twice|three times|four times)\s+(?:a\s+|per\s+)?(?:daily|day|weekly|week)\b"
+    r"|\b(?:every|q)\s*\d+\s*(?:-\s*\d+\s*)?(?:h|hrs?|hours?)\b"
+    r"|\bq\d+h\b|\bq\.?\s?(?:d|am|pm|hs)\b\.?"
+    r"|\b(?:b\.?i\.?d|t\.?i\.?d|q\.?i\.?d|o\.?d|p\.?r\.?n)\b\.?|\b(?:stat|nightly|daily|weekly)\b"
+    r"|\b(?:at bedtime|as needed|in the morning|in the evening|with meals)\b",
+    re.IGNORECASE,
+)
+# Characters that can be part of a drug name; everything else separates words.
+_WORD = re.compile(r"[A-Za-z0-9\-]+")
+# Every character of a normalised text: the lower-cased word characters and the space between words.
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789- "
+_SYMBOLS = {char: symbol for symbol, char in enumerate(_ALPHABET)}
+# How far (in characters) a dose or frequency may sit from its drug name.
+_ATTACH_WINDOW = 60
+
+
+class DrugMention(NamedTuple):
+    """A drug name found in a text, with the dose/frequency tokens attached to it."""
+    name: str
+    canonical: str
+    start: int
+    end: int
+    dose: Optional[str]
+    frequency: Optional[str]
+    source: str = "lexicon"  # or "model" for a name the analysis model found
+
+    def as_dict(self) -> Dict[str, object]:
+        dosage = " ".join(token for token in (self.dose, self.frequency) if token) or "As per text"
+        return {
+            "name": self.name,
+            "canonical": self.canonical,
+            "dosage": dosage,
+            "frequency": self.frequency,
+            "span": [self.start, self.end],
+            "source": self.source,
+        }
+
+
+class DrugExtractor:
+    """
+    Aho-Corasick automaton over all names of a drug lexicon, kept in flat
+    arrays so a compiled knowledge base can store it and map it back without
+    rebuilding it (see `tables` and `from_tables`).
+    """
+
+    def __init__(self, lexicon: DrugLexicon):
+        # Built with a dict per node, then flattened.
+        goto: List[Dict[int, int]] = [{}]
+        match: List[Tuple[int, int]] = [(0, 0)]
+        canonicals: List[str] = []
+        canonical_ids: Dict[str, int] = {}
+        for name, canonical in lexicon.items():
+            symbols = [_SYMBOLS.get(char) for char in name]
+            if None in symbols:
+                continue  # text is normalised to the alphabet, so this name can never match
+            node = 0
+            for symbol in symbols:
+                next_node = goto[node].get(symbol)
+                if next_node is None:
+                    next_node = goto[node][symbol] = len(goto)
+                    goto.append({})
+                    match.append((0, 0))
+                node = next_node
+            canonical_id = canonical_ids.setdefault(canonical, len(canonicals))
+            if canonical_id == len(canonicals):
+                canonicals.append(canonical)
+            match[node] = (canonical_id + 1, len(name))
+
+        fail = [0] * len(goto)
+        output_link = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for symbol, child in goto[node].items():
+                queue.append(child)
+                fallback = fail[node]
+                while fallback and symbol not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(symbol, 0)
+                fail[child] = target if target != child else 0
+                output_link[child] = fail[child] if match[fail[child]][0] else output_link[fail[child]]
+
+        edge_offsets = np.zeros(len(goto) + 1, dtype=np.uint32)
+        np.cumsum([len(children) for children in goto], out=edge_offsets[1:])
+        edges = [edge for children in goto for edge in sorted(children.items())]
+        self._init_tables(
+            canonicals, edge_offsets,
+            np.array([symbol for symbol, _ in edges], dtype=np.uint8),
+            np.array([target for _, target in edges], dtype=np.uint32),
+            np.array(fail, dtype=np.uint32), np.array(output_link, dtype=np.uint32),
+            np.array([canonical_id for canonical_id, _ in match], dtype=np.uint32),
+            np.array([length for _, length in match], dtype=np.uint32),
+        )
+
+    def _init_tables(self, canonicals: Sequence[str], *arrays) -> None:
+        # goto of node n: edge_symbols/edge_targets[edge_offsets[n]:edge_offsets[n + 1]];
+        # match_name is 1 + the canonical id of the name ending at a node (0 for none),
+        # output_link the nearest node on the failure chain that ends a name.
+        self._canonicals = canonicals
+        self._tables = arrays
+        (self._edge_offsets, self._edge_symbols, self._edge_targets, self._fail, self._output_link,
+         self._match_name, self._match_length) = (memoryview(array) for array in arrays)
+        # The root has an edge for almost every symbol, so it gets a direct table.
+        self._root = [0] * len(_ALPHABET)
+        for edge in range(self._edge_offsets[0], self._edge_offsets[1]):
+            self._root[self._edge_symbols[edge]] = self._edge_targets[edge]
+
+    @classmethod
+    def from_tables(cls, canonicals: Sequence[str], edge_offsets, edge_symbols, edge_targets, fail, output_link,
+                    match_name, match_length) -> "DrugExtractor":
+        """An extractor around the arrays returned by `tables` (e.g. views into a mapped file)."""
+        extractor = cls.__new__(cls)
+        extractor._init_tables(canonicals, edge_offsets, edge_symbols, edge_targets, fail, output_link,
+                               match_name, match_length)
+        return extractor
+
+    def tables(self) -> tuple:
+        """The canonical names and the automaton arrays, in `from_tables` order."""
+        return (list(self._canonicals), *self._tables)
+
+    @staticmethod
+    def _normalise(text: str) -> Tuple[str, Dict[int, int], Dict[int, int]]:
+        """
+        Lower-cases `text` and collapses runs of separators into one space, the
+        same way lexicon names are normalised. Returns the normalised text plus
+        maps from word start/end offsets in it to offsets in `text`.
+        """
+        words: List[str] = []
+        starts: Dict[int, int] = {}
+        ends: Dict[int, int] = {}
+        position = 0
+        for m in _WORD.finditer(text):
+            word = m.group(0).lower()
+            starts[position] = m.start()
+            position += len(word)
+            ends[position] = m.end()
+            words.append(word)
+            position += 1
+        return " ".join(words), starts, ends
+
+    def find_names(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Returns non-overlapping (start, end, canonical) name matches in `text`,
+        preferring the longest name at each position. Matches must start and end
+        on word boundaries.
+        """
+        normalised, starts, ends = self._normalise(text)
+        offsets, symbols, targets = self._edge_offsets, self._edge_symbols, self._edge_targets
+        fail, output_link, match_name, match_length = self._fail, self._output_link, self._match_name, self._match_length
+        root = self._root
+        candidates: List[Tuple[int, int, str]] = []
+        length = len(normalised)
+        node = 0
+        for i, char in enumerate(normalised):
+            symbol = _SYMBOLS[char]
+            while True:
+                if not node:
+                    node = root[symbol]
+                    break
+                # A node has few children (the root aside), so they are scanned.
+                for edge in range(offsets[node], offsets[node + 1]):
+                    if symbols[edge] == symbol:
+                        child = targets[edge]
+                        break
+                else:
+                    node = fail[node]
+                    continue
+                node = child
+                break
+            if i + 1 < length and normalised[i + 1] != " ":
+                continue  # not at a word boundary
+            hit = node if match_name[node] else output_link[node]
+            while hit:
+                start = i + 1 - match_length[hit]
+                if start == 0 or normalised[start - 1] == " ":
+                    candidates.append((start, i + 1, self._canonicals[match_name[hit] - 1]))
+                hit = output_link[hit]
+
+        candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+        selected = []
+        last_end = 0
+        for start, end, canonical in candidates:
+            if start >= last_end:
+                selected.append((starts[start], ends[end], canonical))
+                last_end = end
+        return selected
+
+    def extract(self, text: str, extra_names: Sequence[Tuple[int, int, str]] = ()) -> List[DrugMention]:
+        """
+        Finds drug mentions in `text` and attaches the nearest dose and frequency
+        to each. `extra_names` are (start, end, canonical) names found elsewhere
+        (by the analysis model); they are treated like lexicon matches.
+        """
+        names = self.find_names(text)
+        if extra_names:
+            names = sorted(names + list(extra_names))
+        extra = {start for start, _, _ in extra_names}
+        doses = [(m.start(), m.end(), " ".join(m.group(0).split())) for m in _DOSE.finditer(text)]
+        frequencies = [(m.start(), m.end(), " ".join(m.group(0).split())) for m in _FREQUENCY.finditer(text)]
+        dose_for, _ = _attach(names, doses)
+        frequency_for, _ = _attach(names, frequencies)
+
+        mentions = []
+        for i, (start, end, canonical) in enumerate(names):
+            name = " ".join(text[start:end].split())
+            if name.islower():
+                name = name[:1].upper() + name[1:]
+            mentions.append(DrugMention(name, canonical, start, end, dose_for[i], frequency_for[i],
+                                        "model" if start in extra else "lexicon"))
+        return mentions
+
+
+def orphan_doses(text: str, mentions: Sequence[DrugMention]) -> List[Tuple[int, int]]:
+    """
+    Returns (start, end) spans of the text leading up to each dose that no drug
+    mention claimed: most likely the dose of a drug the lexicon lacks. Each
+    span starts at the previous line or sentence break, at most _ATTACH_WINDOW
+    characters before the dose.
+    """
+    doses = [(m.start(), m.end(), "") for m in _DOSE.finditer(text)]
+    _, claimed = _attach([(mention.start, mention.end, mention.canonical) for mention in mentions], doses)
+    spans = []
+    for (dose_start, dose_end, _), taken in zip(doses, claimed):
+        if taken:
+            continue
+        start = max(0, dose_start - _ATTACH_WINDOW)
+        for separator in ("\n", ". ", "; "):
+            found = text.rfind(separator, start, dose_start)
+            if found >= 0:
+                start = found + len(separator)
+        spans.append((start, dose_end))
+    return spans
+
+
+def _attach(names: List[Tuple[int, int, str]],
+            tokens: List[Tuple[int, int, str]]) -> Tuple[List[Optional[str]], List[bool]]:
+    """
+    Assigns each drug mention the first token that follows it before the next
+    mention, falling back to the closest unclaimed token just before it. Both
+    lists are sorted by position, so this is a single merge-style pass.
+    Returns each mention's token and whether each token was claimed.
+    """
+    attached: List[Optional[str]] = [None] * len(names)
+    claimed = [False] * len(tokens)
+    t = 0
+    for i, (start, end, _) in enumerate(names):
+        next_start = names[i + 1][0] if i + 1 < len(names) else None
+        while t < len(tokens) and tokens[t][0] < end:
+            t += 1
+        if (t < len(tokens) and tokens[t][0] - end <= _ATTACH_WINDOW
+                and (next_start is None or tokens[t][0] < next_start)):
+            attached[i] = tokens[t][2]
+            claimed[t] = True
+            continue
+        before = t - 1
+        if before >= 0 and not claimed[before] and start - tokens[before][1] <= _ATTACH_WINDOW // 2:
+            attached[i] = tokens[before][2]
+            claimed[before] = True
+    return attached, claimed
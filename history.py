@@ -0,0 +1,129 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from lexicon import DATA_DIR
+
+# --- Analysis History Store ---
+# Every prescription verification is appended to a local SQLite database, so
+# history survives browser reloads and backend restarts. Listing is keyset
+# paginated on the entry id (newest first), with indexes on the patient name
+# and on the creation time, so fetching one page costs the same however many
+# entries the store holds. Report bodies are only read by the per-entry lookup.
+
+HISTORY_DB_PATH = os.getenv("MEDIGUARD_HISTORY_DB", os.path.join(DATA_DIR, "history.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    patient_key TEXT NOT NULL,
+    patient TEXT NOT NULL,
+    drugs TEXT NOT NULL,
+    report TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_patient ON history (patient_key, id);
+CREATE INDEX IF NOT EXISTS history_created ON history (created_at);
+"""
+
+
+def _patient_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _timestamp(value: float) -> str:
+    return datetime.datetime.fromtimestamp(value).isoformat(timespec="seconds")
+
+
+class HistoryStore:
+    """Append-only analysis history, with one connection per thread."""
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # WAL lets the history page read while analyses are being recorded.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def add(self, patient: Dict[str, Any], drugs: List[Dict[str, Any]], report: str) -> int:
+        """Records one analysis; `report` is the serialised report JSON. Returns the entry id."""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO history (created_at, patient_key, patient, drugs, report) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), _patient_key(patient.get("name", "")), json.dumps(patient), json.dumps(drugs), report),
+            )
+        return cursor.lastrowid
+
+    def page(self, limit: int = 20, before: Optional[int] = None, patient: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns one page of entry summaries (no report bodies), newest first.
+        `before` is the `next_cursor` of the previous page; `patient` matches
+        the start of the patient name, case-insensitively; `since`/`until`
+        bound the creation time (Unix seconds, inclusive/exclusive).
+        """
+        clauses, params = [], []
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        if patient:
+            key = _patient_key(patient)
+            clauses.append("patient_key >= ? AND patient_key < ?")
+            params += [key, key + "\uffff"]
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # One extra row tells whether there is a next page.
+        rows = self._connection().execute(
+            f"SELECT id, created_at, patient, drugs FROM history {where} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        entries = [self._summary(row) for row in rows[:limit]]
+        return {
+            "entries": entries,
+            "next_cursor": entries[-1]["id"] if len(rows) > limit else None,
+        }
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        """Returns one entry with its full report, or None if it does not exist."""
+        row = self._connection().execute(
+            "SELECT id, created_at, patient, drugs, report FROM history WHERE id = ?", (entry_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = self._summary(row)
+        entry["result"] = json.loads(row["report"])
+        return entry
+
+    def clear(self) -> int:
+        """Deletes every entry and returns how many there were."""
+        conn = self._connection()
+        with conn:
+            return conn.execute("DELETE FROM history").rowcount
+
+    @staticmethod
+    def _summary(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "timestamp": _timestamp(row["created_at"]),
+            "patient": json.loads(row["patient"]),
+            "drugs": json.loads(row["drugs"]),
+        }
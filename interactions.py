@@ -0,0 +1,163 @@
+import csv
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from lexicon import DATA_DIR, DrugLexicon, normalize_drug_name
+
+# --- Drug-Drug Interaction Index ---
+# Every canonical drug gets a small integer id. An interacting pair is stored
+# once under a packed 64-bit key (lower id in the high half), and its value packs
+# the severity code with an index into a de-duplicated description table. A
+# prescription with n drugs therefore costs n(n-1)/2 dict lookups, no matter how
+# many pairs the dataset holds.
+
+INTERACTIONS_PATH = os.getenv("MEDIGUARD_INTERACTIONS_PATH", os.path.join(DATA_DIR, "interactions.csv"))
+
+SEVERITY_LEVELS = ("minor", "moderate", "major", "contraindicated")
+_SEVERITY_CODES = {level: code for code, level in enumerate(SEVERITY_LEVELS)}
+_SEVERITY_SHIFT = 28
+_DESCRIPTION_MASK = (1 << _SEVERITY_SHIFT) - 1
+
+
+class Interaction(NamedTuple):
+    """A known interaction between two drugs of a prescription."""
+    drug_a: str
+    drug_b: str
+    severity: str
+    description: str
+
+
+class InteractionIndex:
+    """Hash-indexed adjacency structure over canonical drug pairs."""
+
+    def __init__(self, lexicon: DrugLexicon):
+        self.lexicon = lexicon
+        self._ids: Dict[str, int] = {}
+        self._pairs: Dict[int, int] = {}
+        self._descriptions: List[str] = []
+        self._description_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def _canonical(self, name: str) -> str:
+        return self.lexicon.canonical(name) or normalize_drug_name(name)
+
+    def _intern_description(self, description: str) -> int:
+        description_id = self._description_ids.get(description)
+        if description_id is None:
+            description_id = len(self._descriptions)
+            self._descriptions.append(description)
+            self._description_ids[description] = description_id
+        return description_id
+
+    @staticmethod
+    def _pair_key(id_a: int, id_b: int) -> int:
+        if id_a > id_b:
+            id_a, id_b = id_b, id_a
+        return (id_a << 32) | id_b
+
+    def add(self, drug_a: str, drug_b: str, severity: str, description: str) -> None:
+        """Adds one interaction; a repeated pair keeps its most severe entry."""
+        severity = severity.strip().lower()
+        if severity not in _SEVERITY_CODES:
+            raise ValueError(f"Unknown interaction severity: {severity!r}")
+        ids = []
+        for name in (drug_a, drug_b):
+            canonical = self._canonical(name)
+            ids.append(self._ids.setdefault(canonical, len(self._ids)))
+        if ids[0] == ids[1]:
+            return
+        key = self._pair_key(*ids)
+        code = _SEVERITY_CODES[severity]
+        existing = self._pairs.get(key)
+        if existing is not None and existing >> _SEVERITY_SHIFT >= code:
+            return
+        self._pairs[key] = (code << _SEVERITY_SHIFT) | self._intern_description(description.strip())
+
+    def tables(self) -> Tuple[List[str], Dict[int, int], List[str]]:
+        """The canonical drug names (by id), the packed pairs and the description table."""
+        return list(self._ids), dict(self._pairs), list(self._descriptions)
+
+    def _pair(self, key: int) -> Optional[Tuple[str, str]]:
+        """(severity, description) stored under a packed pair key, if any."""
+        value = self._pairs.get(key)
+        return None if value is None else self._decode(value)
+
+    def _decode(self, value: int) -> Tuple[str, str]:
+        return SEVERITY_LEVELS[value >> _SEVERITY_SHIFT], self._descriptions[value & _DESCRIPTION_MASK]
+
+    def drug_id(self, name: str) -> Optional[int]:
+        """Returns the integer id of a drug, or None if it has no known interactions."""
+        return self._ids.get(self._canonical(name))
+
+    def lookup(self, drug_a: str, drug_b: str) -> Optional[Tuple[str, str]]:
+        """Returns (severity, description) for a pair of drugs, if they interact."""
+        id_a, id_b = self.drug_id(drug_a), self.drug_id(drug_b)
+        if id_a is None or id_b is None or id_a == id_b:
+            return None
+        return self._pair(self._pair_key(id_a, id_b))
+
+    def check(self, names: Sequence[str]) -> List[Interaction]:
+        """
+        Finds all known interactions among `names`, most severe first. A pair is
+        reported once even if a drug appears under several names.
+        """
+        ids = [self.drug_id(name) for name in names]
+        found = []
+        seen = set()
+        for i in range(len(names)):
+            if ids[i] is None:
+                continue
+            for j in range(i + 1, len(names)):
+                if ids[j] is None or ids[i] == ids[j]:
+                    continue
+                key = self._pair_key(ids[i], ids[j])
+                pair = self._pair(key)
+                if pair is not None and key not in seen:
+                    seen.add(key)
+                    found.append(Interaction(names[i], names[j], *pair))
+        found.sort(key=lambda interaction: _SEVERITY_CODES[interaction.severity], reverse=True)
+        return found
+
+
+def load_interaction_index(lexicon: DrugLexicon, path: str = INTERACTIONS_PATH) -> InteractionIndex:
+    """
+    Loads interaction pairs from a CSV file (columns drug_a, drug_b, severity,
+    description) or a JSON file holding a list of objects with the same keys.
+    """
+    index = InteractionIndex(lexicon)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            index.add(row["drug_a"], row["drug_b"], row["severity"], row.get("description") or "")
+    return index
+
+
+def format_interaction_report(names: Sequence[str], interactions: List[Interaction],
+                              unknown: Sequence[str], reported: Sequence[Interaction] = ()) -> str:
+    """
+    Renders interaction findings as the markdown shown in the analysis report.
+    `reported` are interactions of unknown drugs suggested by the analysis model.
+    """
+    if interactions:
+        lines = [f"Found {len(interactions)} interaction(s) among {len(names)} drug(s):\n"]
+        for interaction in interactions:
+            lines.append(f"- **{interaction.severity.upper()}** — {interaction.drug_a} + {interaction.drug_b}: "
+                         f"{interaction.description}")
+        report = "\n".join(lines)
+    else:
+        report = f"Analysis for {len(names)} drug(s): No known interactions found between {', '.join(names)}."
+    if unknown:
+        report += f"\n\n_Not found in the interaction database: {', '.join(unknown)}. Verify these manually._"
+    if reported:
+        lines = ["\n\nPossible interactions suggested by the AI model (not in the database, unverified):\n"]
+        for interaction in reported:
+            lines.append(f"- **{interaction.severity.upper()}** — {interaction.drug_a} + {interaction.drug_b}: "
+                         f"{interaction.description}")
+        report += "\n".join(lines)
+    return report
@@ -0,0 +1,320 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from admission import DEFAULT_LANE, LANE_WEIGHTS
+from lexicon import DATA_DIR
+
+# --- Background Job Queue ---
+# Long-running analyses can be queued instead of holding a request open. Jobs
+# live in a local SQLite database, so queued and unfinished jobs survive a
+# restart. Worker processes claim jobs with a lease: a job whose worker died is
+# claimed again once its lease runs out, up to MAX_ATTEMPTS times. Finished
+# jobs keep their result for JOB_TTL_SECONDS and are then purged. A running job
+# publishes each section of its report as soon as it is ready, so a client
+# polling the job can show the report progressively. Jobs that need the server
+# process's own state (prescription sessions) are run by the server itself:
+# they are stored already running, workers never claim them, and one whose
+# lease runs out (the server stopped) is marked failed.
+#
+# A job runs in the lane of the request that queued it (see admission.py), and
+# workers take queued jobs by the same weighted fair queuing as the analysis
+# executor's LaneScheduler: each job is given a finish tag 1/weight past the
+# later of its lane's last tag and the queue's virtual time (the tag of the
+# last job claimed), and the job with the smallest tag is claimed first. With
+# the default 8:1 weights, a backlog of bulk jobs lets eight interactive jobs
+# through for every one of its own. The tags live in the database, so every
+# worker of every server process shares one schedule.
+
+JOBS_DB_PATH = os.getenv("MEDIGUARD_JOBS_DB", os.path.join(DATA_DIR, "jobs.db"))
+JOB_WORKERS = int(os.getenv("MEDIGUARD_JOB_WORKERS", "2"))
+JOB_TTL_SECONDS = float(os.getenv("MEDIGUARD_JOB_TTL", "3600"))
+JOB_LEASE_SECONDS = float(os.getenv("MEDIGUARD_JOB_LEASE", "120"))
+MAX_ATTEMPTS = 3
+
+JOB_STATES = ("queued", "running", "done", "failed")
+_POLL_INTERVAL = 0.2
+_PURGE_INTERVAL = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    expires_at REAL,
+    sections TEXT,
+    in_process INTEGER NOT NULL DEFAULT 0,
+    lane TEXT NOT NULL DEFAULT 'interactive',
+    tag REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_lanes (
+    lane TEXT PRIMARY KEY,
+    last_tag REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_clock (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    virtual_time REAL NOT NULL
+);
+"""
+# Created once the added columns exist, since they index some of them.
+_INDEXES = """
+DROP INDEX IF EXISTS jobs_claim;
+CREATE INDEX IF NOT EXISTS jobs_fair_claim ON jobs (status, tag, created_at);
+CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (expires_at);
+"""
+# Columns added after the table was first created, added to older databases when they are opened.
+_ADDED_COLUMNS = {"sections": "TEXT", "in_process": "INTEGER NOT NULL DEFAULT 0",
+                  "lane": "TEXT NOT NULL DEFAULT 'interactive'", "tag": "REAL NOT NULL DEFAULT 0"}
+
+
+class JobQueue:
+    """Durable job queue in SQLite, with one connection per thread."""
+
+    def __init__(self, path: str = JOBS_DB_PATH, ttl: float = JOB_TTL_SECONDS, lease: float = JOB_LEASE_SECONDS,
+                 weights: Dict[str, float] = LANE_WEIGHTS):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self.weights = weights
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode, so claims can take the write lock with BEGIN IMMEDIATE.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, declaration in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    try:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {declaration}")
+                    except sqlite3.OperationalError as e:
+                        if "duplicate column" not in str(e):  # another process added it first
+                            raise
+            conn.executescript(_INDEXES)
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], lane: str = DEFAULT_LANE) -> str:
+        """Queues a job in `lane`, behind the jobs with a smaller finish tag."""
+        if lane not in self.weights:
+            lane = DEFAULT_LANE
+        job_id = uuid.uuid4().hex
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            clock = conn.execute("SELECT virtual_time FROM job_clock WHERE id = 0").fetchone()
+            last = conn.execute("SELECT last_tag FROM job_lanes WHERE lane = ?", (lane,)).fetchone()
+            tag = max(clock[0] if clock else 0.0, last[0] if last else 0.0) + 1 / self.weights[lane]
+            conn.execute("INSERT OR REPLACE INTO job_lanes (lane, last_tag) VALUES (?, ?)", (lane, tag))
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, lane, tag) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), time.time(), lane, tag),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def start(self, kind: str, payload: Dict[str, Any], lane: str = DEFAULT_LANE) -> str:
+        """
+        Adds a job the calling process runs itself, already running under a
+        lease; publish renews the lease and finish stores the result.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (id, kind, payload, status, attempts, created_at, started_at, lease_until, in_process, lane)"
+            " VALUES (?, ?, ?, 'running', 1, ?, ?, ?, 1, ?)",
+            (job_id, kind, json.dumps(payload), now, now, now + self.lease, lane),
+        )
+        return job_id
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """
+        Takes the queued job with the smallest finish tag (or a running job
+        whose lease has expired, which keeps its tag), marks it running under
+        a new lease and advances the virtual time to its tag. Returns None if
+        there is none.
+        An expired job the server was running itself is marked failed instead.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts, in_process, tag FROM jobs"
+                " WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY tag, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None and (row["in_process"] or row["attempts"] >= MAX_ATTEMPTS):
+                # Its workers kept dying (give up rather than crash another one), or the server running it stopped.
+                error = ("The server stopped before it finished" if row["in_process"]
+                         else f"Abandoned after {MAX_ATTEMPTS} attempts")
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, expires_at = ? WHERE id = ?",
+                    (error, now, now + self.ttl, row["id"]),
+                )
+                row = None
+            elif row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ?"
+                    " WHERE id = ?",
+                    (now, now + self.lease, row["id"]),
+                )
+                conn.execute(
+                    "INSERT INTO job_clock (id, virtual_time) VALUES (0, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET virtual_time = max(virtual_time, excluded.virtual_time)",
+                    (row["tag"],),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def publish(self, job_id: str, sections: List[Dict[str, Any]]) -> None:
+        """Stores the report sections a running job has finished so far, and renews its lease."""
+        self._connection().execute("UPDATE jobs SET sections = ?, lease_until = ? WHERE id = ? AND status = 'running'",
+                                   (json.dumps(sections), time.time() + self.lease, job_id))
+
+    def finish(self, job_id: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        """Stores a job's serialised result (or its error) and starts its TTL."""
+        now = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL, expires_at = ?"
+            " WHERE id = ?",
+            ("failed" if error is not None else "done", result, error, now, now + self.ttl, job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a job's status, timestamps, payload and the report sections
+        finished so far (or, once done, its result); None if unknown or expired.
+        """
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            return None
+        job = {
+            "id": row["id"],
+            "kind": row["kind"],
+            "lane": row["lane"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "payload": json.loads(row["payload"]),
+        }
+        if row["status"] in ("queued", "running"):
+            job["sections"] = json.loads(row["sections"]) if row["sections"] else []
+        elif row["status"] == "done":
+            job["result"] = json.loads(row["result"])
+        elif row["status"] == "failed":
+            job["error"] = row["error"]
+        return job
+
+    def purge_expired(self) -> int:
+        return self._connection().execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+
+# (payload, publish) -> serialised result; publish takes each report section as it is ready.
+Handler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], str]
+
+
+def _worker_main(path: str, handlers: Dict[str, Handler], stop) -> None:
+    """Worker process loop: claim a job, run its handler, store the result."""
+    queue = JobQueue(path)
+    last_purge = 0.0
+    while not stop.value:
+        if time.monotonic() - last_purge > _PURGE_INTERVAL:
+            queue.purge_expired()
+            last_purge = time.monotonic()
+        job = queue.claim()
+        if job is None:
+            time.sleep(_POLL_INTERVAL)
+            continue
+        handler = handlers.get(job["kind"])
+        sections: List[Dict[str, Any]] = []
+
+        def publish(section: Dict[str, Any], job_id: str = job["id"]) -> None:
+            sections.append(section)
+            queue.publish(job_id, sections)
+
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job['kind']!r}")
+            result = handler(json.loads(job["payload"]), publish)
+        except Exception as e:
+            traceback.print_exc()
+            queue.finish(job["id"], error=f"{type(e).__name__}: {e}")
+        else:
+            queue.finish(job["id"], result=result)
+
+
+class JobWorkers:
+    """
+    A pool of worker processes draining a JobQueue. `handlers` maps a job kind
+    to a module-level function taking the job payload and a `publish` callback,
+    which it calls with each section of the report as soon as it is ready, and
+    returning the serialised result; it must be importable from the worker
+    processes.
+    """
+
+    def __init__(self, handlers: Dict[str, Handler], processes: int = JOB_WORKERS,
+                 path: str = JOBS_DB_PATH):
+        self.handlers = handlers
+        self.processes = processes
+        self.path = path
+        # Spawned rather than forked: the server process has threads (and an event loop) running.
+        self._context = multiprocessing.get_context("spawn")
+        # A lock-free flag: a worker killed while holding an Event's lock would block stop() forever.
+        self._stop = self._context.RawValue("b", 0)
+        self._workers: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        # Opening the queue here creates the schema, so the workers do not race to.
+        JobQueue(self.path).purge_expired()
+        for i in range(self.processes):
+            process = self._context.Process(target=_worker_main, args=(self.path, self.handlers, self._stop),
+                                            name=f"mediguard-job-worker-{i}", daemon=True)
+            process.start()
+            self._workers.append(process)
+
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._workers)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Asks the workers to finish their current job and exit; unfinished jobs are claimed again later."""
+        self._stop.value = 1
+        deadline = time.monotonic() + timeout
+        for process in self._workers:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        self._workers.clear()
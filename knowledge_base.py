@@ -0,0 +1,563 @@
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dosage import DOSE_RANGES_PATH, DoseRangeTable, load_dose_ranges
+from extraction import DrugExtractor
+from interactions import INTERACTIONS_PATH, InteractionIndex, load_interaction_index
+from lexicon import DATA_DIR, LEXICON_PATH, DrugLexicon, load_drug_lexicon, normalize_drug_name
+from suggest import SuggestionIndex
+from symptoms import (CONDITIONS_PATH, SYMPTOM_SYNONYMS_PATH, SYMPTOM_WEIGHTS_PATH, URGENCY_LEVELS, Condition,
+                      SymptomScorer, load_symptom_scorer)
+
+# --- Compiled Knowledge Base ---
+# `python knowledge_base.py compile` turns the reference datasets (drug lexicon,
+# interactions, dose ranges, conditions and symptom weights) into one binary
+# artifact: a header and JSON manifest followed by aligned arrays - string
+# tables (a UTF-8 blob plus offsets), open-addressing hash indexes over them,
+# the numeric tables, and the name extractor's automaton and the suggestion
+# index's trigram postings as flat arrays. The backend maps the file read-only
+# and reads the arrays in place, so loading takes milliseconds and all worker
+# processes share its pages.
+#
+# Each process watches the artifact and loads a newer one next to the current
+# one; the swap is a single reference assignment, so a request keeps using
+# the snapshot it started with. The compiler writes to a temporary file and
+# renames it into place, so a half-written artifact is never loaded. Without
+# an artifact the datasets are parsed from their source files as before.
+
+logger = logging.getLogger("mediguard.knowledge_base")
+
+KNOWLEDGE_BASE_PATH = os.getenv("MEDIGUARD_KNOWLEDGE_BASE", os.path.join(DATA_DIR, "knowledge_base.mgkb"))
+# Seconds between checks for a new artifact; 0 disables reloading.
+RELOAD_INTERVAL = float(os.getenv("MEDIGUARD_KNOWLEDGE_BASE_RELOAD", "2"))
+
+MAGIC = b"MGKB"
+FORMAT_VERSION = 3
+_HEADER = struct.Struct("<4sII")  # magic, format version, manifest length
+_ALIGNMENT = 64
+# memoryview formats of the array dtypes; arrays are stored in native byte order.
+_FORMATS = {"uint8": "B", "int32": "i", "uint32": "I", "uint64": "Q", "float32": "f", "float64": "d"}
+_MIN_SLOTS = 8
+# Arrays of the name extractor's automaton, in DrugExtractor.from_tables order.
+_EXTRACTOR_TABLES = ("edge_offsets", "edge_symbols", "edge_targets", "fail", "output_link", "match_name",
+                     "match_length")
+
+
+class KnowledgeBaseError(Exception):
+    """The artifact is missing, truncated, or was written by an incompatible compiler."""
+
+
+def _int_hash(key: int) -> int:
+    # Fibonacci hashing; the high half of the product mixes every input bit.
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32
+
+
+def _hash_slots(hashes: Sequence[int]) -> np.ndarray:
+    """Open-addressing table (linear probing, at most half full) of entry id + 1 per slot; 0 marks a free slot."""
+    size = _MIN_SLOTS
+    while size < 2 * len(hashes):
+        size *= 2
+    mask = size - 1
+    slots = np.zeros(size, dtype=np.uint32)
+    for entry, value in enumerate(hashes):
+        position = value & mask
+        while slots[position]:
+            position = (position + 1) & mask
+        slots[position] = entry + 1
+    return slots
+
+
+class StringTable:
+    """Strings stored back to back in one UTF-8 blob, addressed by an offsets array."""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, i: int) -> memoryview:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class HashIndex:
+    """Maps the strings of a StringTable to their position, or to `values[position]`."""
+
+    def __init__(self, keys: StringTable, slots: memoryview, values: Optional[memoryview] = None):
+        self._keys = keys
+        self._slots = slots
+        self._mask = len(slots) - 1
+        self._values = values
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        data = key.encode("utf-8")
+        slots = self._slots
+        position = zlib.crc32(data) & self._mask
+        while True:
+            entry = slots[position]
+            if not entry:
+                return default
+            entry -= 1
+            if self._keys.raw(entry) == data:
+                return entry if self._values is None else self._values[entry]
+            position = (position + 1) & self._mask
+
+
+class MappedDrugLexicon(DrugLexicon):
+    """A read-only DrugLexicon over the tables of a compiled knowledge base."""
+
+    def __init__(self, names: StringTable, index: HashIndex, canonical: memoryview, display: StringTable):
+        self._names = names
+        self._index = index
+        self._canonical_ids = canonical
+        self._displays = display
+
+    def add(self, name: str, canonical: str) -> None:
+        raise TypeError("A compiled lexicon is read-only; edit the source data and recompile")
+
+    def canonical(self, name: str) -> Optional[str]:
+        entry = self._index.get(normalize_drug_name(name))
+        return None if entry is None else self._names[self._canonical_ids[entry]]
+
+    def _display_name(self, key: str) -> str:
+        entry = self._index.get(key)
+        return key if entry is None else self._displays[entry]
+
+    def names(self) -> List[str]:
+        return list(self._names)
+
+    def items(self):
+        return ((self._names[i], self._names[self._canonical_ids[i]]) for i in range(len(self._names)))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class MappedInteractionIndex(InteractionIndex):
+    """A read-only InteractionIndex whose drug ids and pairs live in hash tables of a compiled knowledge base."""
+
+    def __init__(self, lexicon: DrugLexicon, drugs: HashIndex, pair_slots: memoryview, pair_keys: memoryview,
+                 pair_values: memoryview, descriptions: StringTable):
+        self.lexicon = lexicon
+        self._drugs = drugs
+        self._pair_slots = pair_slots
+        self._pair_mask = len(pair_slots) - 1
+        self._pair_keys = pair_keys
+        self._pair_values = pair_values
+        self._descriptions = descriptions
+
+    def __len__(self) -> int:
+        return len(self._pair_keys)
+
+    def add(self, drug_a: str, drug_b: str, severity: str, description: str) -> None:
+        raise TypeError("A compiled interaction index is read-only; edit the source data and recompile")
+
+    def drug_id(self, name: str) -> Optional[int]:
+        return self._drugs.get(self._canonical(name))
+
+    def _pair(self, key: int) -> Optional[Tuple[str, str]]:
+        position = _int_hash(key) & self._pair_mask
+        while True:
+            entry = self._pair_slots[position]
+            if not entry:
+                return None
+            if self._pair_keys[entry - 1] == key:
+                return self._decode(self._pair_values[entry - 1])
+            position = (position + 1) & self._pair_mask
+
+
+class KnowledgeBase:
+    """
+    One consistent snapshot of the reference data, plus the name extractor and
+    suggestion index over its lexicon. A compiled artifact carries both; when
+    the data was parsed from the source files they are built on first use.
+    """
+
+    def __init__(self, version: str, lexicon: DrugLexicon, interactions: InteractionIndex, doses: DoseRangeTable,
+                 symptoms: SymptomScorer, source: str, artifact: Optional["_Artifact"] = None,
+                 extractor: Optional[DrugExtractor] = None, suggestions: Optional[SuggestionIndex] = None):
+        self.version = version
+        self.source = source
+        self._artifact = artifact
+        self.lexicon = lexicon
+        self.interactions = interactions
+        self.doses = doses
+        self.symptoms = symptoms
+        self._extractor = extractor
+        self._suggestions = suggestions
+        self._build_lock = threading.Lock()
+        self.loaded_at = time.time()
+
+    @property
+    def extractor(self) -> DrugExtractor:
+        if self._extractor is None:
+            with self._build_lock:
+                if self._extractor is None:
+                    self._extractor = DrugExtractor(self.lexicon)
+        return self._extractor
+
+    @property
+    def suggestions(self) -> SuggestionIndex:
+        if self._suggestions is None:
+            with self._build_lock:
+                if self._suggestions is None:
+                    self._suggestions = SuggestionIndex(self.lexicon)
+        return self._suggestions
+
+    def touch(self) -> int:
+        """
+        Faults in every page of the mapped artifact, so the first lookups do not
+        wait for the disk. Returns the bytes touched; 0 when the data was parsed
+        from the source files and already lives in memory.
+        """
+        return 0 if self._artifact is None else self._artifact.touch()
+
+
+def source_version(paths: Sequence[str]) -> str:
+    """Content hash of the source datasets; a compiled artifact carries the version of its sources."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(hashlib.blake2b(f.read(), digest_size=16).digest())
+        else:
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_sources(lexicon_path: str = LEXICON_PATH, interactions_path: str = INTERACTIONS_PATH,
+                 dose_ranges_path: str = DOSE_RANGES_PATH, conditions_path: str = CONDITIONS_PATH,
+                 weights_path: str = SYMPTOM_WEIGHTS_PATH, synonyms_path: str = SYMPTOM_SYNONYMS_PATH) -> KnowledgeBase:
+    """Parses the reference datasets from their source files."""
+    paths = [lexicon_path, interactions_path, dose_ranges_path, conditions_path, weights_path, synonyms_path]
+    lexicon = load_drug_lexicon(lexicon_path)
+    return KnowledgeBase(source_version(paths), lexicon, load_interaction_index(lexicon, interactions_path),
+                         load_dose_ranges(lexicon, dose_ranges_path),
+                         load_symptom_scorer(weights_path, synonyms_path, conditions_path), "sources")
+
+
+# --- Compiler ---
+
+class _ArtifactWriter:
+    def __init__(self):
+        self.sections: Dict[str, np.ndarray] = {}
+
+    def array(self, name: str, values, dtype) -> None:
+        self.sections[name] = np.ascontiguousarray(values, dtype=dtype)
+
+    def strings(self, name: str, strings: Sequence[str], indexed: bool = False) -> None:
+        """Adds a string table, and with `indexed` a hash index over it."""
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        self.array(f"{name}.blob", np.frombuffer(b"".join(encoded), dtype=np.uint8), np.uint8)
+        self.array(f"{name}.offsets", offsets, np.uint32)
+        if indexed:
+            if len(set(encoded)) != len(encoded):
+                raise ValueError(f"Duplicate keys in {name}")
+            self.array(f"{name}.slots", _hash_slots([zlib.crc32(e) for e in encoded]), np.uint32)
+
+    def write(self, path: str, manifest: Dict[str, Any]) -> None:
+        """Writes the artifact to a temporary file and renames it over `path`."""
+        layout, offset = {}, 0
+        for name, array in self.sections.items():
+            offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+            layout[name] = {"offset": offset, "dtype": array.dtype.name, "shape": list(array.shape)}
+            offset += array.nbytes
+        manifest = {**manifest, "byteorder": sys.byteorder, "sections": layout}
+        encoded = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+        data_start = -(-(_HEADER.size + len(encoded)) // _ALIGNMENT) * _ALIGNMENT
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".knowledge_base-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+                f.write(encoded)
+                for name, array in self.sections.items():
+                    f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+                    f.write(array.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def compile_knowledge_base(output: str = KNOWLEDGE_BASE_PATH, lexicon_path: str = LEXICON_PATH,
+                           interactions_path: str = INTERACTIONS_PATH, dose_ranges_path: str = DOSE_RANGES_PATH,
+                           conditions_path: str = CONDITIONS_PATH, weights_path: str = SYMPTOM_WEIGHTS_PATH,
+                           synonyms_path: str = SYMPTOM_SYNONYMS_PATH) -> Dict[str, Any]:
+    """Compiles the source datasets into an artifact at `output` and returns its manifest."""
+    kb = load_sources(lexicon_path, interactions_path, dose_ranges_path, conditions_path, weights_path,
+                      synonyms_path)
+    writer = _ArtifactWriter()
+
+    names = kb.lexicon.names()
+    name_ids = {name: i for i, name in enumerate(names)}
+    writer.strings("lexicon.names", names, indexed=True)
+    writer.array("lexicon.canonical", [name_ids[canonical] for _, canonical in kb.lexicon.items()], np.uint32)
+    writer.strings("lexicon.display", [kb.lexicon.display(name) for name in names])
+
+    drugs, pairs, descriptions = kb.interactions.tables()
+    writer.strings("interactions.drugs", drugs, indexed=True)
+    pair_keys = list(pairs)
+    writer.array("interactions.pair_keys", pair_keys, np.uint64)
+    writer.array("interactions.pair_values", [pairs[key] for key in pair_keys], np.uint32)
+    writer.array("interactions.pair_slots", _hash_slots([_int_hash(key) for key in pair_keys]), np.uint32)
+    writer.strings("interactions.descriptions", descriptions)
+
+    canonicals, *automaton = kb.extractor.tables()
+    writer.array("extractor.canonicals", [name_ids[canonical] for canonical in canonicals], np.uint32)
+    for name, array in zip(_EXTRACTOR_TABLES, automaton):
+        writer.array(f"extractor.{name}", array, array.dtype)
+
+    sorted_names, lengths, grams, posting_offsets, postings = kb.suggestions.tables()
+    writer.strings("suggest.names", sorted_names)
+    writer.array("suggest.lengths", lengths, np.int32)
+    writer.strings("suggest.grams", grams, indexed=True)
+    writer.array("suggest.posting_offsets", posting_offsets, np.uint32)
+    writer.array("suggest.postings", postings, np.int32)
+
+    dose_drugs, dose_keys, dose_units, min_single, max_single, max_daily = kb.doses.tables()
+    writer.strings("doses.drugs", dose_drugs, indexed=True)
+    writer.array("doses.keys", dose_keys, np.uint32)
+    writer.array("doses.units", dose_units, np.uint8)
+    writer.array("doses.min_single", min_single, np.float64)
+    writer.array("doses.max_single", max_single, np.float64)
+    writer.array("doses.max_daily", max_daily, np.float64)
+
+    conditions = kb.symptoms.conditions
+    writer.strings("conditions.names", [c.name for c in conditions])
+    writer.array("conditions.urgency", [URGENCY_LEVELS.index(c.urgency) for c in conditions], np.uint8)
+    writer.strings("conditions.descriptions", [c.description for c in conditions])
+    writer.strings("conditions.recommendations", ["\n".join(c.recommendations) for c in conditions])
+    vocabulary, columns, weights = kb.symptoms.tables()
+    writer.strings("symptoms.vocabulary", vocabulary)
+    writer.strings("symptoms.keys", list(columns), indexed=True)
+    writer.array("symptoms.columns", list(columns.values()), np.uint32)
+    writer.array("symptoms.weights", weights, np.float32)
+
+    manifest = {
+        "version": kb.version,
+        "compiled_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "counts": {"drug_names": len(names), "interactions": len(pair_keys), "dose_ranges": len(dose_keys),
+                   "conditions": len(conditions), "symptoms": len(vocabulary)},
+    }
+    writer.write(output, manifest)
+    return manifest
+
+
+# --- Loader ---
+
+class _Names:
+    """The strings of a StringTable picked by an id array, decoded on access."""
+
+    def __init__(self, strings: StringTable, ids: memoryview):
+        self._strings = strings
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, i: int) -> str:
+        return self._strings[self._ids[i]]
+
+
+class _Artifact:
+    """A read-only mapping of an artifact, handing out zero-copy views of its sections."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise KnowledgeBaseError(f"{path} is too short to be a knowledge base")
+        magic, format_version, manifest_size = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise KnowledgeBaseError(f"{path} is not a knowledge base")
+        if format_version != FORMAT_VERSION:
+            raise KnowledgeBaseError(f"{path} has format {format_version}; this backend reads format "
+                                     f"{FORMAT_VERSION}, so recompile it")
+        self.manifest = json.loads(self._map[_HEADER.size:_HEADER.size + manifest_size])
+        if self.manifest["byteorder"] != sys.byteorder:
+            raise KnowledgeBaseError(f"{path} was compiled on a {self.manifest['byteorder']}-endian machine")
+        self._data_start = -(-(_HEADER.size + manifest_size) // _ALIGNMENT) * _ALIGNMENT
+        self._view = memoryview(self._map)
+        for name, section in self.manifest["sections"].items():
+            end = self._data_start + section["offset"] + int(np.prod(section["shape"])) * np.dtype(section["dtype"]).itemsize
+            if end > len(self._map):
+                raise KnowledgeBaseError(f"{path} is truncated (section {name})")
+
+    def touch(self) -> int:
+        if hasattr(mmap, "MADV_WILLNEED"):
+            self._map.madvise(mmap.MADV_WILLNEED)
+        for offset in range(0, len(self._map), mmap.PAGESIZE):
+            self._map[offset]
+        return len(self._map)
+
+    def view(self, name: str) -> memoryview:
+        section = self.manifest["sections"][name]
+        start = self._data_start + section["offset"]
+        size = int(np.prod(section["shape"])) * np.dtype(section["dtype"]).itemsize
+        return self._view[start:start + size].cast(_FORMATS[section["dtype"]])
+
+    def array(self, name: str) -> np.ndarray:
+        section = self.manifest["sections"][name]
+        return np.frombuffer(self.view(name), dtype=section["dtype"]).reshape(section["shape"])
+
+    def strings(self, name: str) -> StringTable:
+        return StringTable(self.view(f"{name}.blob"), self.view(f"{name}.offsets"))
+
+    def index(self, name: str, values: Optional[str] = None) -> HashIndex:
+        return HashIndex(self.strings(name), self.view(f"{name}.slots"), self.view(values) if values else None)
+
+
+def load_knowledge_base(path: str = KNOWLEDGE_BASE_PATH) -> KnowledgeBase:
+    """Maps a compiled artifact; only the small condition list is copied into Python objects."""
+    artifact = _Artifact(path)
+    names = artifact.strings("lexicon.names")
+    lexicon = MappedDrugLexicon(names, artifact.index("lexicon.names"), artifact.view("lexicon.canonical"),
+                                artifact.strings("lexicon.display"))
+    interactions = MappedInteractionIndex(
+        lexicon, artifact.index("interactions.drugs"), artifact.view("interactions.pair_slots"),
+        artifact.view("interactions.pair_keys"), artifact.view("interactions.pair_values"),
+        artifact.strings("interactions.descriptions"),
+    )
+    doses = DoseRangeTable(artifact.index("doses.drugs"), artifact.array("doses.keys"), artifact.array("doses.units"),
+                           artifact.array("doses.min_single"), artifact.array("doses.max_single"),
+                           artifact.array("doses.max_daily"))
+    conditions = [
+        Condition(name, URGENCY_LEVELS[urgency], description, tuple(filter(None, recommendations.split("\n"))))
+        for name, urgency, description, recommendations in zip(
+            artifact.strings("conditions.names"), artifact.view("conditions.urgency"),
+            artifact.strings("conditions.descriptions"), artifact.strings("conditions.recommendations"))
+    ]
+    symptoms = SymptomScorer.from_tables(conditions, artifact.strings("symptoms.vocabulary"),
+                                         artifact.index("symptoms.keys", "symptoms.columns"),
+                                         artifact.array("symptoms.weights"))
+    extractor = DrugExtractor.from_tables(
+        _Names(names, artifact.view("extractor.canonicals")),
+        *(artifact.array(f"extractor.{name}") for name in _EXTRACTOR_TABLES))
+    suggestions = SuggestionIndex.from_tables(
+        lexicon, artifact.strings("suggest.names"), artifact.array("suggest.lengths"), artifact.index("suggest.grams"),
+        artifact.view("suggest.posting_offsets"), artifact.array("suggest.postings"))
+    return KnowledgeBase(artifact.manifest["version"], lexicon, interactions, doses, symptoms, path, artifact,
+                         extractor, suggestions)
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class KnowledgeBaseWatcher:
+    """
+    Holds the current KnowledgeBase of this process and replaces it when the
+    artifact at `path` changes. Callers take one snapshot per operation with
+    `current()` and use it throughout, so they never mix two versions.
+    """
+
+    def __init__(self, path: str = KNOWLEDGE_BASE_PATH, interval: float = RELOAD_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self._signature = _signature(path)
+        self._current = self._load(self._signature)
+        self._lock = threading.Lock()
+        self._watcher_pid: Optional[int] = None
+
+    def _load(self, signature) -> KnowledgeBase:
+        return load_sources() if signature is None else load_knowledge_base(self.path)
+
+    def current(self) -> KnowledgeBase:
+        if self._watcher_pid != os.getpid() and self.interval > 0:
+            self._start_watching()
+        return self._current
+
+    def _start_watching(self) -> None:
+        # Started on first use, and again in a forked child, which inherits no threads.
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch, name="knowledge-base-watcher", daemon=True).start()
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Could not reload the knowledge base from %s", self.path)
+
+    def refresh(self) -> bool:
+        """Loads the artifact if it changed since the last check; returns whether a new one was swapped in."""
+        signature = _signature(self.path)
+        if signature == self._signature:
+            return False
+        # Recorded first, so a broken artifact is reported once rather than on every check.
+        self._signature = signature
+        knowledge_base = self._load(signature)
+        # Faulted in before the swap, so requests never see a cold artifact.
+        knowledge_base.touch()
+        self._current = knowledge_base
+        self.reloads += 1
+        logger.info("Loaded knowledge base %s from %s", knowledge_base.version, knowledge_base.source)
+        return True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compile the reference datasets into a knowledge base artifact.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="Compile the source datasets into one binary artifact.")
+    compile_parser.add_argument("--output", default=KNOWLEDGE_BASE_PATH, help="Artifact to write.")
+    compile_parser.add_argument("--lexicon", default=LEXICON_PATH)
+    compile_parser.add_argument("--interactions", default=INTERACTIONS_PATH)
+    compile_parser.add_argument("--dose-ranges", default=DOSE_RANGES_PATH)
+    compile_parser.add_argument("--conditions", default=CONDITIONS_PATH)
+    compile_parser.add_argument("--symptom-weights", default=SYMPTOM_WEIGHTS_PATH)
+    compile_parser.add_argument("--symptom-synonyms", default=SYMPTOM_SYNONYMS_PATH)
+    info_parser = commands.add_parser("info", help="Print the manifest of a compiled artifact.")
+    info_parser.add_argument("path", nargs="?", default=KNOWLEDGE_BASE_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        started = time.perf_counter()
+        manifest = compile_knowledge_base(args.output, args.lexicon, args.interactions, args.dose_ranges,
+                                          args.conditions, args.symptom_weights, args.symptom_synonyms)
+        counts = ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in manifest["counts"].items())
+        print(f"Compiled knowledge base {manifest['version']} ({counts}) into {args.output} "
+              f"in {time.perf_counter() - started:.2f}s")
+    elif args.command == "info":
+        manifest = _Artifact(args.path).manifest
+        print(json.dumps({key: value for key, value in manifest.items() if key != "sections"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from cache import make_etag
+from drug_labels import LABEL_SECTIONS, label_row
+from lexicon import DATA_DIR
+
+# --- Live openFDA Label Proxy ---
+# GET /drugs/label/{name} looks a drug's current label up on openFDA for every
+# frontend session at once. Answers are kept in a small in-memory LRU tier in
+# front of a SQLite tier that survives restarts, and are revalidated upstream
+# once they are older than LABEL_TTL_SECONDS. Concurrent lookups of the same
+# name share one upstream request, and upstream requests are bounded in number
+# and rate. When openFDA fails, or the rate limit is used up, an expired entry
+# no older than LABEL_MAX_STALE_SECONDS is served instead of an error.
+# The proxy is only used from the event loop thread, so it needs no lock; the
+# limits therefore apply per backend worker process.
+
+OPENFDA_LABEL_URL = os.getenv("MEDIGUARD_OPENFDA_URL", "https://api.fda.gov/drug/label.json")
+OPENFDA_API_KEY = os.getenv("MEDIGUARD_OPENFDA_API_KEY")
+LABEL_CACHE_DB_PATH = os.getenv("MEDIGUARD_LABEL_CACHE_DB", os.path.join(DATA_DIR, "label_cache.db"))
+LABEL_CACHE_ENTRIES = int(os.getenv("MEDIGUARD_LABEL_CACHE_ENTRIES", "512"))
+LABEL_TTL_SECONDS = float(os.getenv("MEDIGUARD_LABEL_TTL", "86400"))
+LABEL_MAX_STALE_SECONDS = float(os.getenv("MEDIGUARD_LABEL_MAX_STALE", str(7 * 86400)))
+# Without an API key openFDA allows 240 requests a minute.
+UPSTREAM_CONCURRENCY = int(os.getenv("MEDIGUARD_OPENFDA_CONCURRENCY", "4"))
+UPSTREAM_RATE = float(os.getenv("MEDIGUARD_OPENFDA_RATE", "4"))
+UPSTREAM_TIMEOUT = float(os.getenv("MEDIGUARD_OPENFDA_TIMEOUT", "10"))
+
+LABEL_FIELDS = ("set_id", "effective_time", "brand_name", "generic_name") + LABEL_SECTIONS
+LOOKUP_SOURCES = ("memory", "disk", "upstream", "stale")
+_WORD = re.compile(r"[\w-]+", re.UNICODE)
+_PURGE_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    key TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when openFDA cannot be reached and no usable cached label exists."""
+
+
+class LabelEntry(NamedTuple):
+    """A serialised answer (a label, or a 404 when openFDA has none) and when it was fetched."""
+    status: int
+    body: bytes
+    etag: str
+    fetched_at: float
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class LabelResult(NamedTuple):
+    entry: LabelEntry
+    source: str  # one of LOOKUP_SOURCES
+
+
+def label_query(name: str) -> str:
+    """Normalises a drug name to the words searched for, which is also the cache key."""
+    return " ".join(_WORD.findall(name.lower()))
+
+
+def make_entry(status: int, payload: Dict, fetched_at: Optional[float] = None) -> LabelEntry:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return LabelEntry(status, body, make_etag(body), time.time() if fetched_at is None else fetched_at)
+
+
+class LabelDiskCache:
+    """The persistent tier: one SQLite row per drug name, with one connection per thread."""
+
+    def __init__(self, path: str = LABEL_CACHE_DB_PATH, retention: float = LABEL_TTL_SECONDS + LABEL_MAX_STALE_SECONDS):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[LabelEntry]:
+        row = self._connection().execute(
+            "SELECT status, body, fetched_at FROM labels WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, body, fetched_at = row
+        return LabelEntry(status, bytes(body), make_etag(bytes(body)), fetched_at)
+
+    def recent(self, limit: int) -> List[Tuple[str, LabelEntry]]:
+        """The `limit` most recently fetched entries, newest first."""
+        rows = self._connection().execute(
+            "SELECT key, status, body, fetched_at FROM labels ORDER BY fetched_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [(key, LabelEntry(status, bytes(body), make_etag(bytes(body)), fetched_at))
+                for key, status, body, fetched_at in rows]
+
+    def put(self, key: str, entry: LabelEntry) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO labels (key, status, body, fetched_at) VALUES (?, ?, ?, ?)",
+                (key, entry.status, entry.body, entry.fetched_at),
+            )
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                # Entries too old to be served even as stale are only taking up space.
+                conn.execute("DELETE FROM labels WHERE fetched_at < ?", (time.time() - self.retention,))
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second, in bursts of up to `burst`."""
+
+    def __init__(self, rate: float = UPSTREAM_RATE, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = max(1.0, rate if burst is None else burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Seconds until a request may be sent; 0 if one may be sent now."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self._tokens -= 1
+
+
+class LabelProxy:
+    """Tiered, coalescing cache in front of the openFDA drug label endpoint."""
+
+    def __init__(self, url: str = OPENFDA_LABEL_URL, disk: Optional[LabelDiskCache] = None,
+                 max_entries: int = LABEL_CACHE_ENTRIES, ttl: float = LABEL_TTL_SECONDS,
+                 max_stale: float = LABEL_MAX_STALE_SECONDS, concurrency: int = UPSTREAM_CONCURRENCY,
+                 rate: float = UPSTREAM_RATE, timeout: float = UPSTREAM_TIMEOUT,
+                 api_key: Optional[str] = OPENFDA_API_KEY, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self.disk = LabelDiskCache() if disk is None else disk
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.api_key = api_key
+        self.transport = transport  # e.g. an httpx.MockTransport standing in for openFDA
+        self._memory: "OrderedDict[str, LabelEntry]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[LabelResult]"] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._limiter = RateLimiter(rate)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.lookups: Counter = Counter()
+        self.upstream: Counter = Counter()
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    async def get(self, name: str) -> LabelResult:
+        """
+        Returns the label answer for `name`, from the freshest tier that has
+        it. Raises UpstreamUnavailable if it has to be fetched and cannot be.
+        """
+        key = label_query(name)
+        result = await self._lookup(key)
+        self.lookups[result.source] += 1
+        return result
+
+    async def _lookup(self, key: str) -> LabelResult:
+        entry = self._memory.get(key)
+        source = "memory"
+        if entry is None:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            source = "disk"
+            if entry is not None:
+                self._remember(key, entry)
+        else:
+            self._memory.move_to_end(key)
+        if entry is not None and entry.age() < self.ttl:
+            return LabelResult(entry, source)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(key, entry))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._settled(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded, so a client that disconnects does not cancel the lookup the others wait for.
+        return await asyncio.shield(task)
+
+    async def preload(self) -> int:
+        """Fills the in-memory tier with the most recently fetched labels still servable; returns how many."""
+        entries = await asyncio.to_thread(self.disk.recent, self.max_entries)
+        count = 0
+        for key, entry in reversed(entries):  # oldest first, so the newest end up most recently used
+            if key not in self._memory and self._usable(entry):
+                self._remember(key, entry)
+                count += 1
+        return count
+
+    def _settled(self, key: str, task: "asyncio.Task[LabelResult]") -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved even if every waiter has gone
+
+    def _usable(self, entry: Optional[LabelEntry]) -> bool:
+        return entry is not None and entry.age() < self.ttl + self.max_stale
+
+    async def _refresh(self, key: str, stale: Optional[LabelEntry]) -> LabelResult:
+        if self._usable(stale) and (self._slots.locked() or self._limiter.delay() > 0):
+            # openFDA is as busy as we allow; an old answer now beats a queued one.
+            return LabelResult(stale, "stale")
+        try:
+            entry = await asyncio.wait_for(self._fetch(key), self.timeout)
+        except (UpstreamUnavailable, httpx.HTTPError, asyncio.TimeoutError, ValueError) as e:
+            self.upstream["error"] += 1
+            if self._usable(stale):
+                return LabelResult(stale, "stale")
+            if isinstance(e, UpstreamUnavailable):
+                raise
+            raise UpstreamUnavailable(f"openFDA lookup failed: {type(e).__name__}: {e}") from e
+        self._remember(key, entry)
+        await asyncio.to_thread(self.disk.put, key, entry)
+        return LabelResult(entry, "upstream")
+
+    async def _fetch(self, key: str) -> LabelEntry:
+        if not key:
+            return make_entry(404, {"detail": "No drug name given"})
+        async with self._slots:
+            await self._limiter.acquire()
+            params = {"search": f'openfda.brand_name:"{key}" openfda.generic_name:"{key}"', "limit": "1"}
+            if self.api_key:
+                params["api_key"] = self.api_key
+            response = await self._http().get(self.url, params=params)
+        if response.status_code == 404:
+            # openFDA answers 404 when nothing matches, which is worth caching too.
+            self.upstream["not_found"] += 1
+            return make_entry(404, {"detail": f"No openFDA label found for '{key}'"})
+        if response.status_code != 200:
+            raise UpstreamUnavailable(f"openFDA answered {response.status_code}")
+        results = response.json().get("results") or []
+        row = label_row(results[0]) if results else None
+        if row is None:
+            self.upstream["not_found"] += 1
+            return make_entry(404, {"detail": f"No openFDA label found for '{key}'"})
+        self.upstream["ok"] += 1
+        return make_entry(200, {"query": key, "label": dict(zip(LABEL_FIELDS, row))})
+
+    def _remember(self, key: str, entry: LabelEntry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, limits=httpx.Limits(max_connections=self.concurrency),
+                headers={"Accept": "application/json"}, transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
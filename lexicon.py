@@ -0,0 +1,70 @@
+import csv
+import os
+import re
+from typing import Dict, List, Optional
+
+# --- Drug Name Lexicon ---
+# Maps every known brand and generic spelling of a drug to one canonical name,
+# which the analysis engines use as the drug's identity.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+LEXICON_PATH = os.getenv("MEDIGUARD_LEXICON_PATH", os.path.join(DATA_DIR, "drug_lexicon.csv"))
+
+_NON_NAME_CHARS = re.compile(r"[^a-z0-9\- ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_drug_name(name: str) -> str:
+    """Lower-cases a drug name and collapses punctuation and whitespace."""
+    name = _NON_NAME_CHARS.sub(" ", name.lower())
+    return _SPACES.sub(" ", name).strip()
+
+
+class DrugLexicon:
+    """Lookup table from normalised drug names (brand or generic) to canonical names."""
+
+    def __init__(self):
+        self._canonical: Dict[str, str] = {}
+        self._display: Dict[str, str] = {}
+
+    def add(self, name: str, canonical: str) -> None:
+        key = normalize_drug_name(name)
+        if not key:
+            return
+        canonical = normalize_drug_name(canonical)
+        self._canonical[key] = canonical
+        self._canonical.setdefault(canonical, canonical)
+        self._display.setdefault(key, " ".join(name.split()))
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Returns the canonical name for `name`, or None if it is not in the lexicon."""
+        return self._canonical.get(normalize_drug_name(name))
+
+    def display(self, name: str) -> str:
+        """The spelling a name was first added with (e.g. "Klor-Con" for "klor-con")."""
+        key = normalize_drug_name(name)
+        display = self._display_name(key)
+        return display[:1].upper() + display[1:] if display.islower() else display
+
+    def _display_name(self, key: str) -> str:
+        return self._display.get(key, key)
+
+    def names(self) -> List[str]:
+        """All normalised names (brand and generic) in the lexicon."""
+        return list(self._canonical)
+
+    def items(self):
+        """(normalised name, canonical name) pairs."""
+        return self._canonical.items()
+
+    def __len__(self) -> int:
+        return len(self._canonical)
+
+
+def load_drug_lexicon(path: str = LEXICON_PATH) -> DrugLexicon:
+    """Loads a CSV lexicon with `name` and `canonical` columns."""
+    lexicon = DrugLexicon()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            lexicon.add(row["name"], row.get("canonical") or row["name"])
+    return lexicon
@@ -1,8 +1,41 @@
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Any, Awaitable, Callable, Literal, NamedTuple, Optional, Set, Tuple
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import json
+import os
 import time
+import traceback
+
+from admission import LANES, Admission, AdmissionMiddleware, current_lane
+from cache import CachedResult, ResultCache
+from dosage import DoseCheck, age_band, format_dose_report, parse_dosage
+from drug_labels import LabelStore, LabelStoreUnavailable
+from executor import QueueFullError, analysis_executor
+from history import HistoryStore
+from jobs import JOB_WORKERS, JobQueue, JobWorkers
+from label_proxy import LOOKUP_SOURCES, LabelProxy, UpstreamUnavailable
+from extraction import orphan_doses
+from interactions import SEVERITY_LEVELS, Interaction, format_interaction_report
+from knowledge_base import KnowledgeBaseWatcher
+from lexicon import normalize_drug_name
+from metrics import MetricsMiddleware, TimedRoute, metrics_registry, timed_phase
+from profiling import (PROFILING_ENABLED, PROFILE_HEADER, PROFILE_TOKEN, ProfileStore, ProfilingMiddleware,
+                       current_profile, token_matches)
+from providers import Question, model_client
+from sessions import PrescriptionSession, SessionDelta, SessionDrug, SessionStore, pair_key
+from symptoms import MIN_SCORE
+from streaming import DuplexStreamingResponse, RecordError, StreamFormatError, iter_json_records, ordered_map, sse_event
+from warmup import COMPONENT_STATES, Readiness
+
+# How many batch records may be analysed concurrently per batch request.
+BATCH_WINDOW = int(os.getenv("MEDIGUARD_BATCH_WINDOW", str(analysis_executor.workers)))
+# How long a batch record waits for room in a full analysis queue before it fails with 503.
+BATCH_QUEUE_WAIT = float(os.getenv("MEDIGUARD_BATCH_QUEUE_WAIT", "30"))
 
 # --- Pydantic Models for Data Validation ---
 # These models ensure the data sent to the API has the correct structure.
@@ -28,13 +61,508 @@ class SymptomPayload(BaseModel):
     """Defines the structure for the symptom analysis payload."""
     symptoms: List[str]
 
+class JobRequest(BaseModel):
+    """Defines the structure for queuing an analysis as a background job."""
+    kind: Literal["prescription", "symptoms", "session"]
+    payload: Dict[str, Any]
+
+class SessionPayload(BaseModel):
+    """Defines the structure for starting a prescription session."""
+    patient: Patient
+    drugs: List[Drug] = []
+
+class SessionEdit(BaseModel):
+    """Defines the structure for editing the drug list of a prescription session."""
+    upsert: List[Drug] = []  # drugs to add, or to give a new dosage
+    remove: List[str] = []  # names of drugs to take out
+
+class SessionJobPayload(BaseModel):
+    """Defines the structure for analysing a prescription as an edit of a session."""
+    session: Optional[str] = None  # the session to edit; a new one is started if absent or expired
+    patient: Patient
+    drugs: List[Drug]
+
+class SymptomBatchPayload(BaseModel):
+    """Defines the structure for scoring many symptom sets in one request."""
+    symptom_sets: List[List[str]] = Field(..., max_length=10000)
+    top_k: int = Field(3, ge=1, le=10)
+
+
+# --- Canonical Request Forms ---
+# The analysis only ever sees these canonical forms, so two payloads with the
+# same canonical form are guaranteed to produce the same report. That is what
+# makes it safe to cache results keyed on them.
+
+class CanonicalPrescription(NamedTuple):
+    """The parts of a prescription the analysis depends on, normalised and sorted."""
+    drugs: Tuple[Tuple[str, str], ...]  # (canonical drug name, normalised dosage)
+    age_band: str
+    # Version of the knowledge base the names were resolved with, so a reload
+    # never serves reports cached from the previous data.
+    knowledge_base: str
+
+    def cache_key(self) -> str:
+        return json.dumps(self, separators=(",", ":"))
+
+def canonical_prescription(payload: PrescriptionPayload) -> CanonicalPrescription:
+    kb = reference_data.current()
+    drugs = tuple(sorted((canonical_drug(d.name), canonical_dosage(d.dosage)) for d in payload.drugs))
+    return CanonicalPrescription(drugs, age_band(payload.patient.age), kb.version)
+
+def canonical_drug(name: str) -> str:
+    return reference_data.current().lexicon.canonical(name) or normalize_drug_name(name)
+
+def canonical_dosage(dosage: str) -> str:
+    return " ".join(dosage.lower().split())
+
+def canonical_symptoms(payload: SymptomPayload) -> Tuple[str, ...]:
+    # Synonyms map to the same vocabulary name, so they share cache entries.
+    scorer = reference_data.current().symptoms
+    return tuple(sorted({scorer.canonical(s) for s in payload.symptoms if s.strip()}))
+
+def symptom_cache_key(symptoms: Tuple[str, ...]) -> str:
+    return json.dumps([reference_data.current().version, symptoms])
+
+
+# --- Reference Data & Caches ---
+# The reference data is mapped from the compiled knowledge base (or parsed from
+# the source datasets if there is none) once per process, and swapped when a
+# new artifact is compiled. Each analysis step takes one snapshot of it.
+reference_data = KnowledgeBaseWatcher()
+label_store = LabelStore()
+label_proxy = LabelProxy()
+history_store = HistoryStore()
+job_queue = JobQueue()
+session_store = SessionStore()
+profile_store = ProfileStore()
+prescription_cache = ResultCache()
+symptom_cache = ResultCache()
+
+
+# --- Analysis Logic ---
+# These functions do the actual (blocking) analysis work. They are plain
+# module-level functions so the analysis executor can run them on either a
+# thread pool or a process pool.
+
+def extract_mentions(text: str):
+    """
+    Finds drug mentions in free text with the lexicon automaton. Doses no
+    mention claims are put to the analysis model (in one call), and the drug
+    names it finds are kept if they really appear in the text.
+    """
+    extractor = reference_data.current().extractor
+    mentions = extractor.extract(text)
+    spans = orphan_doses(text, mentions)
+    if not spans:
+        return mentions
+    questions = [Question("extraction", f'Which drug is prescribed in "{text[start:end]}"? '
+                          "Answer with the drug name exactly as written, or none.", "none") for start, end in spans]
+    found = []
+    for (start, end), answer in zip(spans, model_client().ask(questions)):
+        at = text.lower().find(answer.lower(), start, end) if answer != "none" else -1
+        if at >= 0 and normalize_drug_name(answer):
+            found.append((at, at + len(answer), normalize_drug_name(answer)))
+    return extractor.extract(text, found) if found else mentions
+
+def search_drug_labels(query: str, page: int, page_size: int) -> Dict[str, Any]:
+    """Full-text search over the offline openFDA label mirror."""
+    return label_store.search(query, page, page_size)
+
+def score_symptom_sets(symptom_sets: List[List[str]], k: int) -> List[Dict[str, Any]]:
+    """Ranks conditions for many symptom sets with one matrix product."""
+    return [{"conditions": [match.as_dict() for match in matches], "unrecognised": unknown}
+            for matches, unknown in reference_data.current().symptoms.score_batch(symptom_sets, k)]
+
+def display_name(canonical: str) -> str:
+    return canonical[:1].upper() + canonical[1:]
+
+# Reports are produced section by section, so the streaming endpoints can send
+# each section as soon as it is ready. A section returns a partial report;
+# string fields of later sections are appended to earlier ones (see merge_report).
+
+def interaction_section(prescription: CanonicalPrescription) -> Dict[str, Any]:
+    kb = reference_data.current()
+    names = [display_name(name) for name, _ in prescription.drugs]
+    interactions = kb.interactions.check(names)
+    unknown = [name for name in names if not is_known(name)]
+    pairs = sorted({tuple(sorted((a, b))) for a in unknown for b in names if a != b})
+    return interaction_report(names, interactions, unknown, model_interactions(pairs))
+
+def interaction_report(names: List[str], interactions: List[Interaction], unknown: List[str],
+                       reported: List[Interaction]) -> Dict[str, Any]:
+    return {
+        "interaction_analysis": format_interaction_report(names, interactions, unknown, reported),
+        "interactions": [interaction._asdict() for interaction in interactions],
+        "model_interactions": [interaction._asdict() for interaction in reported],
+    }
+
+def is_known(name: str) -> bool:
+    """Whether the lexicon or the interaction database knows the drug."""
+    kb = reference_data.current()
+    return kb.lexicon.canonical(name) is not None or kb.interactions.drug_id(name) is not None
+
+def model_interactions(pairs: List[Tuple[str, str]]) -> List[Interaction]:
+    """Asks the analysis model, in one call, about pairs (of display names) involving a drug the database lacks."""
+    questions = [Question("interaction", f"Is there a clinically relevant interaction between {a} and {b}? "
+                          'Answer "<severity>: <one sentence>" with severity minor, moderate, major or '
+                          "contraindicated, or none.", "none") for a, b in pairs]
+    reported = []
+    for (a, b), answer in zip(pairs, model_client().ask(questions)):
+        severity, _, description = answer.partition(":")
+        if severity.strip().lower() in SEVERITY_LEVELS and description.strip():
+            reported.append(Interaction(a, b, severity.strip().lower(), description.strip()))
+    return reported
+
+def dosage_section(prescription: CanonicalPrescription) -> Dict[str, Any]:
+    names = [name for name, _ in prescription.drugs]
+    dosages = [dosage for _, dosage in prescription.drugs]
+    checks = reference_data.current().doses.check(names, [prescription.age_band] * len(names),
+                                                  [parse_dosage(dosage) for dosage in dosages])
+    return dosage_report(checks, dosages)
+
+def dosage_report(checks: List[DoseCheck], dosages: List[str]) -> Dict[str, Any]:
+    return {
+        "dosage_recommendations": f"{format_dose_report(checks, dosages)}\n\nVerify against clinical guidelines for specific conditions.",
+        "dosage_checks": [check.as_dict() for check in checks],
+    }
+
+DEFAULT_ALTERNATIVES = "For pain management, consider non-opioid alternatives if appropriate. If one of the drugs is for cholesterol, lifestyle changes are also recommended."
+
+def alternatives_section(prescription: CanonicalPrescription) -> Dict[str, Any]:
+    names = ", ".join(display_name(name) for name, _ in prescription.drugs)
+    question = Question("alternatives", f"Suggest safer or lower-cost alternatives, if any, for a patient in the "
+                        f"{prescription.age_band} age band taking {names}. Answer in at most three sentences.",
+                        DEFAULT_ALTERNATIVES)
+    return {"alternative_suggestions": model_client().ask([question])[0]}
+
+PRESCRIPTION_SECTIONS = (interaction_section, dosage_section, alternatives_section)
+
+def symptom_matches(symptoms: Tuple[str, ...]):
+    """Conditions worth reporting for a symptom set, best first, and the unrecognised symptoms."""
+    matches, unknown = reference_data.current().symptoms.score(symptoms, k=3)
+    return [match for match in matches if match.score >= MIN_SCORE], unknown
+
+def symptom_analysis_section(symptoms: Tuple[str, ...]) -> Dict[str, Any]:
+    matches, unknown = symptom_matches(symptoms)
+    lines = ["### AI Symptom Analysis Report\n"]
+    if matches:
+        if matches[0].condition.urgency == "emergency":
+            lines.append(f"**⚠️ Seek emergency care:** these symptoms can indicate **{matches[0].condition.name.lower()}**.\n")
+        lines.append("**Possible Conditions:**")
+        for match in matches:
+            lines.append(f"- **{match.condition.name}** ({match.score:.0%} match) — {match.condition.description}. "
+                         f"Matching symptoms: {', '.join(match.matched)}.")
+    else:
+        suggestion = "none"
+        if symptoms:
+            suggestion = model_client().ask([Question(
+                "conditions", f"Which common conditions could explain these symptoms: {', '.join(symptoms)}? "
+                "Name up to three, comma-separated.", "none")])[0]
+        if suggestion != "none":
+            lines.append(f"**Possible Conditions (AI suggestion, unverified):** {suggestion}")
+        else:
+            lines.append("**General Analysis:** The provided symptoms are general. It is important to monitor them closely.")
+    if unknown:
+        lines.append(f"\n*Not recognised: {', '.join(unknown)}.*")
+    return {"report": "\n".join(lines) + "\n\n", "conditions": [match.as_dict() for match in matches]}
+
+def symptom_recommendations_section(symptoms: Tuple[str, ...]) -> Dict[str, str]:
+    matches, _ = symptom_matches(symptoms)
+    if not matches:
+        return {"report": "**General Recommendations:**\n- Ensure you are well-rested and hydrated.\n- A balanced diet can support your immune system."}
+    recommendations = matches[0].condition.recommendations or ("Monitor your symptoms and consult a healthcare provider if they persist.",)
+    return {"report": "**Recommendations:**\n" + "\n".join(f"- {r}" for r in recommendations)}
+
+def symptom_disclaimer_section(symptoms: Tuple[str, ...]) -> Dict[str, str]:
+    return {"report": "\n\n---\n\n*Disclaimer: This is an AI-generated approximation and is not a substitute for professional medical advice. Please consult a healthcare provider for an accurate diagnosis.*"}
+
+SYMPTOM_SECTIONS = (symptom_analysis_section, symptom_recommendations_section, symptom_disclaimer_section)
+
+def merge_report(report: Dict[str, Any], part: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds a section's partial report to `report`; string fields are appended."""
+    for key, value in part.items():
+        if isinstance(value, str) and isinstance(report.get(key), str):
+            report[key] += value
+        else:
+            report[key] = value
+    return report
+
+def build_prescription_report(prescription: CanonicalPrescription) -> Dict[str, Any]:
+    """Builds the verification report for a prescription, section by section."""
+    report: Dict[str, Any] = {}
+    for section in PRESCRIPTION_SECTIONS:
+        merge_report(report, section(prescription))
+    return report
+
+def build_symptom_report(symptoms: Tuple[str, ...]) -> Dict[str, Any]:
+    """Builds the approximate symptom analysis report from the condition scores."""
+    report: Dict[str, Any] = {}
+    for section in SYMPTOM_SECTIONS:
+        merge_report(report, section(symptoms))
+    return report
+
+# Session edits (see sessions.py) are checked piece by piece: the doses of the
+# drugs added or changed, and the pairs of each added drug with the others.
+# session_report then assembles the same report as interaction_section and
+# dosage_section would from the stored pieces.
+
+def check_session_edit(band: str, changed: List[Tuple[str, str, str]], added: List[str],
+                       others: List[Tuple[str, bool]]) -> SessionDelta:
+    """
+    Checks an edit of a session: `changed` are the (canonical name, name,
+    dosage) of the drugs added or given a new dosage, `added` the canonical
+    names among them that are new, and `others` the (canonical name, known)
+    of the drugs the edit leaves alone.
+    """
+    kb = reference_data.current()
+    checks = kb.doses.check([c for c, _, _ in changed], [band] * len(changed),
+                            [parse_dosage(canonical_dosage(dosage)) for _, _, dosage in changed])
+    drugs = {canonical: SessionDrug(name, dosage, check, is_known(display_name(canonical)))
+             for (canonical, name, dosage), check in zip(changed, checks)}
+    known = dict(others)
+    known.update((canonical, drug.known) for canonical, drug in drugs.items())
+    pairs = sorted({pair_key(a, b) for a in added for b in known if a != b})
+    interactions = {}
+    for a, b in pairs:
+        found = kb.interactions.lookup(display_name(a), display_name(b))
+        if found is not None:
+            interactions[(a, b)] = found
+    unknown = [(a, b) for a, b in pairs if not (known[a] and known[b])]
+    reported = model_interactions([(display_name(a), display_name(b)) for a, b in unknown])
+    by_display = {display_name(c): c for c in known}
+    return SessionDelta(drugs, interactions,
+                        {pair_key(by_display[i.drug_a], by_display[i.drug_b]): i for i in reported}, len(pairs))
+
+def session_prescription(session: PrescriptionSession) -> CanonicalPrescription:
+    drugs = tuple(sorted((canonical, canonical_dosage(drug.dosage)) for canonical, drug in session.drugs.items()))
+    return CanonicalPrescription(drugs, session.age_band, session.knowledge_base or "")
+
+def session_report(session: PrescriptionSession) -> Dict[str, Any]:
+    """The interaction and dosage sections of a session's report, from its stored results."""
+    canonicals = sorted(session.drugs)
+    names = [display_name(canonical) for canonical in canonicals]
+    # Pair order, then most severe first: the order InteractionIndex.check reports them in.
+    interactions = [Interaction(display_name(a), display_name(b), *session.interactions[(a, b)])
+                    for a, b in sorted(session.interactions)]
+    interactions.sort(key=lambda interaction: SEVERITY_LEVELS.index(interaction.severity), reverse=True)
+    unknown = [name for canonical, name in zip(canonicals, names) if not session.drugs[canonical].known]
+    reported = sorted(session.reported.values(), key=lambda interaction: (interaction.drug_a, interaction.drug_b))
+    report = interaction_report(names, interactions, unknown, reported)
+    return merge_report(report, dosage_report([session.drugs[c].check for c in canonicals],
+                                              [canonical_dosage(session.drugs[c].dosage) for c in canonicals]))
+
+# Job handlers run in the job worker processes (see jobs.py), with the same
+# analysis functions; they take a validated payload, publish each report
+# section as soon as it is ready, and return the report JSON.
+
+def publish_report(sections, publish: Callable[[Dict[str, Any]], None], *args) -> Dict[str, Any]:
+    """Builds a report section by section, handing each section to `publish` once it is ready."""
+    report: Dict[str, Any] = {}
+    for section in sections:
+        part = section(*args)
+        publish(part)
+        merge_report(report, part)
+    return report
+
+def run_prescription_job(payload: Dict[str, Any], publish: Callable[[Dict[str, Any]], None]) -> str:
+    prescription_payload = PrescriptionPayload.model_validate(payload)
+    report = publish_report(PRESCRIPTION_SECTIONS, publish, canonical_prescription(prescription_payload))
+    body = serialize_result(report).decode("utf-8")
+    history_store.add(prescription_payload.patient.model_dump(),
+                      [drug.model_dump() for drug in prescription_payload.drugs], body)
+    return body
+
+def run_symptom_job(payload: Dict[str, Any], publish: Callable[[Dict[str, Any]], None]) -> str:
+    symptoms = canonical_symptoms(SymptomPayload.model_validate(payload))
+    return serialize_result(publish_report(SYMPTOM_SECTIONS, publish, symptoms)).decode("utf-8")
+
+JOB_HANDLERS = {"prescription": run_prescription_job, "symptoms": run_symptom_job}
+# Session jobs edit a session held in this process, so the server runs them itself (see run_session_job).
+JOB_PAYLOAD_MODELS = {"prescription": PrescriptionPayload, "symptoms": SymptomPayload, "session": SessionJobPayload}
+JOB_POLL_INTERVAL = 0.25
+
+def serialize_result(result: Dict[str, Any]) -> bytes:
+    with timed_phase("serialisation"):
+        return json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+async def cached_analysis(cache: ResultCache, key: str, fn, *args):
+    """Returns the cached result for `key`, running `fn(*args)` on the executor on a miss."""
+    # A profiled request always runs the analysis; a cache hit would leave nothing to profile.
+    cached = cache.get(key) if current_profile() is None else None
+    if cached is None:
+        result = await analysis_executor.run(fn, *args)
+        cached = cache.put(key, serialize_result(result))
+    return cached
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+async def cached_response(request: Request, cache: ResultCache, key: str, fn, *args) -> Response:
+    """Serves an analysis result with an ETag, answering a matching If-None-Match with 304."""
+    return etag_response(request, await cached_analysis(cache, key, fn, *args))
+
+def etag_response(request: Request, cached: CachedResult) -> Response:
+    headers = {"ETag": cached.etag}
+    if etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+async def stream_report(cache: ResultCache, key: str, sections, *args, on_complete=None):
+    """
+    Yields a report as Server-Sent Events: one `section` event per partial
+    report as soon as it is computed, then `done`. Each section runs on the
+    analysis executor, so a client that disconnects stops the remaining
+    sections from running. A cached report is sent as a single section.
+    `on_complete`, if given, is awaited with the finished CachedResult.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        yield sse_event("section", json.loads(cached.body))
+        if on_complete is not None:
+            await on_complete(cached)
+        yield sse_event("done", {"etag": cached.etag})
+        return
+    report: Dict[str, Any] = {}
+    try:
+        for section in sections:
+            part = await analysis_executor.run(section, *args)
+            merge_report(report, part)
+            yield sse_event("section", part)
+    except QueueFullError as e:
+        yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+        return
+    cached = cache.put(key, serialize_result(report))
+    if on_complete is not None:
+        await on_complete(cached)
+    yield sse_event("done", {"etag": cached.etag})
+
+def sse_response(events) -> StreamingResponse:
+    # Refuse up front while the status code can still say so.
+    analysis_executor.check_admission()
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# History reads and writes are short SQLite calls, so they run on the default
+# thread pool rather than taking analysis executor slots.
+
+def history_recorder(payload: PrescriptionPayload):
+    """Returns an `on_complete` callback that records the finished report for `payload`."""
+    patient = payload.patient.model_dump()
+    drugs = [drug.model_dump() for drug in payload.drugs]
+
+    async def record(cached: CachedResult) -> None:
+        await asyncio.to_thread(history_store.add, patient, drugs, cached.body.decode("utf-8"))
+    return record
+
+def day_start(day: date) -> float:
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+# --- Warm-Up ---
+# Run by the lifespan handler (see warmup.py), so no user request pays a cold
+# start: the mapped knowledge base is faulted in, each store opens its
+# connection, the analysis pool starts its workers, the openFDA proxy refills
+# its memory tier from disk, and every analysis path runs once on synthetic
+# input. Nothing is written to the history or the result caches, and no
+# question goes to the analysis model.
+
+WARMUP_PRESCRIPTION = {
+    "patient": {"name": "Warm-up", "age": 45, "gender": "Other", "blood_group": "O+"},
+    "drugs": [{"name": "Warfarin", "dosage": "5 mg daily"}, {"name": "Aspirin", "dosage": "81 mg daily"}],
+}
+WARMUP_TEXT = "Warfarin 5 mg once daily and aspirin 81 mg daily"
+
+def warm_analysis() -> Dict[str, Any]:
+    """Runs the prescription, session, extraction, symptom and suggestion paths once, in this process."""
+    kb = reference_data.current()
+    prescription = canonical_prescription(PrescriptionPayload.model_validate(WARMUP_PRESCRIPTION))
+    serialize_result(merge_report(interaction_section(prescription), dosage_section(prescription)))
+    check_session_edit(prescription.age_band, [(name, name, dosage) for name, dosage in prescription.drugs],
+                       [name for name, _ in prescription.drugs], [])
+    mentions = extract_mentions(WARMUP_TEXT)
+    symptoms = tuple(kb.symptoms.vocabulary()[:3])
+    symptom_matches(symptoms)
+    score_symptom_sets([list(symptoms)] * 8, 3)
+    kb.suggestions.suggest("warfarn", 5)
+    return {"mentions": len(mentions), "pid": os.getpid()}
+
+async def warm_knowledge_base() -> Dict[str, Any]:
+    kb = reference_data.current()
+    touched = await asyncio.to_thread(kb.touch)
+    return {"version": kb.version, "source": kb.source, "bytes_touched": touched}
+
+async def warm_analysis_pool() -> Dict[str, Any]:
+    await analysis_executor.start()
+    return {"kind": analysis_executor.kind, "workers": analysis_executor.workers}
+
+async def warm_model_client() -> Dict[str, Any]:
+    client = await asyncio.to_thread(model_client)
+    return {"provider": client.provider.name if client.provider is not None else "local"}
+
+async def warm_stores() -> Dict[str, Any]:
+    await asyncio.to_thread(history_store.page, 1)
+    await asyncio.to_thread(job_queue.counts)
+    return {"labels_preloaded": await label_proxy.preload()}
+
+async def warm_label_search() -> Dict[str, Any]:
+    # Optional: the label mirror only exists once a dump has been ingested.
+    return {"total": (await analysis_executor.run(search_drug_labels, "aspirin", 1, 1))["total"]}
+
+async def warm_code_paths() -> Dict[str, Any]:
+    # Each process of a process pool has its own imports and caches, so the paths run once per worker;
+    # the threads of a thread pool share them, so once is enough.
+    runs = analysis_executor.workers if analysis_executor.kind == "process" else 1
+    results = await asyncio.gather(*(analysis_executor.run(warm_analysis) for _ in range(runs)))
+    return {"mentions": results[0]["mentions"], "runs": runs, "processes": len({r["pid"] for r in results})}
+
+readiness = Readiness()
+readiness.add("knowledge_base", warm_knowledge_base)
+readiness.add("analysis_pool", warm_analysis_pool)
+readiness.add("model_client", warm_model_client)
+readiness.add("stores", warm_stores)
+readiness.add("label_search", warm_label_search, required=False)
+readiness.add("code_paths", warm_code_paths)
+
 
 # --- FastAPI Application Initialization ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts the job workers and the warm-up, and on shutdown releases them, the
+    analysis pool and the openFDA client.
+    """
+    job_workers = JobWorkers(JOB_HANDLERS, JOB_WORKERS)
+    job_workers.start()
+    warm_up = readiness.start()
+    if readiness.mode == "blocking":
+        await warm_up
+    yield
+    warm_up.cancel()
+    job_workers.stop()
+    analysis_executor.shutdown()
+    await label_proxy.aclose()
+
 app = FastAPI(
     title="MediGuard AI Verifier API",
     description="Backend API for the AI Medical Prescription Verifier Streamlit app.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# Marks when each endpoint starts and returns, for the Server-Timing header.
+app.router.route_class = TimedRoute
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """Tells the client to back off when the analysis queue is saturated."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # --- CORS (Cross-Origin Resource Sharing) Middleware ---
 # This is crucial for allowing your Streamlit frontend (running on one port)
@@ -47,84 +575,530 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# --- Profiling ---
+# Only installed when profiling is configured (see profiling.py), so it costs
+# nothing otherwise. Inside the metrics middleware, so the profile id header is
+# part of the response the metrics see.
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, store=profile_store)
+
+# --- Admission ---
+# Outside the profiler, so refused requests are never profiled, and inside the
+# metrics, so they are counted.
+admission = Admission()
+app.add_middleware(AdmissionMiddleware, admission=admission, warming=lambda: readiness.warming)
+
+# --- Metrics ---
+# Added last, so it wraps the other middleware and sees every final response.
+app.add_middleware(MetricsMiddleware, registry=metrics_registry)
+
+RESULT_CACHES = {"prescription": prescription_cache, "symptom": symptom_cache}
+
+def cache_samples(field: str):
+    return lambda: [({"cache": name}, cache.stats()[field]) for name, cache in RESULT_CACHES.items()]
+
+def knowledge_base_samples():
+    kb = reference_data.current()
+    return [({"version": kb.version, "source": kb.source}, 1)]
+
+metrics_registry.register("analysis_jobs_pending", "gauge", "Analysis jobs running or waiting for a worker.",
+                          lambda: [({}, analysis_executor.pending)])
+metrics_registry.register("analysis_queue_depth", "gauge", "Analysis jobs waiting for a worker.",
+                          lambda: [({}, analysis_executor.queued)])
+metrics_registry.register("analysis_workers", "gauge", "Size of the analysis worker pool.",
+                          lambda: [({}, analysis_executor.workers)])
+metrics_registry.register("analysis_rejected_total", "counter", "Analysis jobs refused because the queue was full.",
+                          lambda: [({}, analysis_executor.rejected)])
+metrics_registry.register("analysis_lane_running", "gauge", "Analysis jobs running, by lane.",
+                          lambda: [({"lane": name}, lane.running) for name, lane in analysis_executor.scheduler.lanes.items()])
+metrics_registry.register("analysis_lane_queued", "gauge", "Analysis jobs waiting for a worker, by lane.",
+                          lambda: [({"lane": name}, len(lane.waiting))
+                                   for name, lane in analysis_executor.scheduler.lanes.items()])
+metrics_registry.register("analysis_lane_started_total", "counter", "Analysis jobs given a worker, by lane.",
+                          lambda: [({"lane": name}, lane.started) for name, lane in analysis_executor.scheduler.lanes.items()])
+metrics_registry.register("analysis_lane_rejected_total", "counter", "Analysis jobs refused because their lane's queue was full.",
+                          lambda: [({"lane": name}, lane.rejected) for name, lane in analysis_executor.scheduler.lanes.items()])
+metrics_registry.register("analysis_lane_queue_seconds", "histogram", "Time analysis jobs waited for a worker, by lane.",
+                          lambda: [({"lane": name}, lane.queue_time) for name, lane in analysis_executor.scheduler.lanes.items()])
+metrics_registry.register("admission_requests_total", "counter", "Analysis requests admitted, by lane.",
+                          lambda: [({"lane": lane}, admission.requests[lane]) for lane in LANES])
+metrics_registry.register("admission_rate_limited_total", "counter", "Analysis requests refused by a client's rate limit, by lane.",
+                          lambda: [({"lane": lane}, admission.limited[lane]) for lane in LANES])
+metrics_registry.register("admission_warming_total", "counter", "Analysis requests refused while the worker was warming up.",
+                          lambda: [({}, admission.warming)])
+metrics_registry.register("admission_clients", "gauge", "Clients with a rate limit bucket.",
+                          lambda: [({}, admission.clients())])
+metrics_registry.register("jobs", "gauge", "Background jobs by status.",
+                          lambda: [({"status": status}, count) for status, count in job_queue.counts().items()])
+metrics_registry.register("knowledge_base_info", "gauge", "Version and source of the loaded knowledge base.",
+                          knowledge_base_samples)
+metrics_registry.register("knowledge_base_reloads_total", "counter", "Knowledge base artifacts swapped in since startup.",
+                          lambda: [({}, reference_data.reloads)])
+metrics_registry.register("sessions_active", "gauge", "Prescription sessions held in memory.",
+                          lambda: [({}, len(session_store))])
+metrics_registry.register("sessions_evicted_total", "counter", "Prescription sessions dropped unused.",
+                          lambda: [({}, session_store.evicted)])
+metrics_registry.register("session_checks_total", "counter", "Dose and pair checks of session edits, computed or reused.",
+                          lambda: [({"kind": kind, "result": result}, count)
+                                   for (kind, result), count in sorted(session_store.checks.items())])
+metrics_registry.register("cache_hits_total", "counter", "Result cache hits.", cache_samples("hits"))
+metrics_registry.register("cache_misses_total", "counter", "Result cache misses.", cache_samples("misses"))
+metrics_registry.register("cache_evictions_total", "counter", "Result cache LRU evictions.", cache_samples("evictions"))
+metrics_registry.register("cache_entries", "gauge", "Entries held by each result cache.", cache_samples("entries"))
+metrics_registry.register("cache_bytes", "gauge", "Bytes held by each result cache.", cache_samples("bytes"))
+metrics_registry.register("model_calls_total", "counter", "Calls to the analysis model (hedged calls included).",
+                          lambda: [({}, model_client().stats["calls"])])
+metrics_registry.register("model_call_failures_total", "counter", "Analysis model calls that failed, by reason.",
+                          lambda: [({"reason": reason}, model_client().stats[reason])
+                                   for reason in ("errors", "bad_replies", "timeouts")])
+metrics_registry.register("model_hedged_calls_total", "counter", "Second calls sent because the first was slow.",
+                          lambda: [({}, model_client().stats["hedged"])])
+metrics_registry.register("model_fallbacks_total", "counter", "Questions answered by local logic because the model could not.",
+                          lambda: [({}, model_client().stats["fallbacks"])])
+metrics_registry.register("model_tokens_total", "counter", "Tokens sent to and received from the analysis model.",
+                          lambda: [({"direction": "input"}, model_client().stats["input_tokens"]),
+                                   ({"direction": "output"}, model_client().stats["output_tokens"])])
+metrics_registry.register("model_cache_lookups_total", "counter", "Model answer cache lookups by result.",
+                          lambda: [({"result": "hit"}, model_client().stats["cache_hits"]),
+                                   ({"result": "miss"}, model_client().stats["cache_misses"])])
+metrics_registry.register("label_lookups_total", "counter", "openFDA label lookups by the tier that answered them.",
+                          lambda: [({"source": source}, label_proxy.lookups[source]) for source in LOOKUP_SOURCES])
+metrics_registry.register("label_upstream_requests_total", "counter", "Requests sent to openFDA by outcome.",
+                          lambda: [({"outcome": outcome}, label_proxy.upstream[outcome])
+                                   for outcome in ("ok", "not_found", "error")])
+metrics_registry.register("label_lookups_coalesced_total", "counter",
+                          "openFDA label lookups that waited for an identical one already in flight.",
+                          lambda: [({}, label_proxy.coalesced)])
+metrics_registry.register("label_cache_entries", "gauge", "Labels held by the in-memory tier of the openFDA proxy.",
+                          lambda: [({}, len(label_proxy))])
+metrics_registry.register("ready", "gauge", "1 once this worker has finished warming up.",
+                          lambda: [({}, int(readiness.ready))])
+metrics_registry.register("warmup_component_state", "gauge", "Warm-up state of each component (1 for its current state).",
+                          lambda: [({"component": name, "state": state}, int(component.state == state))
+                                   for name, component in readiness.components.items() for state in COMPONENT_STATES])
+metrics_registry.register("warmup_component_seconds", "gauge", "Seconds each warm-up step took.",
+                          lambda: [({"component": name}, component.seconds)
+                                   for name, component in readiness.components.items() if component.seconds is not None])
+metrics_registry.register("profiles_saved_total", "counter", "Request profiles saved, by why the request was profiled.",
+                          lambda: [({"reason": reason}, profile_store.saved[reason]) for reason in ("header", "sampled")])
+metrics_registry.register("cache_hit_ratio", "gauge", "Hits / lookups for each result cache.", cache_samples("hit_ratio"))
+
 
 # --- API Endpoints ---
 
 @app.get("/")
 def read_root():
+    """Root endpoint; says the backend is running."""
+    return {"status": "MediGuard AI Backend is running"}
+
+@app.get("/live")
+async def live():
+    """Liveness: the process is up and its event loop answers. Checks nothing else, so it is always cheap."""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready():
     """
-    Root endpoint for health checks.
-    The Streamlit app pings this to check if the backend is connected.
+    Readiness: whether this worker has finished warming up, with the state and
+    timing of each warm-up step. Answers 503 until every required step is ready.
+    The Streamlit app polls this to show the backend status.
     """
-    return {"status": "MediGuard AI Backend is running"}
+    snapshot = readiness.snapshot()
+    if snapshot["ready"]:
+        return snapshot
+    return JSONResponse(status_code=503, content=snapshot, headers={"Retry-After": "1"})
+
+@app.get("/metrics")
+async def metrics():
+    """Request, queue and cache metrics of this worker process, in the Prometheus text format."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/verify-prescription")
-async def verify_prescription(payload: PrescriptionPayload):
+async def verify_prescription(payload: PrescriptionPayload, request: Request):
     """
     Analyzes a prescription (patient info + drugs) and returns an AI-generated report.
-    (This is a mock implementation for demonstration).
-    """
-    # Simulate a delay as if an AI model is processing
-    time.sleep(2)
-    
-    # Mock AI analysis logic
-    interaction_analysis = f"Analysis for {len(payload.drugs)} drug(s): No critical interactions found between {', '.join([d.name for d in payload.drugs])}. However, monitor for potential mild side effects."
-    dosage_recommendations = f"Dosage appears standard for an adult aged {payload.patient.age}. Verify against clinical guidelines for specific conditions."
-    alternative_suggestions = "For pain management, consider non-opioid alternatives if appropriate. If one of the drugs is for cholesterol, lifestyle changes are also recommended."
-    
-    return {
-        "interaction_analysis": interaction_analysis,
-        "dosage_recommendations": dosage_recommendations,
-        "alternative_suggestions": alternative_suggestions
-    }
+    Results are cached on the canonical form of the prescription and carry an ETag.
+    """
+    prescription = canonical_prescription(payload)
+    cached = await cached_analysis(prescription_cache, prescription.cache_key(),
+                                   build_prescription_report, prescription)
+    response = etag_response(request, cached)
+    # A 304 revalidates a report the client already has, so it is not another analysis.
+    if response.status_code == 200:
+        await history_recorder(payload)(cached)
+    return response
+
+@app.post("/verify-prescription/stream")
+async def verify_prescription_stream(payload: PrescriptionPayload):
+    """
+    Streams the prescription report as Server-Sent Events, one event per
+    report section (interactions, dosage, alternatives) as soon as it is ready.
+    """
+    prescription = canonical_prescription(payload)
+    return sse_response(stream_report(prescription_cache, prescription.cache_key(),
+                                      PRESCRIPTION_SECTIONS, prescription, on_complete=history_recorder(payload)))
+
+@app.post("/verify-prescription/batch")
+async def verify_prescription_batch(request: Request):
+    """
+    Verifies many prescriptions in one request. The body is either a JSON array
+    or NDJSON of PrescriptionPayload objects; results stream back as NDJSON in
+    input order, one line per record, with per-record errors.
+    """
+    body_read = False
+
+    async def indexed_records():
+        nonlocal body_read
+        index = 0
+        async for record in iter_json_records(request.stream()):
+            yield index, record
+            index += 1
+        body_read = True
+
+    async def client_gone() -> bool:
+        # Until the whole body is read, receive() carries body chunks, which must not be taken here.
+        return body_read and await request.is_disconnected()
+
+    async def analyse(item):
+        index, record = item
+        if isinstance(record, RecordError):
+            return {"index": index, "ok": False, "error": str(record)}
+        try:
+            payload = PrescriptionPayload.model_validate(record)
+        except ValidationError as e:
+            return {"index": index, "ok": False, "error": json.loads(e.json(include_url=False, include_input=False))}
+        prescription = canonical_prescription(payload)
+        deadline = time.monotonic() + BATCH_QUEUE_WAIT
+        while True:
+            try:
+                cached = await cached_analysis(prescription_cache, prescription.cache_key(),
+                                               build_prescription_report, prescription)
+                # The cached body is already serialised JSON, so it is spliced in as is.
+                return '{"index": %d, "ok": true, "result": %s}' % (index, cached.body.decode("utf-8"))
+            except QueueFullError as e:
+                # Batch records wait a while for capacity instead of failing like single requests.
+                if time.monotonic() >= deadline or await client_gone():
+                    return {"index": index, "ok": False, "status": 503, "error": str(e),
+                            "retry_after": e.retry_after}
+                await asyncio.sleep(0.05)
+
+    async def results():
+        try:
+            async for _, line in ordered_map(indexed_records(), analyse, BATCH_WINDOW):
+                yield (line if isinstance(line, str) else json.dumps(line)) + "\n"
+        except StreamFormatError as e:
+            yield json.dumps({"ok": False, "error": str(e), "fatal": True}) + "\n"
+
+    return DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def create_job(job: JobRequest, response: Response):
+    """
+    Queues a prescription verification or symptom analysis and returns its id
+    right away. Poll GET /jobs/{id} for the result. The job runs in the lane
+    of this request, and workers take queued jobs by weighted fair queuing
+    between the lanes (see jobs.py). A "session" job analyses
+    the prescription as an edit of the given session, so only the drugs that
+    changed since its last job are checked; its response and payload carry the
+    id of the session, which is new if none was given or it had expired.
+    """
+    try:
+        payload = JOB_PAYLOAD_MODELS[job.kind].model_validate(job.payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False, include_input=False)))
+    if job.kind == "session":
+        return await start_session_job(payload, response)
+    job_id = await asyncio.to_thread(job_queue.enqueue, job.kind, payload.model_dump(), current_lane())
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=30), sections: int = Query(0, ge=0)):
+    """
+    Returns a job's status ("queued", "running", "done" or "failed") and, once
+    done, its result; until then, the report sections it has finished. With
+    `wait`, the response is held for up to that many seconds until the job
+    finishes or has more than `sections` sections (long polling).
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+        if (job["status"] in ("done", "failed") or len(job.get("sections", ())) > sections
+                or time.monotonic() >= deadline):
+            return job
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def edit_session(session: PrescriptionSession, upsert: List[Drug], remove: List[str],
+                       publish: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+    """
+    Applies an edit to `session`, checking only what it changes, and returns
+    the session with its report; `publish` is given each section of the report
+    as soon as it is ready. Edits that change the drugs are recorded in the
+    history. The caller holds the session lock.
+    """
+    kb = reference_data.current()
+    # Removals come first, so a re-check after a reload cannot bring removed drugs back.
+    removed = sum(session.remove(canonical_drug(name)) for name in remove)
+    if session.knowledge_base != kb.version:
+        # Results from other reference data cannot be mixed in, so everything is re-checked.
+        upsert = [Drug(name=drug.name, dosage=drug.dosage) for drug in session.drugs.values()] + list(upsert)
+        session.reset()
+        session.knowledge_base = kb.version
+    edits = {canonical_drug(drug.name): (drug.name, drug.dosage) for drug in upsert}
+    changed = [(canonical, name, dosage) for canonical, (name, dosage) in edits.items()
+               if canonical not in session.drugs or session.drugs[canonical][:2] != (name, dosage)]
+    changed_names = {canonical for canonical, _, _ in changed}
+    added = [canonical for canonical in changed_names if canonical not in session.drugs]
+    others = [(canonical, drug.known) for canonical, drug in session.drugs.items() if canonical not in changed_names]
+    pair_checks = 0
+    if changed:
+        delta = await analysis_executor.run(check_session_edit, session.age_band, changed, added, others)
+        session.apply(delta)
+        pair_checks = delta.pair_checks
+        session.revision += 1
+    elif removed:
+        session.revision += 1
+    report = session_report(session)
+    if publish is not None:
+        await publish(dict(report))
+    alternatives = await analysis_executor.run(alternatives_section, session_prescription(session))
+    if publish is not None:
+        await publish(alternatives)
+    merge_report(report, alternatives)
+
+    computed = {"dose_checks": len(changed), "pair_checks": pair_checks}
+    reused = {"dose_checks": len(session.drugs) - len(changed), "pair_checks": session.pair_count() - pair_checks}
+    for kind in ("dose", "pair"):
+        session_store.checks[(kind, "computed")] += computed[f"{kind}_checks"]
+        session_store.checks[(kind, "reused")] += reused[f"{kind}_checks"]
+    drugs = [{"name": drug.name, "dosage": drug.dosage} for _, drug in sorted(session.drugs.items())]
+    if changed or removed:
+        await asyncio.to_thread(history_store.add, session.patient, drugs, serialize_result(report).decode("utf-8"))
+    return {"id": session.id, "revision": session.revision, "patient": session.patient, "drugs": drugs,
+            "result": report, "computed": computed, "reused": reused}
+
+def find_session(session_id: str) -> PrescriptionSession:
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+    return session
+
+# Session jobs run on the event loop of the process holding the session. The
+# tasks are kept here so they are not garbage collected while they run.
+session_jobs: Set[asyncio.Task] = set()
+
+async def start_session_job(payload: SessionJobPayload, response: Response) -> Dict[str, Any]:
+    patient = payload.patient.model_dump()
+    session = session_store.get(payload.session) if payload.session else None
+    if session is None or session.patient != patient:
+        session = session_store.create(patient, age_band(payload.patient.age))
+    job_payload = dict(payload.model_dump(), session=session.id)
+    job_id = await asyncio.to_thread(job_queue.start, "session", job_payload, current_lane())
+    task = asyncio.create_task(run_session_job(job_id, session, payload.drugs))
+    session_jobs.add(task)
+    task.add_done_callback(session_jobs.discard)
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"id": job_id, "status": "running", "session": session.id}
+
+async def run_session_job(job_id: str, session: PrescriptionSession, drugs: List[Drug]) -> None:
+    """Makes `drugs` the session's drug list, publishing the report's sections to the job."""
+    sections: List[Dict[str, Any]] = []
+
+    async def publish(section: Dict[str, Any]) -> None:
+        sections.append(section)
+        await asyncio.to_thread(job_queue.publish, job_id, sections)
+
+    try:
+        async with session.lock:
+            # The drugs the job lacks are removed; the others are added or given their new dosage.
+            keep = {canonical_drug(drug.name) for drug in drugs}
+            remove = [drug.name for canonical, drug in session.drugs.items() if canonical not in keep]
+            body = await edit_session(session, drugs, remove, publish)
+    except Exception as e:
+        traceback.print_exc()
+        await asyncio.to_thread(job_queue.finish, job_id, error=f"{type(e).__name__}: {e}")
+    else:
+        await asyncio.to_thread(job_queue.finish, job_id, serialize_result(body["result"]).decode("utf-8"))
+
+@app.post("/sessions", status_code=201)
+async def create_session(payload: SessionPayload, response: Response):
+    """
+    Starts a prescription session and returns it with its report. Drugs are
+    then added, changed and removed with PATCH /sessions/{id}/drugs, and each
+    edit only checks what it changes.
+    """
+    session = session_store.create(payload.patient.model_dump(), age_band(payload.patient.age))
+    try:
+        async with session.lock:
+            body = await edit_session(session, payload.drugs, [])
+    except BaseException:
+        session_store.delete(session.id)
+        raise
+    response.headers["Location"] = f"/sessions/{session.id}"
+    return body
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Returns a session with its current report."""
+    session = find_session(session_id)
+    async with session.lock:
+        return await edit_session(session, [], [])
+
+@app.patch("/sessions/{session_id}/drugs")
+async def edit_session_drugs(session_id: str, edit: SessionEdit):
+    """
+    Removes the drugs named in `remove`, then adds the drugs in `upsert` (or
+    sets their dosage if the session has them), and returns the new report.
+    `computed` and `reused` count the checks the edit ran and the ones it kept.
+    """
+    session = find_session(session_id)
+    async with session.lock:
+        return await edit_session(session, edit.upsert, edit.remove)
+
+@app.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    """Ends a session before it expires."""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+    return Response(status_code=204)
+
+@app.get("/history")
+async def list_history(cursor: Optional[int] = None, limit: int = Query(20, ge=1, le=100),
+                       patient: Optional[str] = None, since: Optional[date] = None, until: Optional[date] = None):
+    """
+    Lists verified prescriptions, newest first, one page at a time and without
+    report bodies. Pass the returned `next_cursor` as `cursor` for the next
+    page. `patient` matches the start of the patient name; `since` and `until`
+    are inclusive dates.
+    """
+    return await asyncio.to_thread(
+        history_store.page, limit, cursor, patient,
+        day_start(since) if since else None,
+        day_start(until + timedelta(days=1)) if until else None,
+    )
+
+@app.get("/history/{entry_id}")
+async def get_history_entry(entry_id: int):
+    """Returns one history entry with its full report."""
+    entry = await asyncio.to_thread(history_store.get, entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"History entry {entry_id} not found")
+    return entry
+
+@app.delete("/history")
+async def clear_history():
+    """Deletes the whole analysis history."""
+    return {"deleted": await asyncio.to_thread(history_store.clear)}
+
+def check_profile_access(request: Request) -> None:
+    """The profile endpoints need the profiling token in the profile header, and are closed without one."""
+    if PROFILE_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Profiling is disabled; set MEDIGUARD_PROFILE_TOKEN to enable it")
+    if not token_matches(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail=f"Profiles need the {PROFILE_HEADER} header with the profiling token")
+
+@app.get("/profiles")
+async def list_profiles(request: Request):
+    """Lists the saved request profiles, newest first."""
+    check_profile_access(request)
+    return {"enabled": PROFILING_ENABLED, "profiles": await asyncio.to_thread(profile_store.list)}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: Literal["pstats", "text"] = "pstats",
+                      limit: int = Query(40, ge=1, le=500)):
+    """
+    Downloads a profile as a pstats file (for pstats, snakeviz or gprof2dot),
+    or with format=text as the `limit` functions with the most cumulative time
+    and the functions each of them calls.
+    """
+    check_profile_access(request)
+    if format == "text":
+        text = await asyncio.to_thread(profile_store.text, profile_id, limit)
+        if text is None:
+            raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+        return PlainTextResponse(text)
+    path = profile_store.stats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
 
 @app.post("/extract-from-text")
 async def extract_from_text(data: Dict[str, str]):
     """
-    Extracts drug names and dosages from raw text.
-    (This is a mock implementation for demonstration).
+    Extracts drug names and dosages from raw text using the drug lexicon.
+    Each drug carries the nearest dose and frequency found in the text.
     """
-    text = data.get("prescription_text", "").lower()
-    # A very simple mock extraction
-    drugs = []
-    if "lisinopril 10mg" in text:
-        drugs.append({"name": "Lisinopril", "dosage": "10mg"})
-    if "metformin 500mg" in text:
-        drugs.append({"name": "Metformin", "dosage": "500mg"})
-    if not drugs:
-         drugs.append({"name": "Extracted Drug (Mock)", "dosage": "As per text"})
-    return {"drugs": drugs}
+    text = data.get("prescription_text", "")
+    mentions = await analysis_executor.run(extract_mentions, text)
+    return {"drugs": [mention.as_dict() for mention in mentions]}
+
+@app.post("/analyze-symptoms/stream")
+async def analyze_symptoms_stream(payload: SymptomPayload):
+    """Streams the symptom report as Server-Sent Events, one event per report section."""
+    symptoms = canonical_symptoms(payload)
+    return sse_response(stream_report(symptom_cache, symptom_cache_key(symptoms), SYMPTOM_SECTIONS, symptoms))
 
 # --- NEW: The Missing Symptom Checker Endpoint ---
 @app.post("/analyze-symptoms")
-async def analyze_symptoms(payload: SymptomPayload):
+async def analyze_symptoms(payload: SymptomPayload, request: Request):
     """
     Analyzes a list of symptoms and returns an AI-generated approximate analysis.
-    (This is a mock implementation for demonstration).
-    """
-    # Simulate AI processing time
-    time.sleep(1.5)
-
-    symptoms = set(s.lower() for s in payload.symptoms)
-    report = "### AI Symptom Analysis Report\n\n"
-
-    # Mock AI logic based on symptom combinations
-    if "fever" in symptoms and "cough" in symptoms and "sore throat" in symptoms:
-        report += "**Possible Condition:** Based on the combination of fever, cough, and sore throat, a common viral respiratory infection like the **common cold or influenza** is possible.\n\n"
-        report += "**Recommendations:**\n- Rest and stay hydrated.\n- Over-the-counter medications may help manage symptoms.\n- Monitor for worsening conditions like difficulty breathing."
-    
-    elif "headache" in symptoms and "dizziness" in symptoms:
-        report += "**Possible Considerations:** Headache combined with dizziness can be related to various factors, including **dehydration, migraines, or inner ear issues**.\n\n"
-        report += "**Recommendations:**\n- Ensure adequate fluid intake.\n- Rest in a quiet, dark room.\n- Avoid sudden movements."
-        
-    elif "nausea" in symptoms and "body aches" in symptoms:
-        report += "**Possible Condition:** The combination of nausea and body aches could suggest a **gastrointestinal issue or a systemic viral infection**.\n\n"
-        report += "**Recommendations:**\n- Stick to a bland diet (e.g., BRAT diet).\n- Rest is crucial for recovery."
+    Results are cached on the normalised symptom set and carry an ETag.
+    """
+    symptoms = canonical_symptoms(payload)
+    return await cached_response(request, symptom_cache, symptom_cache_key(symptoms),
+                                 build_symptom_report, symptoms)
 
-    else:
-        report += "**General Analysis:** The provided symptoms are general. It is important to monitor them closely.\n\n"
-        report += "**General Recommendations:**\n- Ensure you are well-rested and hydrated.\n- A balanced diet can support your immune system."
-        
-    report += "\n\n---\n\n*Disclaimer: This is an AI-generated approximation and is not a substitute for professional medical advice. Please consult a healthcare provider for an accurate diagnosis.*"
+@app.post("/analyze-symptoms/batch")
+async def analyze_symptoms_batch(payload: SymptomBatchPayload):
+    """
+    Scores many symptom sets at once and returns the top_k conditions for each,
+    in input order, with raw scores rather than rendered reports.
+    """
+    results = await analysis_executor.run(score_symptom_sets, payload.symptom_sets, payload.top_k)
+    return {"results": results}
+
+@app.get("/symptoms")
+async def list_symptoms():
+    """The symptom vocabulary the checker recognises (synonyms are accepted too)."""
+    return {"symptoms": reference_data.current().symptoms.vocabulary()}
+
+@app.get("/drugs/search")
+async def search_drugs(q: str, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=50)):
+    """
+    Ranked full-text search over the offline openFDA drug label mirror
+    (brand and generic names, indications, warnings and contraindications).
+    """
+    try:
+        return await analysis_executor.run(search_drug_labels, q, page, page_size)
+    except LabelStoreUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    return {"report": report}
+@app.get("/drugs/label/{name}")
+async def drug_label(name: str, request: Request):
+    """
+    The current openFDA label for a drug, looked up by brand or generic name
+    through a shared memory and disk cache. X-Cache says which tier answered
+    ("stale" when openFDA could not be asked) and Age how old the answer is.
+    A name openFDA does not know answers 404; that is cached too.
+    """
+    try:
+        result = await label_proxy.get(name)
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    entry = result.entry
+    headers = {"ETag": entry.etag, "Age": str(int(entry.age())), "X-Cache": result.source}
+    if entry.status == 200 and etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, status_code=entry.status, media_type="application/json", headers=headers)
+
+@app.get("/drugs/suggest")
+async def suggest_drugs(q: str, limit: int = Query(10, ge=1, le=25)):
+    """
+    Typo-tolerant drug name autocomplete: prefix completions first, then close
+    misspellings, each with its canonical name. Lookups take well under a
+    millisecond, so they run inline rather than on the analysis executor.
+    """
+    return {"query": q, "suggestions": reference_data.current().suggestions.suggest(q, limit)}
@@ -0,0 +1,283 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from starlette.routing import Match
+
+# --- Request Metrics ---
+# A small Prometheus-compatible registry, fed by an ASGI middleware. Counters
+# are plain ints updated from the event loop thread, so recording a request
+# takes no lock; each worker process keeps (and reports) its own counters.
+# Histograms use fixed buckets and are only made cumulative when scraped.
+#
+# Every response also carries a Server-Timing header with three phases:
+#   validation    - from the first byte of the request until the endpoint runs
+#                   (body read, JSON parsing, pydantic validation)
+#   analysis      - time spent waiting on the analysis executor
+#   serialisation - report encoding plus rendering the response after the endpoint returns
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+PHASES = ("validation", "analysis", "serialisation")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteStats:
+    """Counters for one (method, route template) pair."""
+    __slots__ = ("statuses", "errors", "in_flight", "latency", "request_size", "response_size")
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.errors = 0
+        self.in_flight = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.request_size = Histogram(SIZE_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+
+class RequestTimings:
+    """Phase timings of the request being handled."""
+    __slots__ = ("started", "handler_started", "handler_finished", "phases")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.handler_started: Optional[float] = None
+        self.handler_finished: Optional[float] = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+    def server_timing(self, now: float) -> str:
+        phases = self.phases
+        # A request rejected before its endpoint ran spent all its time in validation.
+        validation = phases["validation"] + (self.handler_started or now) - self.started
+        serialisation = phases["serialisation"]
+        if self.handler_finished is not None:
+            serialisation += now - self.handler_finished
+        return (f"validation;dur={validation * 1000:.2f}, analysis;dur={phases['analysis'] * 1000:.2f}, "
+                f"serialisation;dur={serialisation * 1000:.2f}")
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "mediguard_request_timings", default=None)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Adds `seconds` to a phase of the current request's Server-Timing; a no-op outside requests."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.phases[phase] += seconds
+
+
+@contextmanager
+def timed_phase(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+class MetricsRegistry:
+    """Per-route HTTP metrics plus families sampled from callbacks when scraped."""
+
+    def __init__(self, namespace: str = "mediguard"):
+        self.namespace = namespace
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._collected: List[Tuple[str, str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+    def route(self, method: str, path: str) -> RouteStats:
+        stats = self.routes.get((method, path))
+        if stats is None:
+            stats = self.routes[(method, path)] = RouteStats()
+        return stats
+
+    def register(self, name: str, kind: str, help_text: str,
+                 sample: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+        """
+        Registers a counter or gauge family kept elsewhere (e.g. by a cache);
+        `sample` returns its (labels, value) pairs and is called at scrape time.
+        For a histogram family the values are Histogram objects.
+        """
+        self._collected.append((name, kind, help_text, sample))
+
+    def render(self) -> str:
+        """The registry in the Prometheus text exposition format."""
+        ns = self.namespace
+        lines: List[str] = []
+        routes = sorted(self.routes.items())
+
+        def family(name: str, kind: str, help_text: str) -> str:
+            name = f"{ns}_{name}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            return name
+
+        name = family("http_requests_total", "counter", "HTTP requests by route and status code.")
+        for (method, path), stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'{name}{{method="{method}",route="{path}",status="{status}"}} {count}')
+        name = family("http_request_errors_total", "counter", "Requests that raised or answered with a 5xx status.")
+        for (method, path), stats in routes:
+            lines.append(f'{name}{{method="{method}",route="{path}"}} {stats.errors}')
+        name = family("http_requests_in_flight", "gauge", "Requests currently being handled.")
+        for (method, path), stats in routes:
+            lines.append(f'{name}{{method="{method}",route="{path}"}} {stats.in_flight}')
+        for metric, attribute, help_text in (
+            ("http_request_duration_seconds", "latency", "Time until the last byte of the response was sent."),
+            ("http_request_size_bytes", "request_size", "Request body sizes."),
+            ("http_response_size_bytes", "response_size", "Response body sizes."),
+        ):
+            name = family(metric, "histogram", help_text)
+            for (method, path), stats in routes:
+                _render_histogram(lines, name, f'method="{method}",route="{path}"', getattr(stats, attribute))
+
+        for family_name, kind, help_text, sample in self._collected:
+            name = family(family_name, kind, help_text)
+            for labels, value in sample():
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                if kind == "histogram":
+                    _render_histogram(lines, name, label_text, value)
+                    continue
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_histogram(lines: List[str], name: str, labels: str, histogram: Histogram) -> None:
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+# Route templates of recently seen (method, path) pairs, so the routing table is
+# only scanned once per distinct path; bounded because paths can contain ids.
+_TEMPLATE_CACHE_SIZE = 4096
+_route_templates: Dict[Tuple[str, str], str] = {}
+
+
+def _route_template(scope) -> str:
+    """The path template of the route `scope` will be routed to, so ids do not become labels."""
+    key = (scope["method"], scope["path"])
+    template = _route_templates.get(key)
+    if template is not None:
+        return template
+    template = "unmatched"
+    for route in getattr(getattr(scope.get("app"), "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            template = getattr(route, "path", scope["path"])
+            break
+    if len(_route_templates) < _TEMPLATE_CACHE_SIZE:
+        _route_templates[key] = template
+    return template
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route metrics and adding Server-Timing headers."""
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings = RequestTimings(started)
+        token = _current_timings.set(timings)
+        stats = self.registry.route(scope["method"], _route_template(scope))
+        stats.in_flight += 1
+        request_bytes = 0
+        response_bytes = 0
+        status = None
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def timing_send(message):
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = timings.server_timing(time.perf_counter()).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", header)]}
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            _current_timings.reset(token)
+            stats.in_flight -= 1
+            if status is None:
+                status = 500  # raised before a response was started
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if status >= 500:
+                stats.errors += 1
+            stats.latency.observe(time.perf_counter() - started)
+            stats.request_size.observe(request_bytes)
+            stats.response_size.observe(response_bytes)
+
+
+def _mark_handler(endpoint: Callable) -> Callable:
+    """Wraps an endpoint so the current request records when it starts and returns."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.handler_started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.handler_finished = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            # Sync endpoints run on a worker thread, which starts with a copy of the context.
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.handler_started = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                if timings is not None:
+                    timings.handler_finished = time.perf_counter()
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that marks the start and end of its endpoint for the Server-Timing phases."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _mark_handler(endpoint), **kwargs)
+
+
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,264 @@
+import asyncio
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lexicon import DATA_DIR
+
+# --- On-Demand Request Profiling ---
+# A request runs under cProfile when it carries the X-MediGuard-Profile header
+# with the token from MEDIGUARD_PROFILE_TOKEN, or when it is sampled (at
+# MEDIGUARD_PROFILE_SAMPLE_RATE, among requests to MEDIGUARD_PROFILE_PATHS).
+# Both the endpoint code on the event loop thread and the analysis work it
+# hands to the executor (in whichever thread or process runs it) are profiled,
+# and merged into one pstats file. Files go to a ring of the
+# MEDIGUARD_PROFILE_KEEP newest under MEDIGUARD_PROFILE_DIR, listed by
+# GET /profiles and downloaded from GET /profiles/{id}; the response of a
+# profiled request names its profile in X-MediGuard-Profile-Id.
+#
+# Profiles show code paths and timings, so profiling needs the token: without
+# one it is off even with a sample rate, and GET /profiles is refused. When it
+# is off the middleware is not installed at all, so requests that are not
+# profiled pay nothing beyond one context variable read per analysis job. The event loop thread runs other requests' coroutines too,
+# so its part of a profile can include their steps; the executor part is the
+# request's own.
+
+PROFILE_TOKEN = os.getenv("MEDIGUARD_PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.getenv("MEDIGUARD_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = tuple(path.strip() for path in os.getenv(
+    "MEDIGUARD_PROFILE_PATHS", "/verify-prescription,/extract-from-text").split(",") if path.strip())
+PROFILE_DIR = os.getenv("MEDIGUARD_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_KEEP = int(os.getenv("MEDIGUARD_PROFILE_KEEP", "50"))
+PROFILING_ENABLED = PROFILE_TOKEN is not None
+
+PROFILE_HEADER = "x-mediguard-profile"
+PROFILE_ID_HEADER = "x-mediguard-profile-id"
+_PROFILE_ID = re.compile(r"^[0-9a-f]{16}-[0-9a-f]{8}$")
+
+StatsDict = Dict[Tuple[str, int, str], Tuple[Any, ...]]  # the `stats` of a cProfile.Profile
+
+
+class _Collected:
+    """Lets pstats.Stats load a stats dict collected in another thread or process."""
+
+    def __init__(self, stats: StatsDict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+class RequestProfile:
+    """The profile data of one request, from every thread and process that worked on it."""
+
+    def __init__(self, method: str, path: str, reason: str):
+        # Hex nanoseconds first, so ids sort by creation time.
+        self.id = f"{time.time_ns():016x}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.reason = reason  # "header" or "sampled"
+        self.created_at = time.time()
+        self.status: Optional[int] = None
+        self.seconds: Optional[float] = None
+        self._parts: List[StatsDict] = []
+        self._lock = threading.Lock()
+
+    def add(self, stats: StatsDict) -> None:
+        if stats:
+            with self._lock:
+                self._parts.append(stats)
+
+    def stats(self) -> pstats.Stats:
+        with self._lock:
+            parts = list(self._parts)
+        return pstats.Stats(*(_Collected(part) for part in parts)) if parts else pstats.Stats()
+
+    def summary(self, stats: pstats.Stats) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "created_at": self.created_at,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "reason": self.reason,
+            "duration_ms": None if self.seconds is None else round(self.seconds * 1000, 3),
+            "profiled_ms": round(stats.total_tt * 1000, 3),
+            "calls": stats.total_calls,
+        }
+
+
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "mediguard_request_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """The profile of the current request, or None if it is not profiled."""
+    return _current_profile.get()
+
+
+def profiled_call(fn: Callable[..., Any], args: tuple, kwargs: dict) -> Tuple[Any, StatsDict]:
+    """Runs `fn(*args, **kwargs)` under cProfile in the calling thread; returns its result and the stats."""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is active (e.g. a process-wide one); run unprofiled.
+        return fn(*args, **kwargs), {}
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, profile.stats
+
+
+class ProfileStore:
+    """
+    The on-disk ring: a pstats file and a JSON summary per profile, of which
+    the `keep` newest are kept. Shared by all worker processes through the
+    directory.
+    """
+
+    def __init__(self, path: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.path = path
+        self.keep = max(1, keep)
+        self.saved: Counter = Counter()
+
+    def _file(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.path, f"{profile_id}.{extension}")
+
+    def save(self, profile: RequestProfile) -> Dict[str, Any]:
+        os.makedirs(self.path, exist_ok=True)
+        stats = profile.stats()
+        summary = profile.summary(stats)
+        # The summary is written last, so a listed profile always has its stats file.
+        for extension, write in (("prof", stats.dump_stats), ("json", lambda path: _write_json(path, summary))):
+            final = self._file(profile.id, extension)
+            write(final + ".tmp")
+            os.replace(final + ".tmp", final)
+        self.saved[profile.reason] += 1
+        self._prune()
+        return summary
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json") and _PROFILE_ID.match(name[:-5]))
+
+    def _prune(self) -> None:
+        for profile_id in self._ids()[:-self.keep]:
+            for extension in ("json", "prof"):
+                try:
+                    os.remove(self._file(profile_id, extension))
+                except FileNotFoundError:
+                    pass  # pruned by another worker process
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Summaries of the saved profiles, newest first."""
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(self._file(profile_id, "json"), encoding="utf-8") as f:
+                    summaries.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue
+        return summaries
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        """The pstats file of a profile, or None if there is no such profile."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self._file(profile_id, "prof")
+        return path if os.path.exists(path) else None
+
+    def text(self, profile_id: str, limit: int = 40) -> Optional[str]:
+        """A profile as text: the `limit` functions with the most cumulative time, and whom they call."""
+        path = self.stats_path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out).strip_dirs().sort_stats("cumulative")
+        stats.print_stats(limit)
+        stats.print_callees(limit)
+        return out.getvalue()
+
+
+def _write_json(path: str, value: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+
+def token_matches(value: Optional[str], token: Optional[str] = PROFILE_TOKEN) -> bool:
+    return token is not None and value is not None and hmac.compare_digest(value.encode(), token.encode())
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware running authorised or sampled requests under the profiler."""
+
+    def __init__(self, app, store: ProfileStore, token: Optional[str] = PROFILE_TOKEN,
+                 sample_rate: float = PROFILE_SAMPLE_RATE, paths: Tuple[str, ...] = PROFILE_PATHS):
+        self.app = app
+        self.store = store
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.paths = frozenset(paths)
+        # cProfile keeps one profile per thread, so one request at a time profiles the event loop thread.
+        self._loop_busy = False
+
+    def _reason(self, scope) -> Optional[str]:
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode() and hmac.compare_digest(value, self.token):
+                    return "header"
+        if self.sample_rate > 0 and scope["path"] in self.paths and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        reason = self._reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(scope["method"], scope["path"], reason)
+        token = _current_profile.set(profile)
+
+        async def tagging_send(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()),
+                                                  (PROFILE_ID_HEADER.encode(), profile.id.encode())]}
+            await send(message)
+
+        loop_profile = None
+        if not self._loop_busy:
+            loop_profile = cProfile.Profile()
+            try:
+                loop_profile.enable()
+                self._loop_busy = True
+            except ValueError:
+                loop_profile = None
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, tagging_send)
+        finally:
+            profile.seconds = time.perf_counter() - started
+            if loop_profile is not None:
+                loop_profile.disable()
+                self._loop_busy = False
+                loop_profile.create_stats()
+                profile.add(loop_profile.stats)
+            _current_profile.reset(token)
+            await asyncio.to_thread(self.store.save, profile)
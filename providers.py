@@ -0,0 +1,352 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from cache import ResultCache
+
+# --- Analysis Providers ---
+# The parts of a report that need a language model (alternative suggestions,
+# and questions about drugs or symptoms the reference data does not cover) are
+# asked through a provider with one method, `generate(prompt, max_output_tokens,
+# timeout)`. ModelClient adds the same behaviour in front of every provider:
+#
+#   - answers are cached per question, keyed on the normalised question text;
+#   - all questions of one analysis step go to the model in a single call, as a
+#     numbered list answered with a JSON array;
+#   - each call is held to an input and output token budget (a batch that would
+#     exceed it is split) and the whole step to a deadline;
+#   - a call still running after the recent p95 latency is hedged with a second,
+#     identical call, and whichever answers first wins;
+#   - a question the model cannot answer in time, or answers with "none", gets
+#     the deterministic local answer its caller supplied.
+#
+# "local" (the default) never calls a model, "gemini" calls Google's Gemini
+# API, and "fake" is an offline, deterministic stand-in with configurable
+# latency, for benchmarks and tests.
+
+ANALYSIS_PROVIDER = os.getenv("MEDIGUARD_ANALYSIS_PROVIDER", "local")
+GEMINI_MODEL = os.getenv("MEDIGUARD_GEMINI_MODEL", "gemini-1.5-flash")
+MODEL_TIMEOUT = float(os.getenv("MEDIGUARD_MODEL_TIMEOUT", "8"))
+MODEL_MAX_INPUT_TOKENS = int(os.getenv("MEDIGUARD_MODEL_MAX_INPUT_TOKENS", "2000"))
+MODEL_MAX_OUTPUT_TOKENS = int(os.getenv("MEDIGUARD_MODEL_MAX_OUTPUT_TOKENS", "512"))
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MEDIGUARD_MODEL_HEDGE_PERCENTILE", "95"))
+MODEL_CACHE_TTL = float(os.getenv("MEDIGUARD_MODEL_CACHE_TTL", "86400"))
+FAKE_MODEL_LATENCY = float(os.getenv("MEDIGUARD_FAKE_MODEL_LATENCY", "1.0"))
+FAKE_MODEL_SLOW_RATE = float(os.getenv("MEDIGUARD_FAKE_MODEL_SLOW_RATE", "0"))
+FAKE_MODEL_SLOW_LATENCY = float(os.getenv("MEDIGUARD_FAKE_MODEL_SLOW_LATENCY", "10"))
+
+# Latencies kept for the hedging percentile, and how many are needed before hedging starts.
+_LATENCY_WINDOW = 256
+_MIN_LATENCY_SAMPLES = 20
+# Output tokens set aside per answer when sizing a batch.
+_TOKENS_PER_ANSWER = 64
+_CALL_THREADS = 64
+
+PROMPT_HEADER = (
+    "You are a clinical pharmacology assistant inside a prescription verification tool. "
+    "Answer each numbered question briefly and factually. If you are not sure, answer \"none\". "
+    "Reply with only a JSON array of {count} strings: the answers, in question order.\n\n"
+)
+_QUESTION_LINE = re.compile(r"^(\d+)\. \[(\w+)\] (.*)$", re.MULTILINE)
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class ProviderError(Exception):
+    """Raised by a provider when a call fails."""
+
+
+class Completion(NamedTuple):
+    text: str
+    input_tokens: int
+    output_tokens: int
+
+
+class Question(NamedTuple):
+    """One thing to ask the model, with the local answer to use if it cannot answer."""
+    kind: str  # what is asked, e.g. "alternatives" or "interaction"
+    text: str
+    fallback: str
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), used for the budgets."""
+    return len(text) // 4 + 1
+
+
+def normalise_question(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def build_prompt(questions: Sequence[Question]) -> str:
+    lines = [f"{i}. [{q.kind}] {' '.join(q.text.split())}" for i, q in enumerate(questions, 1)]
+    return PROMPT_HEADER.format(count=len(questions)) + "\n".join(lines)
+
+
+def parse_answers(text: str, count: int) -> List[str]:
+    """The answers of a model reply; raises ValueError if it is not a JSON array of `count` items."""
+    answers = json.loads(_FENCE.sub("", text.strip()))
+    if not isinstance(answers, list) or len(answers) != count:
+        raise ValueError(f"expected a JSON array of {count} answers")
+    return ["none" if answer is None else str(answer).strip() for answer in answers]
+
+
+# --- Providers ---
+
+class FakeProvider:
+    """
+    Deterministic offline model. It answers every question with `answers[kind]`
+    (a function of the question text) or "none", after `latency` seconds; a
+    `slow_rate` share of calls, picked by a seeded generator, takes
+    `slow_latency` instead, to exercise hedging and fallbacks.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = FAKE_MODEL_LATENCY, slow_rate: float = FAKE_MODEL_SLOW_RATE,
+                 slow_latency: float = FAKE_MODEL_SLOW_LATENCY,
+                 answers: Optional[Dict[str, Callable[[str], str]]] = None, seed: int = 0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.answers = answers or {}
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, max_output_tokens: int, timeout: float) -> Completion:
+        with self._lock:
+            self.calls += 1
+            slow = self._random.random() < self.slow_rate
+        latency = self.slow_latency if slow else self.latency
+        if latency > timeout:
+            time.sleep(timeout)
+            raise ProviderError(f"fake model timed out after {timeout:.2f}s")
+        time.sleep(latency)
+        answers = [self.answers.get(kind, lambda _: "none")(text) for _, kind, text in _QUESTION_LINE.findall(prompt)]
+        text = json.dumps(answers)
+        output_tokens = estimate_tokens(text)
+        if output_tokens > max_output_tokens:
+            raise ProviderError("fake model ran out of output tokens")
+        return Completion(text, estimate_tokens(prompt), output_tokens)
+
+
+class GeminiProvider:
+    """Google Gemini through the google-generativeai package."""
+
+    name = "gemini"
+
+    def __init__(self, model: str = GEMINI_MODEL, api_key: Optional[str] = None):
+        try:
+            import google.generativeai as genai
+        except ImportError as e:
+            raise RuntimeError("The gemini provider needs the google-generativeai package "
+                               "(pip install google-generativeai).") from e
+        api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("The gemini provider needs GEMINI_API_KEY (or GOOGLE_API_KEY) to be set.")
+        genai.configure(api_key=api_key)
+        self.name = f"gemini:{model}"
+        self._model = genai.GenerativeModel(model)
+
+    def generate(self, prompt: str, max_output_tokens: int, timeout: float) -> Completion:
+        try:
+            response = self._model.generate_content(
+                prompt,
+                generation_config={"max_output_tokens": max_output_tokens, "temperature": 0,
+                                   "response_mime_type": "application/json"},
+                request_options={"timeout": timeout},
+            )
+            text = response.text
+        except Exception as e:
+            raise ProviderError(f"Gemini call failed: {type(e).__name__}: {e}") from e
+        usage = getattr(response, "usage_metadata", None)
+        return Completion(
+            text,
+            getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt),
+            getattr(usage, "candidates_token_count", None) or estimate_tokens(text),
+        )
+
+
+def create_provider(kind: str = ANALYSIS_PROVIDER):
+    """The provider named by MEDIGUARD_ANALYSIS_PROVIDER; None for "local"."""
+    if kind == "local":
+        return None
+    if kind == "fake":
+        return FakeProvider()
+    if kind == "gemini":
+        return GeminiProvider()
+    raise ValueError(f"Unknown analysis provider: {kind!r}")
+
+
+# --- Client ---
+
+class ModelClient:
+    """Caching, batching, budgeted and hedged access to a provider, safe to share between threads."""
+
+    def __init__(self, provider, timeout: float = MODEL_TIMEOUT, max_input_tokens: int = MODEL_MAX_INPUT_TOKENS,
+                 max_output_tokens: int = MODEL_MAX_OUTPUT_TOKENS, hedge_percentile: float = MODEL_HEDGE_PERCENTILE,
+                 cache_ttl: float = MODEL_CACHE_TTL):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.hedge_percentile = hedge_percentile
+        self.cache = ResultCache(max_bytes=16 * 1024 * 1024, ttl=cache_ttl)
+        self.stats: Counter = Counter()
+        self._latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._calls: Optional[ThreadPoolExecutor] = None
+
+    def ask(self, questions: Sequence[Question]) -> List[str]:
+        """
+        Answers `questions` in order, from the cache or with as few model calls
+        as the token budgets allow, within one deadline. Questions the model
+        cannot answer get their fallback.
+        """
+        if self.provider is None:
+            return [question.fallback for question in questions]
+        answers: List[Optional[str]] = [None] * len(questions)
+        pending: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, question in enumerate(questions):
+                key = self._key(question)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    answers[i] = cached.body.decode("utf-8")
+                    self.stats["cache_hits"] += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+            self.stats["cache_misses"] += len(pending)
+
+        if pending:
+            deadline = time.monotonic() + self.timeout
+            keys = list(pending)
+            for batch in self._batches(keys, [questions[pending[key][0]] for key in keys]):
+                replies = self._call([question for _, question in batch], deadline)
+                if replies is None:
+                    continue
+                with self._lock:
+                    for (key, _), reply in zip(batch, replies):
+                        self.cache.put(key, reply.encode("utf-8"))
+                for (key, _), reply in zip(batch, replies):
+                    for i in pending[key]:
+                        answers[i] = reply
+
+        resolved = []
+        for question, answer in zip(questions, answers):
+            if answer is None or answer.lower() in ("", "none"):
+                if answer is None:
+                    self._count("fallbacks")
+                answer = question.fallback
+            resolved.append(answer)
+        return resolved
+
+    def _key(self, question: Question) -> str:
+        text = normalise_question(question.text)
+        return f"{self.provider.name}:{question.kind}:" + (
+            text if len(text) <= 256 else hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest())
+
+    def _batches(self, keys: List[str], questions: List[Question]):
+        """Splits the questions into batches whose prompts fit the input and output budgets."""
+        per_call = max(1, self.max_output_tokens // _TOKENS_PER_ANSWER)
+        # A single question is cut down to what fits the input budget on its own.
+        room = max(1, self.max_input_tokens - estimate_tokens(PROMPT_HEADER) - 8) * 4
+        batch: List[tuple] = []
+        for key, question in zip(keys, questions):
+            if len(question.text) > room:
+                question = question._replace(text=question.text[:room])
+            if batch and (len(batch) >= per_call or
+                          estimate_tokens(build_prompt([q for _, q in batch] + [question])) > self.max_input_tokens):
+                yield batch
+                batch = []
+            batch.append((key, question))
+        if batch:
+            yield batch
+
+    def _call(self, questions: List[Question], deadline: float) -> Optional[List[str]]:
+        """One (possibly hedged) model call; None if it failed or missed the deadline."""
+        prompt = build_prompt(questions)
+        pool = self._pool()
+        futures = {pool.submit(self._generate, prompt, deadline)}
+        hedge_at = self._hedge_delay()
+        remaining = deadline - time.monotonic()
+        # No hedging when the call threads are all busy: the extra calls would only add to the queue.
+        if hedge_at is not None and hedge_at < remaining and self._in_flight < _CALL_THREADS // 2:
+            done, _ = wait(futures, timeout=hedge_at)
+            if not done:
+                self._count("hedged")
+                futures.add(pool.submit(self._generate, prompt, deadline))
+        while futures:
+            done, futures = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                self._count("timeouts")
+                return None
+            for future in done:
+                replies = self._replies(future, len(questions))
+                if replies is not None:
+                    return replies
+        return None
+
+    def _generate(self, prompt: str, deadline: float) -> Completion:
+        started = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            completion = self.provider.generate(prompt, self.max_output_tokens, max(0.01, deadline - time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        self._latencies.append(time.perf_counter() - started)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["input_tokens"] += completion.input_tokens
+            self.stats["output_tokens"] += completion.output_tokens
+        return completion
+
+    def _replies(self, future: Future, count: int) -> Optional[List[str]]:
+        try:
+            return parse_answers(future.result().text, count)
+        except ProviderError:
+            self._count("errors")
+        except ValueError:
+            self._count("bad_replies")
+        return None
+
+    def _hedge_delay(self) -> Optional[float]:
+        latencies = list(self._latencies)
+        if len(latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        return float(np.percentile(latencies, self.hedge_percentile))
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._calls is None:
+                self._calls = ThreadPoolExecutor(max_workers=_CALL_THREADS, thread_name_prefix="model-call")
+            return self._calls
+
+
+_client: Optional[ModelClient] = None
+_client_lock = threading.Lock()
+
+
+def model_client() -> ModelClient:
+    """The process's ModelClient, created on first use (so each analysis worker process has its own)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ModelClient(create_provider())
+        return _client
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from dosage import DoseCheck
+from interactions import Interaction
+
+# --- Prescription Sessions ---
+# A session holds one prescription being edited, with the results of every
+# per-drug check (its dose check, whether the reference data knows it) and
+# every drug pair that interacts. Adding a drug only checks its dose and its
+# pairs with the drugs already there; changing a dosage only re-checks that
+# dose; removing a drug only drops its results. Everything else is reused, so
+# an edit costs O(n) rather than the O(n²) of re-verifying the whole list.
+# Sessions live in the memory of the worker process that created them and are
+# dropped after SESSION_IDLE_SECONDS without use (or, past MAX_SESSIONS, least
+# recently used first). They are only used from the event loop thread.
+
+SESSION_IDLE_SECONDS = float(os.getenv("MEDIGUARD_SESSION_IDLE", "1800"))
+MAX_SESSIONS = int(os.getenv("MEDIGUARD_MAX_SESSIONS", "10000"))
+
+Pair = Tuple[str, str]  # canonical names, in sorted order
+
+
+def pair_key(a: str, b: str) -> Pair:
+    return (a, b) if a < b else (b, a)
+
+
+class SessionDrug(NamedTuple):
+    """A drug of a session with its own check results."""
+    name: str  # as entered
+    dosage: str  # as entered
+    check: DoseCheck
+    known: bool  # in the lexicon or the interaction database
+
+
+class SessionDelta(NamedTuple):
+    """Results computed for one edit, to be merged into the session."""
+    drugs: Dict[str, SessionDrug]  # canonical -> re-checked drug
+    interactions: Dict[Pair, Tuple[str, str]]  # new interacting pairs -> (severity, description)
+    reported: Dict[Pair, Interaction]  # new pairs the analysis model reported
+    pair_checks: int
+
+
+class PrescriptionSession:
+    def __init__(self, patient: Dict[str, Any], age_band: str):
+        self.id = uuid.uuid4().hex
+        self.patient = patient
+        self.age_band = age_band
+        self.drugs: Dict[str, SessionDrug] = {}
+        self.interactions: Dict[Pair, Tuple[str, str]] = {}
+        self.reported: Dict[Pair, Interaction] = {}
+        # Version of the knowledge base the results were computed with.
+        self.knowledge_base: Optional[str] = None
+        self.revision = 0
+        self.last_used = time.monotonic()
+        # Edits are applied one at a time, so two concurrent PATCHes cannot interleave.
+        self.lock = asyncio.Lock()
+
+    def reset(self) -> None:
+        """Forgets every result, e.g. after the knowledge base changed."""
+        self.drugs.clear()
+        self.interactions.clear()
+        self.reported.clear()
+
+    def remove(self, canonical: str) -> bool:
+        if self.drugs.pop(canonical, None) is None:
+            return False
+        for results in (self.interactions, self.reported):
+            for pair in [pair for pair in results if canonical in pair]:
+                del results[pair]
+        return True
+
+    def apply(self, delta: SessionDelta) -> None:
+        self.drugs.update(delta.drugs)
+        self.interactions.update(delta.interactions)
+        self.reported.update(delta.reported)
+
+    def pair_count(self) -> int:
+        n = len(self.drugs)
+        return n * (n - 1) // 2
+
+
+class SessionStore:
+    """Sessions by id, least recently used first, with idle expiry."""
+
+    def __init__(self, idle: float = SESSION_IDLE_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.idle = idle
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, PrescriptionSession]" = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+        # (kind, "computed" or "reused") -> checks, kind being "dose" or "pair".
+        self.checks: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, patient: Dict[str, Any], age_band: str) -> PrescriptionSession:
+        self.evict_idle()
+        session = PrescriptionSession(patient, age_band)
+        self._sessions[session.id] = session
+        self.created += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[PrescriptionSession]:
+        self.evict_idle()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def evict_idle(self) -> int:
+        """Drops sessions unused for `idle` seconds; the oldest are first, so this stops at the first live one."""
+        cutoff = time.monotonic() - self.idle
+        count = 0
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used > cutoff:
+                break
+            self._sessions.popitem(last=False)
+            count += 1
+        self.evicted += count
+        return count
@@ -0,0 +1,276 @@
+import asyncio
+import codecs
+import json
+from collections import deque
+from typing import IO, Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterator, Tuple
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# --- Incremental JSON Record Reader ---
+# Batch bodies can be tens of thousands of records, so they are never loaded as a
+# whole. Records are decoded one at a time from the raw byte stream; the only
+# thing held in memory is the text of the record currently being parsed.
+
+MAX_RECORD_BYTES = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class RecordError(Exception):
+    """A single record in a batch could not be decoded."""
+
+
+class StreamFormatError(Exception):
+    """The batch stream is malformed in a way that prevents reading further records."""
+
+
+async def _iter_text(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _iter_ndjson(first: str, texts: AsyncIterator[str]) -> AsyncIterator[Any]:
+    buffer = first
+    exhausted = False
+    while True:
+        newline = buffer.find("\n")
+        if newline == -1 and not exhausted:
+            if len(buffer) > MAX_RECORD_BYTES:
+                raise StreamFormatError(f"Record exceeds {MAX_RECORD_BYTES} bytes")
+            try:
+                buffer += await texts.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+            continue
+        if newline == -1:
+            line, buffer = buffer, ""
+        else:
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield RecordError(f"Invalid JSON: {e.msg} (column {e.colno})")
+        if exhausted and not buffer:
+            return
+
+
+async def _iter_array(first: str, texts: AsyncIterator[str]) -> AsyncIterator[Any]:
+    # `first` starts with the opening bracket.
+    buffer, pos = first, 1
+    exhausted = False
+    expect_value = True  # False once a value was read and a ',' or ']' is due
+    seen_value = False
+
+    async def more() -> bool:
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        try:
+            text = await texts.__anext__()
+        except StopAsyncIteration:
+            exhausted = True
+            return False
+        buffer = buffer[pos:] + text
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer):
+            if not await more():
+                raise StreamFormatError("Unexpected end of JSON array")
+            continue
+        char = buffer[pos]
+        if char == "]" and (not expect_value or not seen_value):
+            return
+        if not expect_value:
+            if char != ",":
+                raise StreamFormatError(f"Expected ',' or ']' in JSON array, found {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if len(buffer) - pos > MAX_RECORD_BYTES:
+                raise StreamFormatError(f"Record exceeds {MAX_RECORD_BYTES} bytes")
+            if await more():
+                continue
+            raise StreamFormatError(f"Invalid JSON in array: {e.msg}")
+        if end == len(buffer) and not exhausted and not isinstance(value, (dict, list, str)):
+            # A bare number at the end of the buffer may still be incomplete.
+            if await more():
+                continue
+        pos = end
+        expect_value = False
+        seen_value = True
+        yield value
+
+
+async def iter_json_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Any]:
+    """
+    Yields records from a byte stream holding either a JSON array or NDJSON.
+    Undecodable NDJSON lines are yielded as RecordError instances so the caller
+    can report them and carry on; a broken JSON array raises StreamFormatError.
+    """
+    texts = _iter_text(chunks)
+    first = ""
+    async for text in texts:
+        first += text
+        if first.strip():
+            break
+    first = first.lstrip()
+    if not first:
+        return
+    if first[0] == "[":
+        records = _iter_array(first, texts)
+    else:
+        records = _iter_ndjson(first, texts)
+    async for record in records:
+        yield record
+
+
+async def ordered_map(items: AsyncIterable[Any], worker: Callable[[Any], Awaitable[Any]],
+                      window: int) -> AsyncIterator[Tuple[Any, Any]]:
+    """
+    Runs `worker` over `items` with at most `window` calls in flight and yields
+    `(item, result)` pairs in input order. Only `window` items are buffered, so
+    memory stays flat regardless of how many items the stream holds. If `items`
+    raises, the items read before it are still answered, then the error is raised.
+    """
+    in_flight: deque = deque()
+    source = items.__aiter__()
+    failure = None
+    try:
+        while True:
+            try:
+                item = await source.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                failure = e
+                break
+            in_flight.append((item, asyncio.ensure_future(worker(item))))
+            if len(in_flight) >= window:
+                head, task = in_flight.popleft()
+                yield head, await task
+        while in_flight:
+            head, task = in_flight.popleft()
+            yield head, await task
+        if failure is not None:
+            raise failure
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse whose body generator is still reading the request body.
+    The stock response listens for client disconnects on `receive` while
+    streaming, which would steal body chunks from the generator on ASGI servers
+    older than spec 2.4, so this variant only streams.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+# --- Streaming Reader for Large JSON Files ---
+
+def iter_json_array_field(f: IO[str], field: str, chunk_size: int = 1024 * 1024) -> Iterator[Any]:
+    """
+    Yields the items of the array stored under the top-level key `field` of the
+    JSON object in text file `f` (e.g. the "results" array of an openFDA bulk
+    dump) without loading the whole file. Other top-level values are decoded
+    and skipped, so they must fit in memory; the array items are read one at a
+    time. Items up to MAX_RECORD_BYTES are supported unless a larger chunk size
+    is given.
+    """
+    buffer, pos = "", 0
+    exhausted = False
+
+    def more() -> bool:
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        text = f.read(chunk_size)
+        if not text:
+            exhausted = True
+            return False
+        buffer = buffer[pos:] + text
+        pos = 0
+        return True
+
+    def skip_whitespace() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not more():
+                raise StreamFormatError("Unexpected end of JSON document")
+
+    def decode() -> Any:
+        nonlocal pos
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if not more():
+                    raise StreamFormatError(f"Invalid JSON: {e.msg}")
+                continue
+            if end == len(buffer) and not isinstance(value, (dict, list, str)) and more():
+                continue  # a number at the end of the buffer may be incomplete
+            pos = end
+            return value
+
+    if skip_whitespace() != "{":
+        raise StreamFormatError("Expected a JSON object at the top level")
+    pos += 1
+    while True:
+        char = skip_whitespace()
+        if char == "}":
+            return
+        if char == ",":
+            pos += 1
+            continue
+        key = decode()
+        if skip_whitespace() != ":":
+            raise StreamFormatError("Expected ':' after object key")
+        pos += 1
+        if key != field or skip_whitespace() != "[":
+            skip_whitespace()
+            decode()
+            continue
+        pos += 1
+        while True:
+            char = skip_whitespace()
+            if char == "]":
+                pos += 1
+                break
+            if char == ",":
+                pos += 1
+                continue
+            yield decode()
+
+
+# --- Server-Sent Events ---
+
+def sse_event(event: str, data: Any) -> str:
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,171 @@
+import bisect
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexicon import DrugLexicon, normalize_drug_name
+
+# --- Drug Name Suggestions ---
+# Two indexes over every lexicon name, built once (or mapped from a compiled
+# knowledge base, see knowledge_base.py):
+#   * a sorted name array, where all completions of a prefix form one
+#     contiguous range found by binary search (a flattened prefix trie);
+#   * a trigram index (trigram -> array of name ids, stored as one flat
+#     postings array with offsets) for typo tolerance.
+# A fuzzy lookup counts shared trigrams for all candidates with a single
+# np.bincount, then computes the exact edit distance only for the best few.
+
+MAX_EDIT_DISTANCE = 3
+_FUZZY_CANDIDATES = 32
+
+
+def _trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def edit_distances(query: str, name: str, limit: int = MAX_EDIT_DISTANCE) -> Tuple[int, int]:
+    """
+    Damerau-Levenshtein (optimal string alignment) distances from `query` to
+    `name` and to the closest prefix of `name`, each capped at limit + 1. The
+    prefix distance lets a half-typed, misspelled name ("lisinip") match.
+    """
+    over = limit + 1
+    # Prefixes longer than the query plus `limit` can never be close enough.
+    truncated = len(name) > len(query) + limit
+    if truncated:
+        name = name[:len(query) + limit]
+    previous2: Optional[List[int]] = None
+    previous = list(range(len(name) + 1))
+    for i, char_a in enumerate(query, 1):
+        current = [i] + [0] * len(name)
+        for j, char_b in enumerate(name, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if previous2 is not None and j > 1 and char_a == name[j - 2] and query[i - 2] == char_b:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return over, over
+        previous2, previous = previous, current
+    full = over if truncated else min(previous[-1], over)
+    return full, min(min(previous), over)
+
+
+class SuggestionIndex:
+    """Prefix and typo-tolerant lookup over the names of a drug lexicon."""
+
+    def __init__(self, lexicon: DrugLexicon):
+        names = sorted(lexicon.names())
+        postings: Dict[str, List[int]] = {}
+        for name_id, name in enumerate(names):
+            for gram in set(_trigrams(name)):
+                postings.setdefault(gram, []).append(name_id)
+        offsets = np.zeros(len(postings) + 1, dtype=np.uint32)
+        np.cumsum([len(ids) for ids in postings.values()], out=offsets[1:])
+        self._init_tables(
+            lexicon, names, np.fromiter((len(name) for name in names), dtype=np.int32, count=len(names)),
+            {gram: gram_id for gram_id, gram in enumerate(postings)}, offsets,
+            np.fromiter((name_id for ids in postings.values() for name_id in ids), dtype=np.int32, count=int(offsets[-1])),
+        )
+
+    def _init_tables(self, lexicon: DrugLexicon, names: Sequence[str], lengths: np.ndarray, grams,
+                     posting_offsets, postings: np.ndarray) -> None:
+        # The ids of the names containing trigram g are postings[posting_offsets[g]:posting_offsets[g + 1]].
+        self.lexicon = lexicon
+        self._names = names
+        self._lengths = lengths
+        self._grams = grams
+        self._posting_offsets = posting_offsets
+        self._postings = postings
+
+    @classmethod
+    def from_tables(cls, lexicon: DrugLexicon, names: Sequence[str], lengths: np.ndarray, grams,
+                    posting_offsets, postings: np.ndarray) -> "SuggestionIndex":
+        """
+        An index around the tables returned by `tables` (e.g. views into a
+        mapped file); `grams` maps a trigram to its id through a `get` method.
+        """
+        index = cls.__new__(cls)
+        index._init_tables(lexicon, names, lengths, grams, posting_offsets, postings)
+        return index
+
+    def tables(self) -> Tuple[List[str], np.ndarray, List[str], np.ndarray, np.ndarray]:
+        """The sorted names, their lengths, the trigrams in id order, and the posting offsets and name ids."""
+        grams = sorted(self._grams, key=self._grams.get)
+        return list(self._names), self._lengths, grams, np.asarray(self._posting_offsets), self._postings
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _entry(self, name_id: int, match: str, distance: int) -> Dict[str, object]:
+        name = self._names[name_id]
+        return {
+            "name": self.lexicon.display(name),
+            "canonical": self.lexicon.canonical(name),
+            "match": match,
+            "distance": distance,
+        }
+
+    def _prefix_ids(self, prefix: str, limit: int) -> List[int]:
+        start = bisect.bisect_left(self._names, prefix)
+        ids = []
+        for name_id in range(start, min(start + limit, len(self._names))):
+            if not self._names[name_id].startswith(prefix):
+                break
+            ids.append(name_id)
+        return ids
+
+    def _fuzzy_ids(self, query: str, max_distance: int) -> List[Tuple[int, int, int, int]]:
+        query_grams = set(_trigrams(query))
+        offsets = self._posting_offsets
+        gram_ids = [gram_id for gram_id in map(self._grams.get, query_grams) if gram_id is not None]
+        grams = [self._postings[offsets[gram_id]:offsets[gram_id + 1]] for gram_id in gram_ids]
+        if not grams:
+            return []
+        counts = np.bincount(np.concatenate(grams), minlength=len(self._names))
+        # q-gram lemma: each edit destroys at most three trigrams of the query,
+        # plus one for the trailing padded trigram when only a prefix matches.
+        threshold = max(1, len(query_grams) - 3 * max_distance - 1)
+        candidates = np.flatnonzero(counts >= threshold)
+        # Names this much shorter than the query can never be within max_distance.
+        candidates = candidates[self._lengths[candidates] >= len(query) - max_distance]
+        if len(candidates) > _FUZZY_CANDIDATES:
+            # Counts are small integers with many ties, so the best candidates are
+            # picked with a histogram cut-off rather than a (tie-heavy) partition.
+            shared = counts[candidates]
+            at_least = np.cumsum(np.bincount(shared)[::-1])[::-1]
+            cutoff = int(np.flatnonzero(at_least >= _FUZZY_CANDIDATES)[-1])
+            above = candidates[shared > cutoff]
+            tied = candidates[shared == cutoff][:_FUZZY_CANDIDATES - len(above)]
+            candidates = np.concatenate([above, tied])
+        scored = []
+        for name_id in candidates.tolist():
+            full, prefix = edit_distances(query, self._names[name_id], max_distance)
+            if prefix <= max_distance:
+                scored.append((prefix, full, -int(counts[name_id]), name_id))
+        scored.sort()
+        return scored
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, object]]:
+        """
+        Ranked suggestions for a partially typed or misspelled drug name:
+        prefix completions first (shortest first), then names within a small
+        edit distance, closest first.
+        """
+        query = normalize_drug_name(query)
+        if not query:
+            return []
+        results = []
+        seen = set()
+        for name_id in sorted(self._prefix_ids(query, limit * 4), key=lambda i: len(self._names[i]))[:limit]:
+            seen.add(name_id)
+            results.append(self._entry(name_id, "prefix", 0))
+        if len(results) < limit and len(query) >= 3:
+            # Allow roughly one typo per four characters.
+            max_distance = min(MAX_EDIT_DISTANCE, max(1, len(query) // 4))
+            for distance, _, _, name_id in self._fuzzy_ids(query, max_distance):
+                if name_id in seen:
+                    continue
+                results.append(self._entry(name_id, "fuzzy", distance))
+                if len(results) >= limit:
+                    break
+        return results
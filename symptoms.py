@@ -0,0 +1,202 @@
+import csv
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexicon import DATA_DIR
+
+# --- Symptom-Condition Scoring ---
+# Conditions and symptoms form a dense weight matrix (one row per condition,
+# one column per symptom), loaded once from data files. A symptom set becomes a
+# 0/1 vector over the columns, so scoring every condition is a single
+# matrix-vector product; scoring many sets at once is a single matrix product.
+# Rows are L2-normalised, so a score is the cosine similarity between the
+# reported symptoms and a condition's symptom profile.
+
+SYMPTOM_WEIGHTS_PATH = os.getenv("MEDIGUARD_SYMPTOM_WEIGHTS_PATH", os.path.join(DATA_DIR, "symptom_weights.csv"))
+SYMPTOM_SYNONYMS_PATH = os.getenv("MEDIGUARD_SYMPTOM_SYNONYMS_PATH", os.path.join(DATA_DIR, "symptom_synonyms.csv"))
+CONDITIONS_PATH = os.getenv("MEDIGUARD_CONDITIONS_PATH", os.path.join(DATA_DIR, "conditions.csv"))
+
+URGENCY_LEVELS = ("routine", "urgent", "emergency")
+# Matches scoring below this are too weak to be worth reporting.
+MIN_SCORE = 0.3
+
+_NON_WORD_CHARS = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_symptom(symptom: str) -> str:
+    """Lower-cases a symptom and collapses punctuation and whitespace."""
+    return _NON_WORD_CHARS.sub(" ", symptom.lower()).strip()
+
+
+class Condition(NamedTuple):
+    name: str
+    urgency: str
+    description: str
+    recommendations: Tuple[str, ...]
+
+
+class ConditionMatch(NamedTuple):
+    """A scored condition, with the reported symptoms that support it."""
+    condition: Condition
+    score: float
+    matched: Tuple[str, ...]
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "condition": self.condition.name,
+            "urgency": self.condition.urgency,
+            "score": round(self.score, 4),
+            "matched_symptoms": list(self.matched),
+        }
+
+
+class SymptomScorer:
+    """Ranks conditions for symptom sets with a condition x symptom weight matrix."""
+
+    def __init__(self, conditions: Sequence[Condition], weights: Iterable[Tuple[str, str, float]],
+                 synonyms: Optional[Dict[str, str]] = None):
+        self.conditions = list(conditions)
+        rows = {condition.name: row for row, condition in enumerate(self.conditions)}
+        self._symptoms: List[str] = []
+        self._columns: Dict[str, int] = {}
+        entries = []
+        for condition, symptom, weight in weights:
+            if condition not in rows:
+                raise ValueError(f"Symptom weight for unknown condition: {condition!r}")
+            symptom = normalize_symptom(symptom)
+            column = self._columns.setdefault(symptom, len(self._columns))
+            if column == len(self._symptoms):
+                self._symptoms.append(symptom)
+            entries.append((rows[condition], column, float(weight)))
+        for synonym, symptom in (synonyms or {}).items():
+            column = self._columns.get(normalize_symptom(symptom))
+            if column is None:
+                raise ValueError(f"Synonym {synonym!r} refers to unknown symptom {symptom!r}")
+            self._columns.setdefault(normalize_symptom(synonym), column)
+
+        matrix = np.zeros((len(self.conditions), len(self._symptoms)), dtype=np.float32)
+        if entries:
+            row_ids, column_ids, values = zip(*entries)
+            matrix[list(row_ids), list(column_ids)] = values
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self._weights = matrix / norms
+
+    @classmethod
+    def from_tables(cls, conditions: Sequence[Condition], symptoms: Sequence[str], columns,
+                    weights: np.ndarray) -> "SymptomScorer":
+        """
+        Builds a scorer around precomputed tables (see `tables`): `columns` maps
+        every normalised symptom and synonym to its column through a `get`
+        method, and `weights` is the row-normalised weight matrix.
+        """
+        scorer = cls.__new__(cls)
+        scorer.conditions = list(conditions)
+        scorer._symptoms = symptoms
+        scorer._columns = columns
+        scorer._weights = weights
+        return scorer
+
+    def tables(self) -> Tuple[List[str], Dict[str, int], np.ndarray]:
+        """The vocabulary, the symptom/synonym -> column map and the row-normalised weight matrix."""
+        return list(self._symptoms), dict(self._columns), self._weights
+
+    def __len__(self) -> int:
+        return len(self.conditions)
+
+    def vocabulary(self) -> List[str]:
+        """The symptoms the scorer knows about (synonyms excluded)."""
+        return list(self._symptoms)
+
+    def canonical(self, symptom: str) -> str:
+        """Maps a symptom or one of its synonyms to its vocabulary name."""
+        symptom = normalize_symptom(symptom)
+        column = self._columns.get(symptom)
+        return symptom if column is None else self._symptoms[column]
+
+    def resolve(self, symptoms: Iterable[str]) -> Tuple[List[int], List[str]]:
+        """Returns the (de-duplicated) column ids of `symptoms` and the symptoms not recognised."""
+        columns: List[int] = []
+        unknown: List[str] = []
+        for symptom in symptoms:
+            column = self._columns.get(normalize_symptom(symptom))
+            if column is None:
+                unknown.append(symptom)
+            elif column not in columns:
+                columns.append(column)
+        return columns, unknown
+
+    def _matches(self, scores: np.ndarray, top: np.ndarray, columns: List[int]) -> List[ConditionMatch]:
+        matches = []
+        for row in top.tolist():
+            if scores[row] <= 0:
+                break
+            matched = tuple(self._symptoms[c] for c in columns if self._weights[row, c] > 0)
+            matches.append(ConditionMatch(self.conditions[row], float(scores[row]), matched))
+        return matches
+
+    def score(self, symptoms: Iterable[str], k: int = 3) -> Tuple[List[ConditionMatch], List[str]]:
+        """
+        Returns the `k` best-matching conditions for one symptom set, best first,
+        and the symptoms that were not recognised.
+        """
+        columns, unknown = self.resolve(symptoms)
+        if not columns:
+            return [], unknown
+        vector = np.zeros(len(self._symptoms), dtype=np.float32)
+        vector[columns] = 1 / np.sqrt(len(columns))
+        scores = self._weights @ vector
+        return self._matches(scores, _top_k(scores[np.newaxis, :], k)[0], columns), unknown
+
+    def score_batch(self, symptom_sets: Sequence[Iterable[str]],
+                    k: int = 3) -> List[Tuple[List[ConditionMatch], List[str]]]:
+        """Scores many symptom sets with one matrix product; same results as `score` for each set."""
+        resolved = [self.resolve(symptoms) for symptoms in symptom_sets]
+        vectors = np.zeros((len(resolved), len(self._symptoms)), dtype=np.float32)
+        for i, (columns, _) in enumerate(resolved):
+            if columns:
+                vectors[i, columns] = 1 / np.sqrt(len(columns))
+        scores = vectors @ self._weights.T
+        top = _top_k(scores, k)
+        return [(self._matches(scores[i], top[i], columns) if columns else [], unknown)
+                for i, (columns, unknown) in enumerate(resolved)]
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column ids of the `k` highest scores of each row, best first."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        # Partition first, so only the k winners of each row are sorted.
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def load_symptom_scorer(weights_path: str = SYMPTOM_WEIGHTS_PATH, synonyms_path: str = SYMPTOM_SYNONYMS_PATH,
+                        conditions_path: str = CONDITIONS_PATH) -> SymptomScorer:
+    """
+    Loads the scorer from three CSV files: conditions (condition, urgency,
+    description, recommendations separated by "|"), weights (condition,
+    symptom, weight) and synonyms (synonym, symptom).
+    """
+    conditions = []
+    with open(conditions_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            urgency = row["urgency"].strip().lower()
+            if urgency not in URGENCY_LEVELS:
+                raise ValueError(f"Unknown urgency for {row['condition']!r}: {urgency!r}")
+            recommendations = tuple(r.strip() for r in (row.get("recommendations") or "").split("|") if r.strip())
+            conditions.append(Condition(row["condition"].strip(), urgency, row["description"].strip(),
+                                        recommendations))
+    with open(weights_path, newline="", encoding="utf-8") as f:
+        weights = [(row["condition"].strip(), row["symptom"], float(row["weight"])) for row in csv.DictReader(f)]
+    synonyms = {}
+    if os.path.exists(synonyms_path):
+        with open(synonyms_path, newline="", encoding="utf-8") as f:
+            synonyms = {row["synonym"]: row["symptom"] for row in csv.DictReader(f)}
+    return SymptomScorer(conditions, weights, synonyms)
@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+# Read when the backend module is imported, so they are set first.
+_scratch = tempfile.mkdtemp(prefix="mediguard-test-")
+os.environ.setdefault("MEDIGUARD_HISTORY_DB", os.path.join(_scratch, "history.db"))
+os.environ.setdefault("MEDIGUARD_JOBS_DB", os.path.join(_scratch, "jobs.db"))
+os.environ.setdefault("MEDIGUARD_KNOWLEDGE_BASE_RELOAD", "0")
+os.environ.setdefault("MEDIGUARD_ANALYSIS_PROVIDER", "local")
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client():
+    import main
+    return TestClient(main.app)
@@ -0,0 +1,52 @@
+import asyncio
+
+from admission import Admission, AdmissionMiddleware
+
+
+def scope(path, headers=()):
+    return {"type": "http", "path": path, "client": ("10.0.0.1", 1234),
+            "headers": [(name.encode(), value.encode()) for name, value in headers]}
+
+
+def test_anonymous_client_cannot_pick_its_lane():
+    admission = Admission(rate_limits={}, api_keys={})
+    lane_header = [("x-mediguard-lane", "interactive")]
+    assert admission.classify(scope("/verify-prescription/batch", lane_header)) == ("10.0.0.1", "bulk")
+    assert admission.classify(scope("/verify-prescription", [("x-mediguard-lane", "fast")])) == ("10.0.0.1", "interactive")
+
+
+def test_keyed_client_may_step_down_to_bulk():
+    admission = Admission(rate_limits={}, api_keys={"secret": ("audit", "interactive")})
+    key = [("x-api-key", "secret")]
+    assert admission.classify(scope("/verify-prescription", key)) == ("audit", "interactive")
+    assert admission.classify(scope("/verify-prescription", key + [("x-mediguard-lane", "bulk")])) == ("audit", "bulk")
+
+
+def test_analysis_refused_while_warming_up():
+    warming = True
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            sent.append((message["status"], dict(message["headers"]).get(b"retry-after")))
+
+    middleware = AdmissionMiddleware(app, Admission(rate_limits={}, api_keys={}), warming=lambda: warming)
+    for path in ("/verify-prescription", "/ready"):
+        asyncio.run(middleware(dict(scope(path), method="POST"), None, send))
+    warming = False
+    asyncio.run(middleware(dict(scope("/verify-prescription"), method="POST"), None, send))
+    assert sent == [(503, b"1"), (200, None), (200, None)]
+
+
+def test_jobs_run_in_the_submitters_lane_and_polls_are_not_admitted():
+    admission = Admission(rate_limits={}, api_keys={"secret": ("audit", "bulk")})
+    middleware = AdmissionMiddleware(None, admission)
+    assert admission.classify(scope("/jobs")) == ("10.0.0.1", "interactive")
+    assert admission.classify(scope("/jobs", [("x-api-key", "secret")])) == ("audit", "bulk")
+    assert middleware.admits(dict(scope("/jobs"), method="POST"))
+    assert not middleware.admits(dict(scope("/jobs/abc"), method="GET"))
+    assert middleware.admits(dict(scope("/sessions/abc"), method="GET"))
@@ -0,0 +1,39 @@
+import pytest
+
+from dosage import Dose, parse_dosage
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("500 mg BID", Dose(500.0, "mg", 2.0, False)),
+    ("0.5g", Dose(500.0, "mg", None, False)),
+    ("10 mL q8h", Dose(10.0, "mL", 3.0, False)),
+    ("2 tabs of 250mcg", Dose(0.5, "mg", None, False)),
+    ("10 mL of 250mg/5mL q6h", Dose(500.0, "mg", 4.0, False)),
+])
+def test_parse_absolute_doses(text, expected):
+    assert parse_dosage(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("15 mg/kg q6h", Dose(15.0, "mg", 4.0, False, "kg")),
+    ("15mg/kg every 6 hours as needed", Dose(15.0, "mg", 4.0, True, "kg")),
+    ("10 mcg / kg daily", Dose(0.01, "mg", 1.0, False, "kg")),
+    ("375 mg/m2 weekly", Dose(375.0, "mg", 1 / 7, False, "m2")),
+    ("375 mg/m² once", Dose(375.0, "mg", 1.0, False, "m2")),
+    ("30 mg/kg/day divided q8h", Dose(10.0, "mg", 3.0, False, "kg")),
+    ("30 mg/kg/day", Dose(30.0, "mg", 1.0, False, "kg")),
+])
+def test_parse_per_weight_doses(text, expected):
+    assert parse_dosage(text) == pytest.approx(expected)
+
+
+def test_per_weight_dose_is_not_range_checked(client):
+    response = client.post("/verify-prescription", json={
+        "patient": {"name": "Infant", "age": 1, "gender": "F", "blood_group": "A+"},
+        "drugs": [{"name": "Acetaminophen", "dosage": "15 mg/kg q6h"}],
+    })
+    assert response.status_code == 200
+    report = response.json()
+    assert [check["status"] for check in report["dosage_checks"]] == ["per_weight"]
+    assert "below the usual minimum" not in report["dosage_recommendations"]
+    assert "15 mg/kg" in report["dosage_recommendations"]
@@ -0,0 +1,20 @@
+PRESCRIPTION = {
+    "patient": {"name": "History Patient", "age": 52, "gender": "M", "blood_group": "O+"},
+    "drugs": [{"name": "Metformin", "dosage": "500 mg BID"}],
+}
+
+
+def history_total(client):
+    return len(client.get("/history", params={"patient": "History Patient", "limit": 100}).json()["entries"])
+
+
+def test_revalidation_is_not_recorded(client):
+    first = client.post("/verify-prescription", json=PRESCRIPTION)
+    assert first.status_code == 200
+    assert history_total(client) == 1
+    revalidated = client.post("/verify-prescription", json=PRESCRIPTION,
+                              headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert history_total(client) == 1
+    assert client.post("/verify-prescription", json=PRESCRIPTION).status_code == 200
+    assert history_total(client) == 2
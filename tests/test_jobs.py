@@ -0,0 +1,24 @@
+from jobs import JobQueue
+
+
+def test_claims_follow_the_lane_weights(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), weights={"interactive": 8.0, "bulk": 1.0})
+    for i in range(4):
+        queue.enqueue("symptoms", {"i": i}, "bulk")
+    for i in range(16):
+        queue.enqueue("symptoms", {"i": i}, "interactive")
+    lanes = [queue.get(queue.claim()["id"])["lane"] for _ in range(18)]
+    # The bulk backlog was queued first, yet it gets one claim in nine.
+    assert lanes[:9].count("bulk") == 1 and lanes[9:].count("bulk") == 1
+
+
+def test_busy_lane_does_not_push_back_an_idle_one(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), weights={"interactive": 8.0, "bulk": 1.0})
+    for i in range(3):
+        queue.enqueue("symptoms", {"i": i}, "bulk")
+    for _ in range(3):
+        queue.claim()
+    # Bulk used the workers while interactive was idle; interactive's next job still goes first.
+    queue.enqueue("symptoms", {}, "bulk")
+    first = queue.enqueue("symptoms", {}, "interactive")
+    assert queue.claim()["id"] == first
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from label_proxy import LabelDiskCache, LabelProxy, UpstreamUnavailable, make_entry
+
+LABEL = {"set_id": "abc-123", "effective_time": "20240101", "openfda": {"brand_name": ["Bayer"], "generic_name": ["ASPIRIN"]},
+         "indications_and_usage": ["Pain relief."]}
+
+
+class StandIn:
+    """A stand-in for openFDA: answers with `status` after `delay` seconds and counts the requests."""
+
+    def __init__(self, status=200, delay=0.0, results=(LABEL,)):
+        self.status = status
+        self.delay = delay
+        self.results = list(results)
+        self.requests = []
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return httpx.Response(self.status, json={"error": {"code": "ERROR"}})
+        return httpx.Response(200, json={"results": self.results})
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return LabelDiskCache(str(tmp_path / "labels.db"))
+
+
+def make_proxy(disk, upstream, **settings):
+    settings.setdefault("rate", 100)
+    return LabelProxy("http://openfda.test/drug/label.json", disk=disk, transport=httpx.MockTransport(upstream),
+                      **settings)
+
+
+def expired(disk, key, age=100.0):
+    entry = make_entry(200, {"query": key, "label": {"set_id": "old"}}, fetched_at=time.time() - age)
+    disk.put(key, entry)
+    return entry
+
+
+def test_concurrent_lookups_share_one_request(disk):
+    upstream = StandIn(delay=0.05)
+
+    async def run():
+        proxy = make_proxy(disk, upstream)
+        results = await asyncio.gather(*(proxy.get("Aspirin") for _ in range(10)))
+        await proxy.aclose()
+        return proxy, results
+
+    proxy, results = asyncio.run(run())
+    assert len(upstream.requests) == 1
+    assert proxy.coalesced == 9
+    assert {result.source for result in results} == {"upstream"}
+    assert json.loads(results[0].entry.body)["label"]["set_id"] == "abc-123"
+
+
+def test_answers_come_from_memory_then_disk(disk):
+    upstream = StandIn()
+
+    async def run():
+        first = make_proxy(disk, upstream)
+        sources = [(await first.get("aspirin")).source, (await first.get("ASPIRIN")).source]
+        second = make_proxy(disk, upstream)
+        sources.append((await second.get("aspirin")).source)
+        return sources
+
+    assert asyncio.run(run()) == ["upstream", "memory", "disk"]
+    assert len(upstream.requests) == 1
+
+
+def test_expired_entry_is_revalidated(disk):
+    expired(disk, "aspirin")
+    upstream = StandIn()
+    result = asyncio.run(make_proxy(disk, upstream, ttl=10).get("aspirin"))
+    assert result.source == "upstream"
+    assert json.loads(result.entry.body)["label"]["set_id"] == "abc-123"
+    assert disk.get("aspirin").body == result.entry.body
+
+
+@pytest.mark.parametrize("upstream", [StandIn(status=503), StandIn(delay=1.0)], ids=["5xx", "timeout"])
+def test_stale_entry_is_served_when_upstream_fails(disk, upstream):
+    stale = expired(disk, "aspirin")
+    proxy = make_proxy(disk, upstream, ttl=10, max_stale=1000, timeout=0.05)
+    result = asyncio.run(proxy.get("aspirin"))
+    assert (result.source, result.entry.body) == ("stale", stale.body)
+    assert proxy.upstream["error"] == 1
+
+
+def test_failure_without_a_usable_entry_raises(disk):
+    expired(disk, "aspirin", age=5000)
+    proxy = make_proxy(disk, StandIn(status=502), ttl=10, max_stale=1000)
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(proxy.get("aspirin"))
+
+
+@pytest.mark.parametrize("upstream", [StandIn(status=404), StandIn(results=())], ids=["404", "no-results"])
+def test_not_found_is_cached(disk, upstream):
+    async def run():
+        proxy = make_proxy(disk, upstream)
+        return [await proxy.get("nosuchdrug"), await proxy.get("nosuchdrug")]
+
+    first, second = asyncio.run(run())
+    assert first.entry.status == second.entry.status == 404
+    assert (first.source, second.source) == ("upstream", "memory")
+    assert len(upstream.requests) == 1
+
+
+def test_rate_limit_serves_stale_instead_of_waiting(disk):
+    stale = expired(disk, "ibuprofen")
+    upstream = StandIn()
+
+    async def run():
+        proxy = make_proxy(disk, upstream, rate=0.5, ttl=10, max_stale=1000)
+        await proxy.get("aspirin")  # uses up the only token
+        return await proxy.get("ibuprofen")
+
+    result = asyncio.run(run())
+    assert (result.source, result.entry.body) == ("stale", stale.body)
+    assert len(upstream.requests) == 1
@@ -0,0 +1,71 @@
+import asyncio
+from collections import Counter
+
+import httpx
+
+import main
+
+PATIENT = {"name": "Test Patient", "age": 70, "gender": "F", "blood_group": "A+"}
+
+
+def create_session(client, drugs):
+    response = client.post("/sessions", json={"patient": PATIENT, "drugs": drugs})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_edit_only_checks_what_changed(client):
+    session = create_session(client, [{"name": "Warfarin", "dosage": "5 mg daily"},
+                                      {"name": "Aspirin", "dosage": "81 mg daily"}])
+    response = client.patch(f"/sessions/{session['id']}/drugs",
+                            json={"upsert": [{"name": "Ibuprofen", "dosage": "400 mg"}]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [drug["name"] for drug in body["drugs"]] == ["Aspirin", "Ibuprofen", "Warfarin"]
+    assert body["computed"] == {"dose_checks": 1, "pair_checks": 2}
+
+
+def test_remove_after_knowledge_base_reload(client):
+    session = create_session(client, [{"name": "Warfarin", "dosage": "5 mg daily"},
+                                      {"name": "aspirin", "dosage": "81 mg daily"}])
+    # As if the knowledge base had been reloaded since the last edit.
+    main.session_store.get(session["id"]).knowledge_base = "older-version"
+    response = client.patch(f"/sessions/{session['id']}/drugs", json={"remove": ["aspirin"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [drug["name"] for drug in body["drugs"]] == ["Warfarin"]
+    assert body["computed"]["dose_checks"] == 1
+    assert body["result"]["interactions"] == []
+
+
+async def run_session_job(client, session, drugs):
+    response = await client.post("/jobs", json={"kind": "session",
+                                                "payload": {"session": session, "patient": PATIENT, "drugs": drugs}})
+    assert response.status_code == 202
+    job = response.json()
+    while True:
+        result = (await client.get(f"/jobs/{job['id']}", params={"wait": 5})).json()
+        if result["status"] in ("done", "failed"):
+            return job["session"], result
+
+
+def test_session_jobs_only_check_what_changed():
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            drugs = [{"name": "Warfarin", "dosage": "5 mg daily"}, {"name": "Aspirin", "dosage": "81 mg daily"}]
+            session, first = await run_session_job(client, None, drugs)
+            assert first["status"] == "done" and first["payload"]["session"] == session
+            assert "Warfarin" in first["result"]["interaction_analysis"]
+            checks = main.session_store.checks.copy()
+            # Aspirin is dropped and Ibuprofen added: one dose check and one pair check.
+            edited = drugs[:1] + [{"name": "Ibuprofen", "dosage": "400 mg"}]
+            same, second = await run_session_job(client, session, edited)
+            assert same == session and second["status"] == "done"
+            assert main.session_store.checks - checks == Counter({("dose", "computed"): 1, ("dose", "reused"): 1,
+                                                                  ("pair", "computed"): 1})
+            assert [drug["name"] for drug in second["payload"]["drugs"]] == ["Warfarin", "Ibuprofen"]
+            assert main.session_store.get(session).drugs.keys() == {main.canonical_drug("Warfarin"),
+                                                                    main.canonical_drug("Ibuprofen")}
+
+    asyncio.run(scenario())
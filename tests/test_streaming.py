@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+import pytest
+
+from streaming import StreamFormatError, iter_json_records, ordered_map
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part.encode("utf-8")
+
+
+async def slow_double(record):
+    await asyncio.sleep(0.01 * (3 - record["n"]))
+    return record["n"] * 2
+
+
+async def collect(body, window):
+    results = []
+    try:
+        async for record, result in ordered_map(iter_json_records(chunks(body)), slow_double, window):
+            results.append((record["n"], result))
+    except StreamFormatError as e:
+        results.append(("error", str(e)))
+    return results
+
+
+def test_ordered_map_keeps_input_order():
+    body = "\n".join(json.dumps({"n": n}) for n in range(3))
+    assert asyncio.run(collect(body, window=3)) == [(0, 0), (1, 2), (2, 4)]
+
+
+@pytest.mark.parametrize("window", [1, 2, 8])
+def test_records_before_a_malformed_array_are_answered(window):
+    results = asyncio.run(collect('[{"n": 0}, {"n": 1}, {"n": 2} {"n": 3}]', window))
+    assert results[:3] == [(0, 0), (1, 2), (2, 4)]
+    assert results[3][0] == "error"
+    assert len(results) == 4
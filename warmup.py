@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# --- Startup Warm-Up & Readiness ---
+# The lifespan handler runs the warm-up steps of this worker process in order:
+# loading and faulting in the reference data, opening every store, starting
+# the analysis pool and running each analysis path once on synthetic input.
+# GET /ready answers 200 only once every required step has finished, so a load
+# balancer (or the frontend) only sends traffic to a warm worker; GET /live
+# just says the process is up. Each worker process warms up on its own.
+#
+# MEDIGUARD_WARMUP chooses when: "background" (default) warms up while the
+# server already answers /live and /ready (the analysis endpoints answer 503
+# until the warm-up has finished, see AdmissionMiddleware), "blocking" finishes
+# warming up before the server accepts connections, and "off" skips it.
+
+logger = logging.getLogger("mediguard.warmup")
+
+WARMUP_MODE = os.getenv("MEDIGUARD_WARMUP", "background")
+if WARMUP_MODE not in ("background", "blocking", "off"):
+    raise ValueError(f"Unknown MEDIGUARD_WARMUP mode: {WARMUP_MODE!r}")
+
+COMPONENT_STATES = ("pending", "loading", "ready", "skipped", "failed")
+
+Step = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class Component:
+    """One warm-up step and how it went."""
+
+    def __init__(self, name: str, step: Step, required: bool):
+        self.name = name
+        self.step = step
+        # An optional component (e.g. the label mirror, which may not be installed)
+        # is reported but never holds readiness back.
+        self.required = required
+        self.state = "pending"
+        self.seconds: Optional[float] = None
+        self.detail: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"state": self.state, "required": self.required}
+        if self.seconds is not None:
+            entry["seconds"] = round(self.seconds, 4)
+        if self.detail:
+            entry["detail"] = self.detail
+        if self.error:
+            entry["error"] = self.error
+        return entry
+
+
+class Readiness:
+    """The warm-up steps of this worker process, run in the order they were added."""
+
+    def __init__(self, mode: str = WARMUP_MODE):
+        self.mode = mode
+        self.components: "OrderedDict[str, Component]" = OrderedDict()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add(self, name: str, step: Step, required: bool = True) -> None:
+        self.components[name] = Component(name, step, required)
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None and all(
+            component.state in ("ready", "skipped") or not component.required
+            for component in self.components.values()
+        )
+
+    @property
+    def warming(self) -> bool:
+        """Whether the warm-up has been started and has not finished yet."""
+        return self.started_at is not None and self.finished_at is None
+
+    async def run(self) -> bool:
+        """Runs every step; a failed step is recorded and the others still run. Returns whether the worker is ready."""
+        self.started_at = time.monotonic()
+        for component in self.components.values():
+            if self.mode == "off":
+                component.state = "skipped"
+                continue
+            component.state = "loading"
+            started = time.perf_counter()
+            try:
+                component.detail = await component.step()
+                component.state = "ready"
+            except Exception as e:
+                component.state = "failed"
+                component.error = f"{type(e).__name__}: {e}"
+                if component.required:
+                    logger.exception("Warm-up step %s failed", component.name)
+            component.seconds = time.perf_counter() - started
+        self.finished_at = time.monotonic()
+        if self.mode != "off":
+            logger.info("Warm-up finished in %.2fs (%s)", self.finished_at - self.started_at,
+                        "ready" if self.ready else "not ready")
+        return self.ready
+
+    def start(self) -> "asyncio.Task[bool]":
+        # Marked as started now, not when the task first runs, so no request slips in before it.
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        return asyncio.ensure_future(self.run())
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 4)
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "seconds": elapsed,
+            "components": {name: component.as_dict() for name, component in self.components.items()},
+        }